@@ -1,80 +1,248 @@
-from collections import Counter, defaultdict
+import os
+import uuid
+from typing import Optional
+import numpy as np
+from config import INFLUENCE_BOOTSTRAP_SAMPLES
+from analysis.influence_stats import bootstrap_concentration, gini, hhi, lorenz_curve
 
+CONSENSUS_LEVELS = ("YES", "PARTIAL")
+TOP_PROFILES = 20
+TOP_NS = (1, 3, 5, 10)
 
-def analyze_agent_influence(results: list[dict]) -> dict:
+
+class _Interner:
+    """Map strings to dense ids in first-seen order."""
+
+    def __init__(self, names: Optional[list[str]] = None):
+        self.names: list[str] = []
+        self.ids: dict[str, int] = {}
+        for name in names or []:
+            self.id(name)
+
+    def id(self, name: str) -> int:
+        i = self.ids.get(name)
+        if i is None:
+            i = self.ids[name] = len(self.names)
+            self.names.append(name)
+        return i
+
+
+class InfluenceAggregator:
+    """Incremental Pass 3 aggregation over per-post consensus drivers.
+
+    Only posts with YES or PARTIAL consensus are kept, each as its title
+    and two small int32 arrays of interned agent and role ids, keyed by
+    post id. Adding a post that is already present replaces it, so a
+    re-analyzed post never counts twice. Agent frequencies are an
+    ``np.bincount`` over every post's ids, recomputed only after a change,
+    and role histograms are only built for the profiled top agents.
+
+    Posts resolved by local triage carry a lexicon verdict but no driver
+    data, so they are only counted, separately from the analyzed posts,
+    and never dilute the per-post statistics.
+
+    Aggregators built on different workers or on successive runs combine
+    with ``merge`` (posts in ``other`` win) and persist with ``save`` and
+    ``load``, so the raw results never need to be reprocessed.
+    """
+
+    def __init__(self):
+        self.agents = _Interner()
+        self.roles = _Interner()
+        self._posts: dict[str, tuple[str, np.ndarray, np.ndarray]] = {}
+        self._triaged: set[str] = set()
+        self._tallies = None
+
+    def __len__(self) -> int:
+        return len(self._posts)
+
+    def __contains__(self, post_id) -> bool:
+        return str(post_id) in self._posts or str(post_id) in self._triaged
+
+    def _put(self, post_id: str, title: str, agents: np.ndarray, roles: np.ndarray):
+        self._triaged.discard(post_id)
+        self._posts.pop(post_id, None)
+        self._posts[post_id] = (title, agents, roles)
+        self._tallies = None
+
+    def add(self, result: dict, post_id=None):
+        """Add one post's Pass 1 result, replacing any earlier result for it.
+
+        The post is keyed by ``post_id``, else the result's own "post_id".
+        A result with neither is always added as a new post: titles repeat
+        across posts, so they are never used as keys.
+        """
+        if post_id is None:
+            post_id = result.get("post_id")
+        post_id = str(post_id) if post_id is not None else f"#{uuid.uuid4().hex}"
+        if result.get("consensus", "") not in CONSENSUS_LEVELS:
+            self.remove(post_id)
+            return
+        if "triage" in result:
+            self._set_triaged(post_id)
+            return
+        drivers = result.get("consensus_drivers", [])
+        agents = np.array([self.agents.id(d.get("agent", "unknown")) for d in drivers], dtype=np.int32)
+        roles = np.array([self.roles.id(d.get("role", "unknown")) for d in drivers], dtype=np.int32)
+        self._put(post_id, result.get("post_title", "?"), agents, roles)
+
+    def _set_triaged(self, post_id: str):
+        self.remove(post_id)
+        self._triaged.add(post_id)
+
+    def remove(self, post_id):
+        """Drop a post's contribution; unknown posts are ignored."""
+        self._triaged.discard(str(post_id))
+        if self._posts.pop(str(post_id), None) is not None:
+            self._tallies = None
+
+    def merge(self, other: "InfluenceAggregator") -> "InfluenceAggregator":
+        """Fold ``other`` into this aggregator, its posts replacing ours."""
+        agent_map = np.array([self.agents.id(a) for a in other.agents.names], dtype=np.int32)
+        role_map = np.array([self.roles.id(r) for r in other.roles.names], dtype=np.int32)
+        for post_id, (title, agents, roles) in other._posts.items():
+            self._put(post_id, title, agent_map[agents], role_map[roles])
+        for post_id in other._triaged:
+            self._set_triaged(post_id)
+        return self
+
+    def _events(self) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """Every driver event as (post position, agent id, role id), plus per-agent event counts."""
+        if self._tallies is None:
+            posts = self._posts.values()
+            lengths = np.fromiter((len(a) for _, a, _ in posts), dtype=np.int64, count=len(self._posts))
+            post_index = np.repeat(np.arange(len(self._posts)), lengths)
+            agents = np.concatenate([a for _, a, _ in posts] or [np.zeros(0, np.int32)])
+            roles = np.concatenate([r for _, _, r in posts] or [np.zeros(0, np.int32)])
+            frequency = np.bincount(agents, minlength=len(self.agents.names))
+            self._tallies = post_index, agents, roles, frequency
+        return self._tallies
+
+    def summary(self, bootstrap_samples: int = INFLUENCE_BOOTSTRAP_SAMPLES) -> dict:
+        """The aggregate in the shape returned by ``analyze_agent_influence``.
+
+        With ``bootstrap_samples`` of 0, no confidence intervals are computed.
+        """
+        post_index, agents, roles, frequency = self._events()
+        # Rank by events, ties by first appearance, as a Counter over the posts would
+        present, first = np.unique(agents, return_index=True)
+        order = present[np.lexsort((first, -frequency[present]))]
+        names = self.agents.names
+        ranked = [(names[i], int(frequency[i])) for i in order]
+        total_driver_events = int(frequency.sum())
+        unique_drivers = len(present)
+        consensus_posts = len(self._posts)
+
+        # Concentration metrics, with bootstrap intervals from resampling posts
+        intervals = bootstrap_concentration(
+            post_index, agents, consensus_posts, len(names), TOP_NS, bootstrap_samples
+        )
+        concentration = {}
+        for top_n in TOP_NS:
+            top_agents = ranked[:top_n]
+            top_count = sum(c for _, c in top_agents)
+            concentration[f"top_{top_n}"] = {
+                "agents": [a for a, _ in top_agents],
+                "consensus_events": top_count,
+                "share": top_count / total_driver_events if total_driver_events else 0,
+            }
+            if intervals:
+                concentration[f"top_{top_n}"]["ci"] = intervals[f"top_{top_n}"]
+        inequality = {
+            "gini": gini(frequency),
+            "hhi": hhi(frequency),
+            "lorenz": lorenz_curve(frequency),
+            "bootstrap_samples": bootstrap_samples if intervals else 0,
+        }
+        if intervals:
+            inequality["gini_ci"] = intervals["gini"]
+            inequality["hhi_ci"] = intervals["hhi"]
+
+        # Agent profiles, from the top agents' events only
+        top = order[:TOP_PROFILES]
+        rank = np.full(len(names), -1)
+        rank[top] = np.arange(len(top))
+        events = np.flatnonzero(rank[agents] >= 0)
+        events = events[np.argsort(rank[agents[events]], kind="stable")]
+        titles = np.array([title for title, _, _ in self._posts.values()], dtype=object)
+        agent_profiles = {}
+        for i, group in zip(top, np.split(events, np.cumsum(frequency[top])[:-1])):
+            role_ids, first_seen, counts = np.unique(roles[group], return_index=True, return_counts=True)
+            seen = np.argsort(first_seen)
+            role_ids, counts = role_ids[seen], counts[seen]
+            agent_profiles[names[i]] = {
+                "consensus_events": int(frequency[i]),
+                "posts": titles[post_index[group]].tolist(),
+                "role_distribution": {self.roles.names[r]: int(c) for r, c in zip(role_ids, counts)},
+                "primary_role": self.roles.names[role_ids[counts.argmax()]],
+            }
+
+        # Uniform baseline: events per agent if every driver drove equally often
+        uniform_expected = total_driver_events / unique_drivers if unique_drivers else 0
+
+        return {
+            "agent_frequency": {names[i]: int(frequency[i]) for i in present[np.argsort(first)]},
+            "ranked_agents": ranked,
+            "total_consensus_posts": consensus_posts,
+            "triaged_consensus_posts": len(self._triaged),
+            "total_driver_events": total_driver_events,
+            "unique_drivers": unique_drivers,
+            "concentration": concentration,
+            "inequality": inequality,
+            "agent_profiles": agent_profiles,
+            "uniform_baseline": uniform_expected,
+        }
+
+    def save(self, path: str):
+        """Atomically write the aggregator state as a NumPy .npz file."""
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        posts = list(self._posts.items())
+        lengths = np.array([len(a) for _, (_, a, _) in posts], dtype=np.int64)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez_compressed(
+                f,
+                agents=np.array(self.agents.names, dtype=str),
+                roles=np.array(self.roles.names, dtype=str),
+                post_ids=np.array([p for p, _ in posts], dtype=str),
+                triaged=np.array(sorted(self._triaged), dtype=str),
+                titles=np.array([t for _, (t, _, _) in posts], dtype=str),
+                lengths=lengths,
+                event_agents=np.concatenate([a for _, (_, a, _) in posts] or [np.zeros(0, np.int32)]),
+                event_roles=np.concatenate([r for _, (_, _, r) in posts] or [np.zeros(0, np.int32)]),
+            )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "InfluenceAggregator":
+        with np.load(path) as state:
+            aggregator = cls()
+            aggregator.agents = _Interner(state["agents"].tolist())
+            aggregator.roles = _Interner(state["roles"].tolist())
+            bounds = np.cumsum(state["lengths"])[:-1]
+            agents = np.split(state["event_agents"].astype(np.int32), bounds)
+            roles = np.split(state["event_roles"].astype(np.int32), bounds)
+            for post_id, title, a, r in zip(state["post_ids"].tolist(), state["titles"].tolist(), agents, roles):
+                aggregator._posts[post_id] = (title, a, r)
+            if "triaged" in state.files:
+                aggregator._triaged = set(state["triaged"].tolist())
+        return aggregator
+
+
+def analyze_agent_influence(results: list[dict], bootstrap_samples: int = INFLUENCE_BOOTSTRAP_SAMPLES) -> dict:
     """Aggregate consensus-driving data across all posts.
 
     Returns a dict with:
       - agent_frequency: {agent: count} of how many posts each agent drove consensus in
       - ranked_agents: list of (agent, count) sorted descending
-      - total_consensus_posts: how many posts had YES or PARTIAL consensus
-      - concentration: stats about top-N agent share
+      - total_consensus_posts: how many analyzed posts had YES or PARTIAL consensus
+      - triaged_consensus_posts: YES or PARTIAL posts resolved by triage, without driver data
+      - concentration: stats about top-N agent share, with a bootstrap "ci"
+      - inequality: Gini, HHI and Lorenz curve of driver events, with bootstrap intervals
       - agent_profiles: per-agent role summaries
-      - uniform_baseline: expected frequency if drivers were uniformly distributed
+      - uniform_baseline: expected events per agent if drivers were uniformly distributed
     """
-    agent_frequency: Counter = Counter()
-    agent_roles: defaultdict[str, list[str]] = defaultdict(list)
-    agent_posts: defaultdict[str, list[str]] = defaultdict(list)
-    all_participating_agents: set[str] = set()
-    consensus_posts = 0
-
-    for r in results:
-        consensus = r.get("consensus", "")
-        if consensus not in ("YES", "PARTIAL"):
-            continue
-        consensus_posts += 1
-
-        drivers = r.get("consensus_drivers", [])
-        post_title = r.get("post_title", "?")
-
-        for d in drivers:
-            agent = d.get("agent", "unknown")
-            role = d.get("role", "unknown")
-            agent_frequency[agent] += 1
-            agent_roles[agent].append(role)
-            agent_posts[agent].append(post_title)
-
-        # Track all agents who participated (not just drivers) — we'd need comment data
-        # for a full picture, but drivers give us the influence picture
-
-    ranked = agent_frequency.most_common()
-    total_driver_events = sum(agent_frequency.values())
-    unique_drivers = len(agent_frequency)
-
-    # Concentration metrics
-    concentration = {}
-    for top_n in (1, 3, 5, 10):
-        top_agents = ranked[:top_n]
-        top_count = sum(c for _, c in top_agents)
-        concentration[f"top_{top_n}"] = {
-            "agents": [a for a, _ in top_agents],
-            "consensus_events": top_count,
-            "share": top_count / total_driver_events if total_driver_events else 0,
-        }
-
-    # Agent profiles
-    agent_profiles = {}
-    for agent, count in ranked[:20]:  # Top 20 agents
-        roles = agent_roles[agent]
-        role_counts = Counter(roles)
-        primary_role = role_counts.most_common(1)[0][0] if role_counts else "unknown"
-        agent_profiles[agent] = {
-            "consensus_events": count,
-            "posts": agent_posts[agent],
-            "role_distribution": dict(role_counts),
-            "primary_role": primary_role,
-        }
-
-    # Uniform baseline
-    uniform_expected = consensus_posts / unique_drivers if unique_drivers else 0
-
-    return {
-        "agent_frequency": dict(agent_frequency),
-        "ranked_agents": ranked,
-        "total_consensus_posts": consensus_posts,
-        "total_driver_events": total_driver_events,
-        "unique_drivers": unique_drivers,
-        "concentration": concentration,
-        "agent_profiles": agent_profiles,
-        "uniform_baseline": uniform_expected,
-    }
+    aggregator = InfluenceAggregator()
+    for i, r in enumerate(results):
+        aggregator.add(r, r.get("post_id", f"#{i}"))
+    return aggregator.summary(bootstrap_samples)
@@ -0,0 +1,215 @@
+import asyncio
+import glob
+import hashlib
+import json
+import os
+import random
+import re
+from collections import Counter
+from typing import Optional
+from config import LLM_MAX_RETRIES
+from analysis.llm_backend import LLMBackend
+from analysis.llm_cache import get_cache
+from analysis.rate_limiter import is_rate_limit_error
+
+
+def _prompt_key(prompt: str) -> str:
+    return hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+
+
+def _file_model(model: str) -> str:
+    return re.sub(r"[^A-Za-z0-9._-]", "_", model)
+
+
+_STAGE_FILE = re.compile(r"^requests-(\d+)-.+\.manifest\.jsonl$")
+
+
+def _last_stage(batch_dir: str) -> int:
+    """Highest stage number among the request files already written, or 0."""
+    stages = [int(m.group(1)) for name in os.listdir(batch_dir) if (m := _STAGE_FILE.match(name))]
+    return max(stages, default=0)
+
+
+class BatchRequests:
+    """Pass 1 requests collected for a batch prediction job.
+
+    Used as the ``analysis.llm.record_misses`` recorder. Every prompt without
+    a cached response is kept once, along with the template version and
+    cache namespace its response has to be stored under at ingest time.
+    """
+
+    def __init__(self):
+        self._requests: dict[str, dict] = {}
+
+    def __call__(
+        self,
+        prompt: str,
+        template_version: str,
+        model: str,
+        cache_model: str,
+        response_schema: Optional[dict] = None,
+    ):
+        self._requests.setdefault(_prompt_key(prompt), {
+            "prompt": prompt,
+            "template_version": template_version,
+            "model": model,
+            "cache_model": cache_model,
+            "response_schema": response_schema,
+        })
+
+    def __len__(self) -> int:
+        return len(self._requests)
+
+    def write(self, batch_dir: str) -> list[str]:
+        """Write the next stage's request files, one per model, and return their paths.
+
+        Each ``requests-NNN-<model>.jsonl`` holds one Vertex AI batch
+        prediction request per line; the matching ``.manifest.jsonl`` maps
+        each prompt's hash back to its template version and cache namespace.
+        """
+        if not self._requests:
+            return []
+        os.makedirs(batch_dir, exist_ok=True)
+        stage = _last_stage(batch_dir) + 1
+        by_model: dict[str, list[tuple[str, dict]]] = {}
+        for key, request in self._requests.items():
+            by_model.setdefault(request["model"], []).append((key, request))
+
+        paths = []
+        for model, requests in by_model.items():
+            path = os.path.join(batch_dir, f"requests-{stage:03d}-{_file_model(model)}.jsonl")
+            with open(path, "w", encoding="utf-8") as f:
+                for _, request in requests:
+                    body = {"contents": [{"role": "user", "parts": [{"text": request["prompt"]}]}]}
+                    if request["response_schema"] is not None:
+                        body["generationConfig"] = {
+                            "responseMimeType": "application/json",
+                            "responseSchema": request["response_schema"],
+                        }
+                    f.write(json.dumps({"request": body}) + "\n")
+            with open(path.replace(".jsonl", ".manifest.jsonl"), "w", encoding="utf-8") as f:
+                for key, request in requests:
+                    f.write(json.dumps({
+                        "prompt_sha256": key,
+                        "model": model,
+                        "template_version": request["template_version"],
+                        "cache_model": request["cache_model"],
+                    }) + "\n")
+            paths.append(path)
+        return paths
+
+
+def _load_manifests(batch_dir: str) -> dict[str, dict]:
+    manifest = {}
+    for path in sorted(glob.glob(os.path.join(batch_dir, "requests-*.manifest.jsonl"))):
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                entry = json.loads(line)
+                manifest[entry["prompt_sha256"]] = entry
+    return manifest
+
+
+def _response_text(prediction: dict) -> str:
+    candidates = (prediction.get("response") or {}).get("candidates") or []
+    if not candidates:
+        return ""
+    parts = (candidates[0].get("content") or {}).get("parts") or []
+    return "".join(part.get("text", "") for part in parts)
+
+
+def ingest_predictions(batch_dir: str, paths: list[str] = ()) -> Counter:
+    """Store batch prediction responses in the response cache.
+
+    Reads the given prediction files, or every ``predictions*.jsonl`` in
+    ``batch_dir``. Lines that failed, came back empty or don't match an
+    exported request are skipped; their prompts stay uncached and are
+    exported again by the next batch run. Partial or truncated files are
+    fine, and ingesting the same file twice is harmless.
+    """
+    manifest = _load_manifests(batch_dir)
+    cache = get_cache()
+    counts: Counter = Counter()
+    for path in paths or sorted(glob.glob(os.path.join(batch_dir, "predictions*.jsonl"))):
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    prediction = json.loads(line)
+                    prompt = prediction["request"]["contents"][0]["parts"][0]["text"]
+                except (json.JSONDecodeError, KeyError, IndexError, TypeError):
+                    counts["unreadable"] += 1
+                    continue
+                entry = manifest.get(_prompt_key(prompt))
+                text = _response_text(prediction)
+                if entry is None:
+                    counts["unknown"] += 1
+                elif not text:
+                    counts["failed"] += 1
+                else:
+                    cache.put(entry["cache_model"], entry["template_version"], prompt, text)
+                    counts["ingested"] += 1
+    return counts
+
+
+async def simulate_predictions(
+    batch_dir: str, backend: LLMBackend, failure_rate: float = 0.0, seed: int = 0
+) -> list[str]:
+    """File-based stand-in for Vertex batch prediction.
+
+    Answers every request file that has no predictions file yet with the
+    given backend, writing ``predictions-NNN-<model>.jsonl`` in the Vertex
+    output format. Like the batch service, it retries rate-limited requests
+    itself. A ``failure_rate`` share of lines, drawn per file, plus any
+    request the backend rejects, is written with an error status and no
+    response, the way a real batch job reports them.
+    """
+    paths = []
+    for request_path in sorted(glob.glob(os.path.join(batch_dir, "requests-*.jsonl"))):
+        if request_path.endswith(".manifest.jsonl"):
+            continue
+        output_path = os.path.join(
+            batch_dir, os.path.basename(request_path).replace("requests-", "predictions-", 1)
+        )
+        if os.path.exists(output_path):
+            continue
+        manifest_path = request_path.replace(".jsonl", ".manifest.jsonl")
+        with open(request_path, encoding="utf-8") as f, open(manifest_path, encoding="utf-8") as m:
+            lines = [(json.loads(line), json.loads(entry)) for line, entry in zip(f, m)]
+
+        rng = random.Random(f"{seed}:{os.path.basename(request_path)}")
+        failed = [rng.random() < failure_rate for _ in lines]
+
+        async def predict(line: dict, entry: dict, failed: bool) -> dict:
+            if failed:
+                return {"status": "Simulated batch prediction failure", "request": line["request"]}
+            prompt = line["request"]["contents"][0]["parts"][0]["text"]
+            schema = line["request"].get("generationConfig", {}).get("responseSchema")
+            for attempt in range(LLM_MAX_RETRIES):
+                try:
+                    response = await backend.generate(prompt, entry["model"], schema)
+                    break
+                except Exception as e:
+                    if not is_rate_limit_error(e) or attempt == LLM_MAX_RETRIES - 1:
+                        return {"status": str(e), "request": line["request"]}
+            return {
+                "status": "",
+                "request": line["request"],
+                "response": {
+                    "candidates": [{
+                        "content": {"role": "model", "parts": [{"text": response.text}]},
+                        "finishReason": "STOP",
+                    }],
+                    "usageMetadata": {
+                        "promptTokenCount": response.input_tokens,
+                        "candidatesTokenCount": response.output_tokens,
+                    },
+                },
+            }
+
+        predictions = await asyncio.gather(
+            *[predict(line, entry, f) for (line, entry), f in zip(lines, failed)]
+        )
+        with open(output_path, "w", encoding="utf-8") as f:
+            for prediction in predictions:
+                f.write(json.dumps(prediction) + "\n")
+        paths.append(output_path)
+    return paths
@@ -0,0 +1,91 @@
+import json
+import os
+from typing import Iterable, Optional
+
+
+class CheckpointStore:
+    """Append-only JSONL log of Pass 1 results keyed by dataset post id.
+
+    Each result is appended and fsynced the moment its post completes, so a
+    crash loses at most the posts that were still in flight. When the log is
+    replayed, later lines for the same post win, and a torn final line from
+    an interrupted write is ignored.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._results: dict[str, dict] = {}
+        if os.path.exists(path):
+            self._replay()
+
+    def _replay(self):
+        valid_bytes = 0
+        with open(self.path, "rb") as f:
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                valid_bytes += len(line)
+                try:
+                    entry = json.loads(line)
+                    self._results[str(entry["post_id"])] = entry["result"]
+                except (json.JSONDecodeError, KeyError, TypeError):
+                    continue
+        # Drop a torn final line so the next append starts on a fresh line
+        if valid_bytes < os.path.getsize(self.path):
+            with open(self.path, "r+b") as f:
+                f.truncate(valid_bytes)
+
+    def __contains__(self, post_id) -> bool:
+        return str(post_id) in self._results
+
+    def __len__(self) -> int:
+        return len(self._results)
+
+    def get(self, post_id) -> Optional[dict]:
+        return self._results.get(str(post_id))
+
+    def append(self, post_id, result: dict):
+        """Durably record one post's result."""
+        post_id = str(post_id)
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        line = json.dumps({"post_id": post_id, "result": result}, default=str)
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        self._results[post_id] = result
+
+    def seed_from_raw_results(self, path: str, title_to_ids: dict[str, list[str]]) -> int:
+        """Import a legacy raw_results.json, returning how many results were added.
+
+        Results that carry a ``post_id`` are imported directly. Older files
+        are keyed only by title, so those results are matched through
+        ``title_to_ids`` and skipped when the title is ambiguous.
+        """
+        if not os.path.exists(path):
+            return 0
+        try:
+            with open(path, encoding="utf-8") as f:
+                results_list = json.load(f)
+        except (json.JSONDecodeError, OSError):
+            return 0
+
+        seeded = 0
+        for r in results_list:
+            post_id = r.get("post_id")
+            if post_id is None:
+                ids = title_to_ids.get(r.get("post_title"), [])
+                if len(ids) != 1:
+                    continue
+                post_id = ids[0]
+            if post_id in self:
+                continue
+            self.append(post_id, {**r, "post_id": str(post_id)})
+            seeded += 1
+        return seeded
+
+    def results(self, post_ids: Optional[Iterable] = None) -> list[dict]:
+        """Stored results, in the given post order or in log order."""
+        if post_ids is None:
+            return list(self._results.values())
+        return [self._results[str(p)] for p in post_ids if str(p) in self._results]
@@ -1,12 +1,26 @@
 import asyncio
 import json
-import re
+import zlib
+from dataclasses import dataclass
 from typing import Optional
-from google import genai
-from config import GCP_PROJECT, GCP_LOCATION, GEMINI_MODEL, CONCURRENCY_LIMIT, MAX_COMMENTS_FULL_THREAD, CHUNK_SIZE
-from data.comment_parser import format_thread_for_llm
+from config import (
+    GEMINI_MODEL,
+    CONCURRENCY_LIMIT,
+    MAX_TOKENS_FULL_THREAD,
+    CHUNK_TOKEN_BUDGET,
+    SUMMARY_FAN_IN,
+    SMALL_THREAD_TOKENS,
+    MULTI_POST_TOKEN_BUDGET,
+    MULTI_POST_MAX_POSTS,
+    DELTA_MAX_NEW_FRACTION,
+    POST_TOKEN_BUDGET,
+)
+from data.comment_parser import format_thread_for_llm, thread_fingerprint, comments_since
+from data.compaction import compact_thread
+from data.tokens import estimate_tokens
+from analysis.llm import generate
+from analysis.structured import generate_structured, validate
 
-_client = None
 _semaphore = None
 
 
@@ -16,12 +30,56 @@ def _get_semaphore():
         _semaphore = asyncio.Semaphore(CONCURRENCY_LIMIT)
     return _semaphore
 
+# Bump a template's version whenever its wording changes so cached
+# responses to the old prompt are not reused.
+PER_POST_PROMPT_VERSION = "per_post/1"
+CHUNK_SUMMARY_PROMPT_VERSION = "chunk_summary/1"
+REDUCE_SUMMARY_PROMPT_VERSION = "reduce_summary/1"
+DELTA_PROMPT_VERSION = "delta/1"
+MULTI_POST_PROMPT_VERSION = "multi_post/1"
 
-def _get_client():
-    global _client
-    if _client is None:
-        _client = genai.Client(vertexai=True, project=GCP_PROJECT, location=GCP_LOCATION)
-    return _client
+# The analysis fields of a per-post result, as produced by PER_POST_PROMPT
+ANALYSIS_FIELDS = (
+    "consensus",
+    "consensus_position",
+    "formation_pattern",
+    "key_moments",
+    "consensus_drivers",
+    "evidence_quotes",
+)
+
+# Response schemas (Gemini's OpenAPI subset) for the analysis prompts
+PER_POST_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "consensus": {"type": "STRING", "enum": ["YES", "NO", "PARTIAL"]},
+        "consensus_position": {"type": "STRING", "nullable": True},
+        "formation_pattern": {"type": "STRING"},
+        "key_moments": {"type": "ARRAY", "items": {"type": "STRING"}},
+        "consensus_drivers": {
+            "type": "ARRAY",
+            "items": {
+                "type": "OBJECT",
+                "properties": {
+                    "agent": {"type": "STRING"},
+                    "role": {"type": "STRING"},
+                    "description": {"type": "STRING"},
+                },
+                "required": ["agent", "role", "description"],
+            },
+        },
+        "evidence_quotes": {"type": "ARRAY", "items": {"type": "STRING"}},
+    },
+    "required": list(ANALYSIS_FIELDS),
+}
+
+MULTI_POST_ITEM_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {"post_id": {"type": "STRING"}, **PER_POST_SCHEMA["properties"]},
+    "required": ["post_id", *ANALYSIS_FIELDS],
+}
+
+MULTI_POST_SCHEMA = {"type": "ARRAY", "items": MULTI_POST_ITEM_SCHEMA}
 
 PER_POST_PROMPT = """\
 You are analyzing a discussion thread from Moltbook, a platform where AI agents discuss and debate topics.
@@ -49,6 +107,40 @@ Analyze this thread and respond with ONLY valid JSON (no markdown fences):
 }}
 """
 
+MULTI_POST_PROMPT = """\
+You are analyzing several discussion threads from Moltbook, a platform where AI agents discuss and debate topics. The threads are unrelated: analyze each thread on its own.
+
+{posts}
+
+Respond with ONLY a valid JSON array (no markdown fences) holding one object per thread:
+[
+  {{
+    "post_id": "the id from the thread's header",
+    "consensus": "YES" | "NO" | "PARTIAL",
+    "consensus_position": "Brief description of what they agreed on, or null if no consensus",
+    "formation_pattern": "2-3 sentence description of how consensus formed (or why it didn't)",
+    "key_moments": ["1-3 key comments or turning points that drove the outcome"],
+    "consensus_drivers": [
+      {{
+        "agent": "username",
+        "role": "proposed_position | reframed_debate | provided_evidence | synthesized_views | built_momentum | other",
+        "description": "Brief description of what this agent did to drive consensus"
+      }}
+    ],
+    "evidence_quotes": ["1-3 direct quotes from comments that illustrate the consensus or key disagreement"]
+  }}
+]
+"""
+
+MULTI_POST_SECTION = """\
+=== Post {post_id} ===
+**Post Title:** {title}
+**Post Content:** {post_content}
+
+**Thread:**
+{thread}
+"""
+
 CHUNK_SUMMARY_PROMPT = """\
 Summarize this portion of a discussion thread, preserving:
 - Key arguments and positions taken
@@ -60,71 +152,218 @@ Thread chunk:
 {chunk}
 """
 
+DELTA_PROMPT = """\
+You are updating an analysis of a discussion thread from Moltbook, a platform where AI agents discuss and debate topics. New comments have been posted since the analysis was made.
+
+**Post Title:** {title}
+**Post Content:** {post_content}
+
+**Previous Analysis (of the first {previous_count} comments):**
+{previous}
+
+**New Comments:**
+{thread}
+
+Revise the previous analysis in light of the new comments. Keep what still holds, and change the consensus verdict, drivers, key moments or quotes only where the new comments warrant it. Respond with ONLY valid JSON (no markdown fences) with the same fields as the previous analysis.
+"""
+
+REDUCE_SUMMARY_PROMPT = """\
+Merge these summaries of consecutive portions of a discussion thread into one summary, preserving:
+- Key arguments and positions taken
+- Which agents said what
+- Any agreements or disagreements
+- The flow of the conversation
+
+Summaries, in thread order:
+{summaries}
+"""
+
+# Roughly 1 in ANCHOR_RATE comments/summaries is an anchor: a content-defined
+# cut point that lets chunks and reduce groups realign after an edit.
+ANCHOR_RATE = 8
+
+
+def _is_anchor(text: str, rate: int = ANCHOR_RATE) -> bool:
+    return zlib.crc32(text.encode("utf-8")) % rate == 0
+
+
+def _comment_tokens(comments: list[dict]) -> list[int]:
+    """Estimated tokens of each comment's formatted thread line."""
+    return [estimate_tokens(format_thread_for_llm([c])) + 1 for c in comments]
+
+
+def _subtree_ends(comments: list[dict]) -> list[int]:
+    """For each comment, the index one past the end of its reply subtree (DFS order)."""
+    ends = [len(comments)] * len(comments)
+    open_roots: list[int] = []
+    for i, c in enumerate(comments):
+        while open_roots and comments[open_roots[-1]]["depth"] >= c["depth"]:
+            ends[open_roots.pop()] = i
+        open_roots.append(i)
+    return ends
+
+
+def _chunk_comments(
+    comments: list[dict],
+    budget: int = CHUNK_TOKEN_BUDGET,
+    token_counts: Optional[list[int]] = None,
+) -> list[list[dict]]:
+    """Pack whole reply subtrees into chunks of at most ~budget tokens.
+
+    A subtree that fits the budget is never split across chunks. An oversized
+    subtree is broken into its root comment followed by its child subtrees,
+    recursively, so cuts always fall between sibling subtrees. A single
+    comment larger than the budget gets a chunk of its own.
 
-def _chunk_comments(comments: list[dict]) -> list[list[dict]]:
-    """Split comments into chunks of ~CHUNK_SIZE."""
-    chunks = []
-    for i in range(0, len(comments), CHUNK_SIZE):
-        chunks.append(comments[i:i + CHUNK_SIZE])
+    Once a chunk is half full it is also cut before any anchor comment, so
+    new comments only reshape the chunks up to the next anchor and the rest
+    keep their cached summaries.
+    """
+    if token_counts is None:
+        token_counts = _comment_tokens(comments)
+    prefix = [0]
+    for t in token_counts:
+        prefix.append(prefix[-1] + t)
+    ends = _subtree_ends(comments)
+
+    # Contiguous (start, end) units in DFS order, each within budget if possible
+    units: list[tuple[int, int]] = []
+    stack = [(0, len(comments))]  # ranges holding a run of sibling subtrees
+    while stack:
+        i, stop = stack.pop()
+        if i >= stop:
+            continue
+        end = min(ends[i], stop)
+        stack.append((end, stop))
+        if prefix[end] - prefix[i] <= budget or end - i == 1:
+            units.append((i, end))
+        else:
+            units.append((i, i + 1))
+            stack.append((i + 1, end))
+
+    chunks: list[list[dict]] = []
+    chunk_start = chunk_end = 0
+    for start, end in units:
+        if chunk_end > chunk_start and (
+            prefix[end] - prefix[chunk_start] > budget
+            or (
+                prefix[chunk_end] - prefix[chunk_start] >= budget / 2
+                and _is_anchor(f"{comments[start]['author']}\0{comments[start]['text']}")
+            )
+        ):
+            chunks.append(comments[chunk_start:chunk_end])
+            chunk_start = start
+        chunk_end = end
+    if chunk_end > chunk_start:
+        chunks.append(comments[chunk_start:chunk_end])
     return chunks
 
 
-def _extract_json(text: str) -> Optional[dict]:
-    """Extract JSON from LLM response, handling markdown fences."""
-    # Try direct parse first
-    try:
-        return json.loads(text)
-    except json.JSONDecodeError:
-        pass
+# Rate-limiter lane for the follow-up calls of a post already being analyzed
+# (chunk summaries, merges and the final call), so started posts finish
+# before new posts take their budget.
+UNDERWAY_PRIORITY = 1
+
+_PROMPT_OVERHEAD_TOKENS = estimate_tokens(PER_POST_PROMPT)
+
 
-    # Try extracting from markdown code fence
-    match = re.search(r"```(?:json)?\s*\n?(.*?)\n?```", text, re.DOTALL)
-    if match:
-        try:
-            return json.loads(match.group(1))
-        except json.JSONDecodeError:
-            pass
+@dataclass(frozen=True, order=True)
+class PostCost:
+    """Estimated LLM work for one post; orders by tokens, then calls."""
 
-    # Try finding JSON object in text
-    match = re.search(r"\{.*\}", text, re.DOTALL)
-    if match:
-        try:
-            return json.loads(match.group(0))
-        except json.JSONDecodeError:
-            pass
+    tokens: int
+    calls: int
 
-    return None
 
+def estimate_post_cost(comments: list[dict]) -> PostCost:
+    """Estimate the calls and prompt tokens ``analyze_post`` will spend on a thread.
 
-async def _summarize_chunk(chunk: list[dict]) -> str:
+    Uses the chunker's per-comment token estimates without building chunks:
+    a thread over MAX_TOKENS_FULL_THREAD costs about one summary call per
+    CHUNK_TOKEN_BUDGET of comments plus the final call, and compaction
+    caps a thread at POST_TOKEN_BUDGET. Posts are started
+    most expensive first so the largest threads don't form the run's tail.
+    """
+    tokens = min(sum(_comment_tokens(comments)), POST_TOKEN_BUDGET)
+    calls = 1
+    if tokens > MAX_TOKENS_FULL_THREAD:
+        calls += -(-tokens // CHUNK_TOKEN_BUDGET)
+    return PostCost(tokens + calls * _PROMPT_OVERHEAD_TOKENS, calls)
+
+
+async def _summarize_chunk(chunk: list[dict], model: str = GEMINI_MODEL) -> str:
     """Summarize a chunk of comments using Gemini."""
     thread_text = format_thread_for_llm(chunk)
     prompt = CHUNK_SUMMARY_PROMPT.format(chunk=thread_text)
 
-    # Retry with exponential backoff on rate limit errors
-    max_retries = 3
-    for attempt in range(max_retries):
-        try:
-            response = await _get_client().aio.models.generate_content(
-                model=GEMINI_MODEL,
-                contents=prompt,
-            )
-            return response.text
-        except Exception as e:
-            if "429" in str(e) or "RESOURCE_EXHAUSTED" in str(e):
-                if attempt < max_retries - 1:
-                    # Extract retry delay from error message or use exponential backoff
-                    wait_time = (2 ** attempt) * 2  # 2, 4, 8 seconds
-                    print(f"Rate limit hit, waiting {wait_time}s before retry...")
-                    await asyncio.sleep(wait_time)
-                else:
-                    raise
-            else:
-                raise
-    return ""  # Fallback
-
-
-async def analyze_post(post: dict, comments: list[dict]) -> dict:
+    return await generate(prompt, CHUNK_SUMMARY_PROMPT_VERSION, model, priority=UNDERWAY_PRIORITY)
+
+
+async def _gather_all(calls) -> list:
+    """Like asyncio.gather, but every call finishes before the first error is raised.
+
+    In batch mode this lets sibling calls all record their requests, so one
+    export holds every chunk of a thread.
+    """
+    results = await asyncio.gather(*calls, return_exceptions=True)
+    for result in results:
+        if isinstance(result, BaseException):
+            raise result
+    return results
+
+
+def _join_summaries(summaries: list[str]) -> str:
+    return "\n\n---\n\n".join(
+        f"[Chunk {i+1} summary]: {s}" for i, s in enumerate(summaries)
+    )
+
+
+def _group_summaries(summaries: list[str], fan_in: int = SUMMARY_FAN_IN) -> list[list[str]]:
+    """Split summaries into consecutive groups of at most fan_in.
+
+    Groups end at anchor summaries rather than fixed positions, so a changed
+    or inserted summary only regroups its neighbours up to the next anchor.
+    """
+    groups: list[list[str]] = []
+    group: list[str] = []
+    for summary in summaries:
+        group.append(summary)
+        if len(group) == fan_in or (len(group) > 1 and _is_anchor(summary, fan_in)):
+            groups.append(group)
+            group = []
+    if group:
+        groups.append(group)
+    return groups
+
+
+async def _merge_summaries(summaries: list[str], model: str = GEMINI_MODEL) -> str:
+    """Merge consecutive summaries into one.
+
+    The prompt depends only on the child summaries, so the response cache
+    keys each intermediate summary by its children's content.
+    """
+    prompt = REDUCE_SUMMARY_PROMPT.format(summaries=_join_summaries(summaries))
+    return await generate(prompt, REDUCE_SUMMARY_PROMPT_VERSION, model, priority=UNDERWAY_PRIORITY)
+
+
+async def _reduce_summaries(
+    summaries: list[str], budget: int = MAX_TOKENS_FULL_THREAD, model: str = GEMINI_MODEL
+) -> list[str]:
+    """Merge chunk summaries level by level until they fit in one prompt.
+
+    Each level merges groups of up to SUMMARY_FAN_IN summaries in parallel;
+    unchanged groups are served from the response cache.
+    """
+    while len(summaries) > 1 and estimate_tokens(_join_summaries(summaries)) > budget:
+        groups = _group_summaries(summaries)
+        merged = iter(await _gather_all(
+            _merge_summaries(group, model) for group in groups if len(group) > 1
+        ))
+        summaries = [next(merged) if len(group) > 1 else group[0] for group in groups]
+    return summaries
+
+
+async def analyze_post(post: dict, comments: list[dict], model: str = GEMINI_MODEL) -> dict:
     """Analyze a single post's comment thread for consensus patterns."""
     async with _get_semaphore():
         title = post.get("title", "Untitled")
@@ -132,17 +371,19 @@ async def analyze_post(post: dict, comments: list[dict]) -> dict:
         if post_content is None:
             post_content = ""
 
-        # Handle large threads by summarizing chunks
-        if len(comments) > MAX_COMMENTS_FULL_THREAD:
-            chunks = _chunk_comments(comments)
-            summaries = await asyncio.gather(
-                *[_summarize_chunk(chunk) for chunk in chunks]
-            )
-            thread_text = "\n\n---\n\n".join(
-                f"[Chunk {i+1} summary]: {s}" for i, s in enumerate(summaries)
+        # Fold duplicates and trim long comments, then summarize chunks of large threads
+        thread, compaction = compact_thread(comments)
+        priority = 0
+        token_counts = _comment_tokens(thread)
+        if sum(token_counts) > MAX_TOKENS_FULL_THREAD:
+            priority = UNDERWAY_PRIORITY
+            chunks = _chunk_comments(thread, token_counts=token_counts)
+            summaries = await _gather_all(_summarize_chunk(chunk, model) for chunk in chunks)
+            thread_text = _join_summaries(
+                await _reduce_summaries(list(summaries), MAX_TOKENS_FULL_THREAD, model)
             )
         else:
-            thread_text = format_thread_for_llm(comments)
+            thread_text = format_thread_for_llm(thread)
 
         prompt = PER_POST_PROMPT.format(
             title=title,
@@ -150,32 +391,9 @@ async def analyze_post(post: dict, comments: list[dict]) -> dict:
             thread=thread_text,
         )
 
-        # Retry with exponential backoff on rate limit errors
-        max_retries = 3
-        response = None
-        for attempt in range(max_retries):
-            try:
-                response = await asyncio.to_thread(
-                    _get_client().models.generate_content,
-                    model=GEMINI_MODEL,
-                    contents=prompt,
-                )
-                break
-            except Exception as e:
-                if "429" in str(e) or "RESOURCE_EXHAUSTED" in str(e):
-                    if attempt < max_retries - 1:
-                        wait_time = (2 ** attempt) * 2
-                        print(f"Rate limit hit for '{title[:50]}...', waiting {wait_time}s...")
-                        await asyncio.sleep(wait_time)
-                    else:
-                        raise
-                else:
-                    raise
-
-        if response is None:
-            raise Exception("Failed to get response after retries")
-
-        result = _extract_json(response.text)
+        result = await generate_structured(
+            prompt, PER_POST_PROMPT_VERSION, PER_POST_SCHEMA, model, priority
+        )
         if result is None:
             result = {
                 "consensus": "UNKNOWN",
@@ -185,8 +403,168 @@ async def analyze_post(post: dict, comments: list[dict]) -> dict:
                 "consensus_drivers": [],
                 "evidence_quotes": [],
             }
+        return _finish_result(result, post, comments, compaction)
+
+
+def _finish_result(result: dict, post: dict, comments: list[dict], compaction: dict) -> dict:
+    """Attach the post's metadata, thread fingerprint and compaction stats to an analysis."""
+    result["post_id"] = str(post.get("id"))
+    result["post_title"] = post.get("title", "Untitled")
+    result["post_upvotes"] = post.get("upvotes", 0)
+    result["comment_count"] = len(comments)
+    result["thread_fingerprint"] = thread_fingerprint(comments)
+    _set_compaction(result, compaction)
+    return result
+
+
+def _set_compaction(result: dict, compaction: dict):
+    """Record the prompt tokens compaction saved, if any, on a result."""
+    if compaction["tokens_after"] < compaction["tokens_before"]:
+        result["compaction"] = compaction
+    else:
+        result.pop("compaction", None)
+
+
+def is_small_thread(cost: PostCost) -> bool:
+    """Whether a post is cheap enough to share a multi-post request."""
+    return cost.calls == 1 and cost.tokens - _PROMPT_OVERHEAD_TOKENS <= SMALL_THREAD_TOKENS
+
+
+def pack_small_threads(costs: list[PostCost]) -> list[list[int]]:
+    """Greedily group small threads, in order, into multi-post requests.
+
+    Returns lists of indices into ``costs``; each group holds at most
+    MULTI_POST_MAX_POSTS threads totalling at most MULTI_POST_TOKEN_BUDGET
+    estimated thread tokens.
+    """
+    groups: list[list[int]] = []
+    group: list[int] = []
+    group_tokens = 0
+    for i, cost in enumerate(costs):
+        tokens = cost.tokens - _PROMPT_OVERHEAD_TOKENS
+        if group and (
+            len(group) >= MULTI_POST_MAX_POSTS or group_tokens + tokens > MULTI_POST_TOKEN_BUDGET
+        ):
+            groups.append(group)
+            group, group_tokens = [], 0
+        group.append(i)
+        group_tokens += tokens
+    if group:
+        groups.append(group)
+    return groups
+
+
+async def analyze_posts_batch(posts: list[tuple[dict, list[dict]]], model: str = GEMINI_MODEL) -> list:
+    """Analyze several small threads with one multi-post request.
+
+    The response is split back out by post id and each entry validated on
+    its own; a truncated response keeps the entries that were complete.
+    Posts that are missing from the response or come back invalid
+    are retried individually with ``analyze_post``. Returns one entry per
+    post, in order: its result, or the exception its individual retry raised.
+    """
+    if len(posts) == 1:
+        return list(await asyncio.gather(analyze_post(*posts[0], model), return_exceptions=True))
+
+    async with _get_semaphore():
+        sections = []
+        compactions = []
+        for post, comments in posts:
+            post_content = post.get("content", post.get("text", ""))
+            thread, compaction = compact_thread(comments)
+            compactions.append(compaction)
+            sections.append(MULTI_POST_SECTION.format(
+                post_id=post.get("id"),
+                title=post.get("title", "Untitled"),
+                post_content=(post_content or "")[:2000],
+                thread=format_thread_for_llm(thread),
+            ))
+        prompt = MULTI_POST_PROMPT.format(posts="\n".join(sections))
+        response = await generate_structured(
+            prompt, MULTI_POST_PROMPT_VERSION, MULTI_POST_SCHEMA, model
+        )
+
+    entries = {
+        str(entry["post_id"]): entry
+        for entry in response or []
+        if isinstance(entry, dict) and "post_id" in entry
+    }
+
+    results: list = [None] * len(posts)
+    retries = []
+    for i, (post, comments) in enumerate(posts):
+        entry = entries.get(str(post.get("id")))
+        if validate(entry, PER_POST_SCHEMA):
+            results[i] = _finish_result(
+                {k: entry[k] for k in ANALYSIS_FIELDS}, post, comments, compactions[i]
+            )
+        else:
+            retries.append(i)
+
+    retried = await asyncio.gather(
+        *[analyze_post(*posts[i], model) for i in retries], return_exceptions=True
+    )
+    for i, result in zip(retries, retried):
+        results[i] = result
+    return results
+
+
+def delta_comments(previous: dict, comments: list[dict]) -> Optional[list[dict]]:
+    """Decide how to bring a stored result up to date with the current thread.
+
+    Returns the comments to send to ``analyze_post_delta``, an empty list
+    when the stored result is still current, or None when the post needs a
+    full re-analysis: seen comments were edited or deleted, the thread more
+    than doubled, or the new comments would not fit in one prompt. Results
+    stored before fingerprints existed are kept as final, unless the post
+    had no comments then.
+    """
+    if not comments:
+        return []
+    fingerprint = previous.get("thread_fingerprint")
+    if fingerprint is None:
+        return None if not previous.get("comment_count") else []
+    new_comments = comments_since(fingerprint, comments)
+    if new_comments is None or len(new_comments) > DELTA_MAX_NEW_FRACTION * len(comments):
+        return None
+    if sum(_comment_tokens(new_comments)) > MAX_TOKENS_FULL_THREAD:
+        return None
+    return new_comments
+
+
+async def analyze_post_delta(
+    post: dict,
+    comments: list[dict],
+    previous: dict,
+    new_comments: list[dict],
+    model: str = GEMINI_MODEL,
+) -> dict:
+    """Update a previous analysis with only the comments posted since it was made.
+
+    If the response can't be parsed the previous result is returned as is,
+    so its fingerprint still marks the new comments as unseen.
+    """
+    async with _get_semaphore():
+        post_content = post.get("content", post.get("text", ""))
+        if post_content is None:
+            post_content = ""
+
+        thread, compaction = compact_thread(new_comments)
+        prompt = DELTA_PROMPT.format(
+            title=post.get("title", "Untitled"),
+            post_content=post_content[:2000],
+            previous_count=previous.get("comment_count", 0),
+            previous=json.dumps({k: previous.get(k) for k in ANALYSIS_FIELDS}, indent=2),
+            thread=format_thread_for_llm(thread),
+        )
+
+        update = await generate_structured(prompt, DELTA_PROMPT_VERSION, PER_POST_SCHEMA, model)
+        if update is None:
+            return previous
 
-        result["post_title"] = title
+        result = {**previous, **{k: update[k] for k in ANALYSIS_FIELDS}}
         result["post_upvotes"] = post.get("upvotes", 0)
         result["comment_count"] = len(comments)
+        result["thread_fingerprint"] = thread_fingerprint(comments)
+        _set_compaction(result, compaction)
         return result
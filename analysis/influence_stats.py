@@ -0,0 +1,114 @@
+import numpy as np
+
+LORENZ_POINTS = 11  # Agent-share grid 0%, 10%, ..., 100%
+BATCH_CELLS = 1 << 22  # Resample x event (or agent) cells materialized per bootstrap batch
+
+
+def gini(counts: np.ndarray) -> float:
+    """Gini coefficient of per-agent event counts (0 = equal, towards 1 = concentrated)."""
+    x = np.sort(counts[counts > 0]).astype(np.float64)
+    if len(x) == 0:
+        return 0.0
+    n = len(x)
+    return float(2 * (np.arange(1, n + 1) @ x) / (n * x.sum()) - (n + 1) / n)
+
+
+def hhi(counts: np.ndarray) -> float:
+    """Herfindahl-Hirschman index: the sum of squared agent shares of events."""
+    total = counts.sum()
+    return float(((counts / total) ** 2).sum()) if total else 0.0
+
+
+def lorenz_curve(counts: np.ndarray, points: int = LORENZ_POINTS) -> list[tuple[float, float]]:
+    """(share of agents, share of their events) with agents ordered least to most active."""
+    x = np.sort(counts[counts > 0]).astype(np.float64)
+    if len(x) == 0:
+        return []
+    agent_share = np.arange(len(x) + 1) / len(x)
+    event_share = np.concatenate(([0.0], np.cumsum(x) / x.sum()))
+    grid = np.linspace(0, 1, points)
+    return [(float(a), float(e)) for a, e in zip(grid, np.interp(grid, agent_share, event_share))]
+
+
+def incidence(post_index: np.ndarray, agents: np.ndarray, n_posts: int, n_agents: int) -> tuple:
+    """Post x agent incidence matrix in coordinate form: (posts, agents, events per cell).
+
+    Kept sparse because most agents drive consensus in only a few posts;
+    a dense matrix would be posts x agents.
+    """
+    cells, counts = np.unique(post_index.astype(np.int64) * n_agents + agents, return_counts=True)
+    return cells // n_agents, cells % n_agents, counts.astype(np.float64)
+
+
+def _row_stats(totals: np.ndarray, top_ns: tuple[int, ...]) -> dict[str, np.ndarray]:
+    """Top-N share, Gini and HHI of each row of per-agent event totals.
+
+    Gini and HHI are taken over every column, zeros included, so a row's
+    statistics always refer to the same agents.
+    """
+    n_agents = totals.shape[1]
+    events = totals.sum(axis=1)
+    events = np.where(events > 0, events, 1)
+    k = min(max(top_ns), n_agents)
+    largest = np.sort(np.partition(totals, n_agents - k, axis=1)[:, n_agents - k:], axis=1)[:, ::-1]
+    cumulative = np.cumsum(largest, axis=1)
+    stats = {f"top_{n}": cumulative[:, min(n, k) - 1] / events for n in top_ns}
+    ordered = np.sort(totals, axis=1)
+    stats["gini"] = 2 * (ordered @ np.arange(1, n_agents + 1)) / (n_agents * events) - (n_agents + 1) / n_agents
+    stats["hhi"] = ((totals / events[:, None]) ** 2).sum(axis=1)
+    return stats
+
+
+def bootstrap_concentration(
+    post_index: np.ndarray,
+    agents: np.ndarray,
+    n_posts: int,
+    n_agents: int,
+    top_ns: tuple[int, ...],
+    samples: int,
+    confidence: float = 0.95,
+    seed: int = 0,
+) -> dict:
+    """Bias-corrected bootstrap intervals for top-N share, Gini and HHI, resampling posts.
+
+    Each resample draws ``n_posts`` posts with replacement, counted into a
+    row of post weights. A batch of rows is applied to the incidence
+    matrix at once: every nonzero cell is weighted by its post's count and
+    summed per (resample, agent) with one ``np.bincount``. Statistics are
+    taken row-wise over the fixed set of agents that drove consensus in the
+    original sample, zeros kept, recomputing the top agents within each
+    resample. Batches are sized to keep about BATCH_CELLS values in memory.
+
+    Repeating posts makes every resample look more concentrated than the
+    sample, so the percentile interval is shifted by the bootstrap median
+    bias and clipped to [0, 1]; it then always contains the point estimate.
+
+    Returns ``{"top_N": (low, high), ..., "gini": (low, high), "hhi": (low, high)}``.
+    """
+    rows, cols, values = incidence(post_index, agents, n_posts, n_agents)
+    if n_posts == 0 or len(values) == 0 or samples <= 0:
+        return {}
+    universe, cols = np.unique(cols, return_inverse=True)
+    n_agents = len(universe)
+    estimate = _row_stats(np.bincount(cols, weights=values, minlength=n_agents)[None, :], top_ns)
+
+    rng = np.random.default_rng(seed)
+    batch = max(1, BATCH_CELLS // max(len(values), n_agents, n_posts))
+    draws: dict[str, list] = {name: [] for name in estimate}
+    for start in range(0, samples, batch):
+        b = min(batch, samples - start)
+        picks = rng.integers(0, n_posts, (b, n_posts)) + np.arange(b)[:, None] * n_posts
+        weights = np.bincount(picks.ravel(), minlength=b * n_posts).reshape(b, n_posts)
+        cells = (np.arange(b)[:, None] * n_agents + cols).ravel()
+        totals = np.bincount(cells, weights=(weights[:, rows] * values).ravel(), minlength=b * n_agents)
+        for name, row in _row_stats(totals.reshape(b, n_agents), top_ns).items():
+            draws[name].append(row)
+
+    tail = (1 - confidence) / 2 * 100
+    intervals = {}
+    for name, rows_drawn in draws.items():
+        sample = np.concatenate(rows_drawn)
+        low, median, high = np.percentile(sample, [tail, 50, 100 - tail])
+        bias = median - estimate[name][0]
+        intervals[name] = (float(np.clip(low - bias, 0, 1)), float(np.clip(high - bias, 0, 1)))
+    return intervals
@@ -0,0 +1,122 @@
+import asyncio
+import hashlib
+import json
+from typing import Callable, Optional
+from config import (
+    GCP_PROJECT,
+    GCP_LOCATION,
+    GEMINI_MODEL,
+    LLM_BACKEND,
+    LLM_REQUEST_TIMEOUT,
+    FAKE_LATENCY,
+    FAKE_LATENCY_PER_1K_TOKENS,
+    FAKE_RATE_LIMIT_RATE,
+    FAKE_SERVER_RPM,
+    FAKE_MALFORMED_RATE,
+    FAKE_FENCED_RATE,
+    FAKE_SEED,
+)
+from analysis.llm_backend import LLMBackend, GeminiBackend, FakeBackend
+from analysis.llm_cache import get_cache
+from analysis.rate_limiter import get_rate_limiter
+from data.tokens import estimate_tokens
+
+_backend = None
+_miss_recorder = None
+
+
+class ResponsePending(Exception):
+    """Raised by generate() in batch mode for a prompt with no cached response yet."""
+
+
+def get_backend() -> LLMBackend:
+    """Return the configured backend (LLM_BACKEND=gemini|fake)."""
+    global _backend
+    if _backend is None:
+        if LLM_BACKEND == "fake":
+            _backend = FakeBackend(
+                latency=FAKE_LATENCY,
+                latency_per_1k_tokens=FAKE_LATENCY_PER_1K_TOKENS,
+                rate_limit_rate=FAKE_RATE_LIMIT_RATE,
+                server_rpm=FAKE_SERVER_RPM,
+                malformed_rate=FAKE_MALFORMED_RATE,
+                fenced_rate=FAKE_FENCED_RATE,
+                seed=FAKE_SEED,
+            )
+        elif LLM_BACKEND == "gemini":
+            _backend = GeminiBackend(project=GCP_PROJECT, location=GCP_LOCATION)
+        else:
+            raise ValueError(f"Unknown LLM_BACKEND: {LLM_BACKEND!r}")
+    return _backend
+
+
+def set_backend(backend: LLMBackend):
+    """Swap the backend used by generate() (e.g. for benchmarks)."""
+    global _backend
+    _backend = backend
+
+
+def cache_version(template_version: str, response_schema: Optional[dict] = None) -> str:
+    """The template version a response is cached under, tagged with its response schema.
+
+    Responses requested with different schemas (or none) never share a cache entry.
+    """
+    if response_schema is None:
+        return template_version
+    digest = hashlib.sha256(json.dumps(response_schema, sort_keys=True).encode("utf-8")).hexdigest()
+    return f"{template_version}+schema:{digest[:12]}"
+
+
+def record_misses(recorder: Optional[Callable[[str, str, str, str, Optional[dict]], None]]):
+    """Batch mode: hand cache misses to a recorder instead of the backend.
+
+    While set, generate() calls ``recorder(prompt, template_version, model,
+    cache_model, response_schema)`` for every prompt without a cached response and raises
+    ResponsePending; ``template_version`` is the one the response will be cached under
+    (see ``cache_version``). Pass None to go back to calling the backend.
+    """
+    global _miss_recorder
+    _miss_recorder = recorder
+
+
+async def aclose():
+    """Release the backend's resources (pooled connections) at the end of a run."""
+    if _backend is not None:
+        await _backend.aclose()
+
+
+async def generate(
+    prompt: str,
+    template_version: str,
+    model: str = GEMINI_MODEL,
+    priority: int = 0,
+    response_schema: Optional[dict] = None,
+) -> str:
+    """Return the model's response text for a prompt.
+
+    Every LLM call in the pipeline goes through here: the response cache is
+    consulted first, then a native-async request is made to the configured
+    backend within the shared rate limiter, whose lanes start higher
+    ``priority`` calls first. A ``response_schema`` asks the model for JSON
+    matching it (see ``analysis.structured``). Cancelling the awaiting task cancels the
+    in-flight request.
+    """
+    backend = get_backend()
+    cache_model = backend.cache_namespace(model)
+    cache = get_cache()
+    version = cache_version(template_version, response_schema)
+    cached = cache.get(cache_model, version, prompt)
+    if cached is not None:
+        return cached
+    if _miss_recorder is not None:
+        _miss_recorder(prompt, version, model, cache_model, response_schema)
+        raise ResponsePending(template_version)
+
+    response = await get_rate_limiter().call(
+        lambda: asyncio.wait_for(backend.generate(prompt, model, response_schema), timeout=LLM_REQUEST_TIMEOUT),
+        tokens=estimate_tokens(prompt),
+        priority=priority,
+    )
+    if response.text:
+        cache.put(cache_model, version, prompt, response.text)
+    return response.text
@@ -0,0 +1,397 @@
+import asyncio
+import hashlib
+import json
+import random
+import re
+import time
+from collections import Counter, deque
+from dataclasses import dataclass
+from typing import Optional
+import httpx
+from google import genai
+from google.genai import types
+from config import LLM_MAX_CONNECTIONS, LLM_REQUEST_TIMEOUT
+from data.tokens import estimate_tokens
+
+
+@dataclass
+class LLMResponse:
+    text: str
+    input_tokens: int = 0
+    output_tokens: int = 0
+
+
+class LLMBackend:
+    """Interface for the model behind ``analysis.llm.generate``.
+
+    Backends only issue a single request; caching, rate limiting and retries
+    are layered on top by ``generate``. Rate-limit failures must surface as
+    exceptions recognised by ``rate_limiter.is_rate_limit_error``.
+    """
+
+    name = "base"
+
+    def __init__(self):
+        self.stats: Counter = Counter()
+
+    def cache_namespace(self, model: str) -> str:
+        """Model name used in response-cache keys, so backends never share entries."""
+        return f"{self.name}/{model}"
+
+    async def generate(self, prompt: str, model: str, response_schema: Optional[dict] = None) -> LLMResponse:
+        """Send one request; with ``response_schema``, ask for JSON matching it."""
+        raise NotImplementedError
+
+    async def aclose(self):
+        pass
+
+    def summary(self) -> str:
+        return (
+            f"{self.name} backend: {self.stats['calls']} calls, "
+            f"{self.stats['input_tokens']} input / {self.stats['output_tokens']} output tokens"
+        )
+
+
+def make_client(base_url: Optional[str] = None, **client_kwargs) -> genai.Client:
+    """Create a Gemini client whose async calls share one pooled connection pool.
+
+    Requests time out after LLM_REQUEST_TIMEOUT seconds and at most
+    LLM_MAX_CONNECTIONS keep-alive connections are opened, however many
+    calls are in flight.
+    """
+    http_client = httpx.AsyncClient(
+        limits=httpx.Limits(
+            max_connections=LLM_MAX_CONNECTIONS,
+            max_keepalive_connections=LLM_MAX_CONNECTIONS,
+        ),
+        timeout=LLM_REQUEST_TIMEOUT,
+    )
+    http_options = types.HttpOptions(
+        base_url=base_url,
+        timeout=int(LLM_REQUEST_TIMEOUT * 1000),
+        httpx_async_client=http_client,
+    )
+    return genai.Client(http_options=http_options, **client_kwargs)
+
+
+class GeminiBackend(LLMBackend):
+    """Gemini on Vertex AI through one pooled native-async client."""
+
+    name = "gemini"
+
+    def __init__(self, project: str, location: str):
+        super().__init__()
+        self.project = project
+        self.location = location
+        self._client = None
+
+    def cache_namespace(self, model: str) -> str:
+        # Plain model name keeps responses cached before backends existed valid
+        return model
+
+    def _get_client(self) -> genai.Client:
+        if self._client is None:
+            self._client = make_client(vertexai=True, project=self.project, location=self.location)
+        return self._client
+
+    async def generate(self, prompt: str, model: str, response_schema: Optional[dict] = None) -> LLMResponse:
+        config = None
+        if response_schema is not None:
+            config = types.GenerateContentConfig(
+                response_mime_type="application/json", response_schema=response_schema,
+            )
+        response = await self._get_client().aio.models.generate_content(
+            model=model, contents=prompt, config=config,
+        )
+        usage = response.usage_metadata
+        result = LLMResponse(
+            text=response.text or "",
+            input_tokens=(usage.prompt_token_count or 0) if usage else 0,
+            output_tokens=(usage.candidates_token_count or 0) if usage else 0,
+        )
+        self.stats["calls"] += 1
+        self.stats["input_tokens"] += result.input_tokens
+        self.stats["output_tokens"] += result.output_tokens
+        return result
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aio.aclose()
+            self._client = None
+
+
+class FakeRateLimitError(Exception):
+    """Stand-in for Gemini's 429 RESOURCE_EXHAUSTED error."""
+
+    code = 429
+
+    def __init__(self, retry_after: float):
+        super().__init__(
+            f"429 RESOURCE_EXHAUSTED. Quota exceeded (fake backend), retry in {retry_after:.1f}s"
+        )
+
+
+_AUTHOR_LINE = re.compile(r"^\s*(?:- )?\[([^\]\n]+?)(?: \(replying to [^)\n]*\))?\]: ?(.*)$", re.MULTILINE)
+_POST_SECTION_HEADER = re.compile(r"^=== Post (.+?) ===$", re.MULTILINE)
+_SUMMARY_TITLE_LINE = re.compile(r"^\d+\. \*\*(.+?)\*\* \(upvotes", re.MULTILINE)
+_SCHEMA_LINE = re.compile(r"^Schema: (.+)$", re.MULTILINE)
+_PATTERN_NAME_FIELD = re.compile(r'"name": "([^"]+)"')
+_TAXONOMY_LINE = re.compile(r"^\d+\. \*\*.+?\*\*: ", re.MULTILINE)
+_CLUSTER_HEADER = re.compile(r"^### Cluster (\d+) ", re.MULTILINE)
+
+_ROLES = (
+    "proposed_position", "reframed_debate", "provided_evidence",
+    "synthesized_views", "built_momentum", "other",
+)
+_PATTERN_NAMES = (
+    "Unifying Validation", "Iterative Problem Solving", "Nuanced Convergence", "Polarized Standoff",
+)
+
+
+class FakeBackend(LLMBackend):
+    """Deterministic local stand-in for Gemini, for offline runs and benchmarks.
+
+    Responses are canned but plausible: per-post analyses name agents that
+    actually appear in the prompt, chunk summaries keep ``[agent]: ...`` lines
+    so downstream prompts stay parseable, pattern clustering assigns the
+    listed titles and repair prompts are answered from the thread excerpt they carry.
+    Every random choice is seeded from the prompt and how many times it has
+    been sent, so a run is reproducible end to end.
+
+    Args:
+        latency: "fixed:S", "uniform:LO:HI", "lognormal:MEDIAN:SIGMA" or
+            "exponential:MEAN", in seconds.
+        latency_per_1k_tokens: extra seconds per 1k prompt tokens, so large
+            prompts take longer as they do on the real service.
+        rate_limit_rate: probability that any call fails with a 429.
+        server_rpm: simulated server quota; calls beyond it in a rolling
+            minute fail with a 429 carrying a retry hint (0 disables).
+        malformed_rate: probability that a JSON response is truncated, and
+            that any one post is left out of a multi-post response.
+        fenced_rate: probability that a JSON response is wrapped in a
+            markdown code fence (never when a response schema is set).
+    """
+
+    name = "fake"
+
+    def __init__(
+        self,
+        latency: str = "lognormal:1.5:0.6",
+        latency_per_1k_tokens: float = 0.0,
+        rate_limit_rate: float = 0.0,
+        server_rpm: int = 0,
+        malformed_rate: float = 0.0,
+        fenced_rate: float = 0.0,
+        seed: int = 0,
+    ):
+        super().__init__()
+        self.latency = latency
+        self.latency_per_1k_tokens = latency_per_1k_tokens
+        self.rate_limit_rate = rate_limit_rate
+        self.server_rpm = server_rpm
+        self.malformed_rate = malformed_rate
+        self.fenced_rate = fenced_rate
+        self.seed = seed
+        self._attempts: Counter = Counter()
+        self._accepted: deque[float] = deque()
+        # (marker, responder) pairs, checked in order against the prompt
+        self.responders = [
+            ("did not match the required JSON format", self._repair),
+            ("Identify 3-5 candidate consensus formation patterns", self._candidate_patterns),
+            ("Merge these candidate pattern lists", self._merged_patterns),
+            ("into a fixed taxonomy of consensus formation patterns", self._pattern_assignment),
+            ("Name and describe each numbered cluster", self._cluster_names),
+            ("analyze each thread on its own", self._multi_post_analysis),
+            ("Summarize this portion of a discussion thread", self._chunk_summary),
+            ("Merge these summaries of consecutive portions", self._chunk_summary),
+            ("**Comment Thread:**", self._post_analysis),
+            ("**New Comments:**", self._post_analysis),
+            ("consensus formation patterns that recur", self._pattern_clustering),
+        ]
+
+    def _rng(self, prompt: str) -> random.Random:
+        digest = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+        self._attempts[digest] += 1
+        return random.Random(f"{self.seed}:{digest}:{self._attempts[digest]}")
+
+    def _sample_latency(self, rng: random.Random) -> float:
+        kind, *params = self.latency.split(":")
+        values = [float(p) for p in params]
+        if kind == "fixed":
+            return values[0]
+        if kind == "uniform":
+            return rng.uniform(values[0], values[1])
+        if kind == "lognormal":
+            return rng.lognormvariate(0, values[1]) * values[0]
+        if kind == "exponential":
+            return rng.expovariate(1 / values[0])
+        raise ValueError(f"Unknown fake latency distribution: {self.latency}")
+
+    def _check_quota(self, rng: random.Random):
+        now = time.monotonic()
+        while self._accepted and self._accepted[0] < now - 60:
+            self._accepted.popleft()
+        if self.server_rpm and len(self._accepted) >= self.server_rpm:
+            raise FakeRateLimitError(retry_after=self._accepted[0] + 60 - now)
+        if rng.random() < self.rate_limit_rate:
+            raise FakeRateLimitError(retry_after=rng.uniform(1, 5))
+        self._accepted.append(now)
+
+    async def generate(self, prompt: str, model: str, response_schema: Optional[dict] = None) -> LLMResponse:
+        rng = self._rng(prompt)
+        latency = self._sample_latency(rng)
+        latency += self.latency_per_1k_tokens * estimate_tokens(prompt) / 1000
+        try:
+            self._check_quota(rng)
+        except FakeRateLimitError:
+            self.stats["rate_limited"] += 1
+            await asyncio.sleep(min(latency, 0.05))
+            raise
+        await asyncio.sleep(latency)
+
+        for marker, responder in self.responders:
+            if marker in prompt:
+                text = responder(prompt, rng)
+                break
+        else:
+            text = "OK"
+
+        if text.startswith(("{", "[")):
+            roll = rng.random()
+            if roll < self.malformed_rate:
+                self.stats["malformed"] += 1
+                text = text[: rng.randint(1, max(1, len(text) - 2))]
+            elif roll < self.malformed_rate + self.fenced_rate and response_schema is None:
+                self.stats["fenced"] += 1
+                text = f"```json\n{text}\n```"
+
+        response = LLMResponse(text, estimate_tokens(prompt), estimate_tokens(text))
+        self.stats["calls"] += 1
+        self.stats["input_tokens"] += response.input_tokens
+        self.stats["output_tokens"] += response.output_tokens
+        return response
+
+    def summary(self) -> str:
+        return (
+            f"{super().summary()}, {self.stats['rate_limited']} injected 429s, "
+            f"{self.stats['malformed']} malformed and {self.stats['fenced']} fenced responses"
+        )
+
+    @staticmethod
+    def _thread_lines(prompt: str) -> list[tuple[str, str]]:
+        return [
+            (author, text) for author, text in _AUTHOR_LINE.findall(prompt)
+            if not author.startswith("Chunk ")
+        ]
+
+    def _chunk_summary(self, prompt: str, rng: random.Random) -> str:
+        lines = self._thread_lines(prompt)
+        authors = list(dict.fromkeys(a for a, _ in lines))[:8]
+        points = [f"- [{a}]: argued {rng.choice(('for', 'against', 'about'))} the main point" for a in authors]
+        return "Summary of this portion of the thread:\n" + "\n".join(points)
+
+    def _post_analysis(self, prompt: str, rng: random.Random) -> str:
+        lines = self._thread_lines(prompt)
+        authors = list(dict.fromkeys(a for a, _ in lines)) or ["unknown"]
+        consensus = rng.choices(("YES", "PARTIAL", "NO"), weights=(43, 30, 27))[0]
+        drivers = rng.sample(authors[:10], k=min(len(authors[:10]), rng.randint(1, 3)))
+        quotes = [text[:120] for _, text in rng.sample(lines, k=min(2, len(lines)))]
+        return json.dumps({
+            "consensus": consensus,
+            "consensus_position": None if consensus == "NO" else "Participants broadly agreed with the post",
+            "formation_pattern": f"{consensus.title()} outcome: discussion led by {drivers[0]}.",
+            "key_moments": [f"{a} set the direction of the thread" for a in drivers[:2]],
+            "consensus_drivers": [
+                {"agent": a, "role": rng.choice(_ROLES), "description": f"{a} shaped the outcome"}
+                for a in drivers
+            ],
+            "evidence_quotes": quotes,
+        })
+
+    def _multi_post_analysis(self, prompt: str, rng: random.Random) -> str:
+        parts = _POST_SECTION_HEADER.split(prompt)
+        entries = []
+        for post_id, section in zip(parts[1::2], parts[2::2]):
+            if rng.random() < self.malformed_rate:
+                continue
+            entries.append({"post_id": post_id, **json.loads(self._post_analysis(section, rng))})
+        return json.dumps(entries)
+
+    @staticmethod
+    def _pattern_entry(name: str, count: int) -> dict:
+        return {
+            "name": name,
+            "description": f"Threads where consensus follows the {name.lower()} dynamic.",
+            "count": count,
+        }
+
+    def _candidate_patterns(self, prompt: str, rng: random.Random) -> str:
+        posts = len(_SUMMARY_TITLE_LINE.findall(prompt))
+        names = rng.sample(_PATTERN_NAMES, k=rng.randint(3, len(_PATTERN_NAMES)))
+        counts = [0] * len(names)
+        for _ in range(posts):
+            counts[rng.randrange(len(names))] += 1
+        return json.dumps({"patterns": [self._pattern_entry(n, c) for n, c in zip(names, counts)]})
+
+    def _merged_patterns(self, prompt: str, rng: random.Random) -> str:
+        candidates = prompt.split("Respond with ONLY")[0]  # Skip the example in the format spec
+        names = list(dict.fromkeys(_PATTERN_NAME_FIELD.findall(candidates)))[:5]
+        return json.dumps({"patterns": [self._pattern_entry(n, rng.randint(1, 100)) for n in names]})
+
+    def _pattern_assignment(self, prompt: str, rng: random.Random) -> str:
+        patterns = len(_TAXONOMY_LINE.findall(prompt))
+        posts = len(_SUMMARY_TITLE_LINE.findall(prompt))
+        return json.dumps({"assignments": [
+            {"post": i, "pattern": 0 if rng.random() < 0.05 else rng.randint(1, patterns)}
+            for i in range(1, posts + 1)
+        ]})
+
+    def _cluster_names(self, prompt: str, rng: random.Random) -> str:
+        clusters = [int(n) for n in _CLUSTER_HEADER.findall(prompt)]
+        names = rng.sample(_PATTERN_NAMES, k=len(_PATTERN_NAMES))
+        return json.dumps({"patterns": [
+            {"cluster": n, **self._pattern_entry(f"{names[i % len(names)]}{'' if i < len(names) else f' {i}'}", 0)}
+            for i, n in enumerate(clusters)
+        ]})
+
+    def _repair(self, prompt: str, rng: random.Random) -> str:
+        match = _SCHEMA_LINE.search(prompt)
+        schema = json.loads(match.group(1)) if match else {"type": "OBJECT"}
+        # Answer from the thread excerpt the prompt carries, where there is one
+        answer = json.loads(self._post_analysis(prompt, rng)) if self._thread_lines(prompt) else {}
+        return json.dumps({
+            name: answer[name] if name in answer else self._schema_value(s, rng)
+            for name, s in schema.get("properties", {}).items()
+        })
+
+    def _schema_value(self, schema: dict, rng: random.Random):
+        kind = schema.get("type")
+        if kind == "OBJECT":
+            return {name: self._schema_value(s, rng) for name, s in schema.get("properties", {}).items()}
+        if kind == "ARRAY":
+            return [self._schema_value(schema.get("items", {}), rng) for _ in range(rng.randint(1, 2))]
+        if kind == "STRING":
+            return rng.choice(schema["enum"]) if "enum" in schema else "Restated from the earlier answer"
+        if kind in ("INTEGER", "NUMBER"):
+            return rng.randint(0, 10)
+        return None
+
+    def _pattern_clustering(self, prompt: str, rng: random.Random) -> str:
+        titles = _SUMMARY_TITLE_LINE.findall(prompt)
+        buckets: dict[str, list[str]] = {name: [] for name in _PATTERN_NAMES}
+        for title in titles:
+            buckets[rng.choice(_PATTERN_NAMES)].append(title)
+        total = len(titles) or 1
+        return json.dumps({
+            "patterns": [
+                {
+                    "name": name,
+                    "description": f"Threads where consensus follows the {name.lower()} dynamic.",
+                    "post_titles": members,
+                    "count": len(members),
+                    "percentage": round(len(members) / total * 100, 1),
+                }
+                for name, members in buckets.items() if members
+            ],
+            "unclassified": [],
+        })
@@ -0,0 +1,131 @@
+import hashlib
+import os
+import sqlite3
+import time
+from typing import Optional
+from config import LLM_CACHE_PATH, LLM_CACHE_MAX_BYTES, LLM_CACHE_MAX_AGE_DAYS
+
+_cache = None
+
+
+class ResponseCache:
+    """Content-addressed on-disk cache of LLM responses, backed by SQLite.
+
+    Entries are keyed by a hash of the model, the prompt template version and
+    the full prompt text, so any change to the inputs is a guaranteed miss.
+    Entries older than ``max_age_seconds`` are dropped, and the least recently
+    used entries are evicted once the stored responses exceed ``max_bytes``.
+    """
+
+    def __init__(self, path: str, max_bytes: int, max_age_seconds: float):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.max_bytes = max_bytes
+        self.max_age_seconds = max_age_seconds
+        self.stats = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+
+        self._conn = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " key TEXT PRIMARY KEY,"
+            " model TEXT NOT NULL,"
+            " template_version TEXT NOT NULL,"
+            " response TEXT NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " created_at REAL NOT NULL,"
+            " accessed_at REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS responses_accessed_at ON responses (accessed_at)"
+        )
+        self._total_bytes = self._conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM responses"
+        ).fetchone()[0]
+        self.evict()
+
+    @staticmethod
+    def make_key(model: str, template_version: str, prompt: str) -> str:
+        digest = hashlib.sha256()
+        for part in (model, template_version, prompt):
+            digest.update(part.encode("utf-8"))
+            digest.update(b"\x00")
+        return digest.hexdigest()
+
+    def get(self, model: str, template_version: str, prompt: str) -> Optional[str]:
+        """Return the cached response text, or None on a miss."""
+        key = self.make_key(model, template_version, prompt)
+        row = self._conn.execute(
+            "SELECT response, created_at FROM responses WHERE key = ?", (key,)
+        ).fetchone()
+        now = time.time()
+        if row is None or now - row[1] > self.max_age_seconds:
+            self.stats["misses"] += 1
+            return None
+        self._conn.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+        self.stats["hits"] += 1
+        return row[0]
+
+    def put(self, model: str, template_version: str, prompt: str, response: str):
+        key = self.make_key(model, template_version, prompt)
+        size = len(response.encode("utf-8"))
+        now = time.time()
+        previous = self._conn.execute(
+            "SELECT size FROM responses WHERE key = ?", (key,)
+        ).fetchone()
+        self._conn.execute(
+            "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (key, model, template_version, response, size, now, now),
+        )
+        self._total_bytes += size - (previous[0] if previous else 0)
+        self.stats["stores"] += 1
+        if self._total_bytes > self.max_bytes:
+            self.evict()
+
+    def evict(self):
+        """Drop expired entries, then least recently used ones until under max_bytes."""
+        cutoff = time.time() - self.max_age_seconds
+        evicted = self._conn.execute(
+            "DELETE FROM responses WHERE created_at < ?", (cutoff,)
+        ).rowcount
+
+        if self._total_bytes > self.max_bytes or evicted:
+            self._total_bytes = self._conn.execute(
+                "SELECT COALESCE(SUM(size), 0) FROM responses"
+            ).fetchone()[0]
+
+        if self._total_bytes > self.max_bytes:
+            excess = self._total_bytes - self.max_bytes
+            victims = []
+            freed = 0
+            for key, size in self._conn.execute(
+                "SELECT key, size FROM responses ORDER BY accessed_at"
+            ):
+                victims.append((key,))
+                freed += size
+                if freed >= excess:
+                    break
+            self._conn.executemany("DELETE FROM responses WHERE key = ?", victims)
+            self._total_bytes -= freed
+            evicted += len(victims)
+
+        self.stats["evictions"] += evicted
+
+    def summary(self) -> str:
+        lookups = self.stats["hits"] + self.stats["misses"]
+        hit_rate = self.stats["hits"] / lookups if lookups else 0
+        return (
+            f"LLM cache: {self.stats['hits']} hits, {self.stats['misses']} misses "
+            f"({hit_rate:.1%} hit rate), {self.stats['stores']} stored, "
+            f"{self.stats['evictions']} evicted, {self._total_bytes / 2**20:.1f} MiB on disk"
+        )
+
+
+def get_cache() -> ResponseCache:
+    global _cache
+    if _cache is None:
+        _cache = ResponseCache(
+            LLM_CACHE_PATH,
+            max_bytes=LLM_CACHE_MAX_BYTES,
+            max_age_seconds=LLM_CACHE_MAX_AGE_DAYS * 86400,
+        )
+    return _cache
@@ -1,18 +1,97 @@
 import asyncio
 import json
-import re
-from typing import Optional
-from google import genai
-from config import GCP_PROJECT, GCP_LOCATION, GEMINI_MODEL
+import numpy as np
+from config import (
+    PATTERN_CLUSTERING,
+    PATTERN_CLUSTERS,
+    PATTERN_EXEMPLARS,
+    PATTERN_SHARD_SIZE,
+    PATTERN_REDUCE_FAN_IN,
+    PATTERN_ASSIGN_BATCH_SIZE,
+)
+from analysis.structured import generate_structured
+from analysis.text_clustering import vectorize_texts, kmeans, nearest_centroid, exemplars, cluster_terms
 
-_client = None
+PATTERN_CLUSTERING_PROMPT_VERSION = "pattern_clustering/1"
+PATTERN_SHARD_PROMPT_VERSION = "pattern_shard/1"
+PATTERN_REDUCE_PROMPT_VERSION = "pattern_reduce/1"
+PATTERN_ASSIGN_PROMPT_VERSION = "pattern_assign/1"
+PATTERN_NAMING_PROMPT_VERSION = "pattern_naming/1"
 
+PATTERN_CLUSTERING_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "patterns": {
+            "type": "ARRAY",
+            "items": {
+                "type": "OBJECT",
+                "properties": {
+                    "name": {"type": "STRING"},
+                    "description": {"type": "STRING"},
+                    "post_titles": {"type": "ARRAY", "items": {"type": "STRING"}},
+                    "count": {"type": "INTEGER"},
+                    "percentage": {"type": "NUMBER"},
+                },
+                "required": ["name", "description", "post_titles", "count", "percentage"],
+            },
+        },
+        "unclassified": {"type": "ARRAY", "items": {"type": "STRING"}},
+    },
+    "required": ["patterns", "unclassified"],
+}
 
-def _get_client():
-    global _client
-    if _client is None:
-        _client = genai.Client(vertexai=True, project=GCP_PROJECT, location=GCP_LOCATION)
-    return _client
+CANDIDATE_PATTERNS_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "patterns": {
+            "type": "ARRAY",
+            "items": {
+                "type": "OBJECT",
+                "properties": {
+                    "name": {"type": "STRING"},
+                    "description": {"type": "STRING"},
+                    "count": {"type": "INTEGER"},
+                },
+                "required": ["name", "description", "count"],
+            },
+        },
+    },
+    "required": ["patterns"],
+}
+
+PATTERN_ASSIGNMENT_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "assignments": {
+            "type": "ARRAY",
+            "items": {
+                "type": "OBJECT",
+                "properties": {"post": {"type": "INTEGER"}, "pattern": {"type": "INTEGER"}},
+                "required": ["post", "pattern"],
+            },
+        },
+    },
+    "required": ["assignments"],
+}
+
+PATTERN_NAMING_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "patterns": {
+            "type": "ARRAY",
+            "items": {
+                "type": "OBJECT",
+                "properties": {
+                    "cluster": {"type": "INTEGER"},
+                    "name": {"type": "STRING"},
+                    "description": {"type": "STRING"},
+                },
+                "required": ["cluster", "name", "description"],
+            },
+        },
+    },
+    "required": ["patterns"],
+}
 
 PATTERN_CLUSTERING_PROMPT = """\
 You have analyzed {count} discussion threads from Moltbook (an AI agent discussion platform) for consensus patterns.
@@ -44,24 +123,62 @@ Respond with ONLY valid JSON (no markdown fences):
 """
 
 
-def _extract_json(text: str) -> Optional[dict]:
-    try:
-        return json.loads(text)
-    except json.JSONDecodeError:
-        pass
-    match = re.search(r"```(?:json)?\s*\n?(.*?)\n?```", text, re.DOTALL)
-    if match:
-        try:
-            return json.loads(match.group(1))
-        except json.JSONDecodeError:
-            pass
-    match = re.search(r"\{.*\}", text, re.DOTALL)
-    if match:
-        try:
-            return json.loads(match.group(0))
-        except json.JSONDecodeError:
-            pass
-    return None
+PATTERN_SHARD_PROMPT = """\
+You have analyzed {count} discussion threads from Moltbook (an AI agent discussion platform) for consensus patterns. They are a sample of a larger set.
+
+Here are the per-post analysis summaries:
+
+{summaries}
+
+Identify 3-5 candidate consensus formation patterns in this sample. Name and describe each pattern in 2-3 sentences, and count how many of these posts fit it.
+
+Respond with ONLY valid JSON (no markdown fences):
+{{
+  "patterns": [
+    {{"name": "Pattern Name", "description": "2-3 sentence description of this pattern", "count": 0}}
+  ]
+}}
+"""
+
+PATTERN_REDUCE_PROMPT = """\
+Candidate consensus formation patterns were found independently in samples of discussion threads from Moltbook (an AI agent discussion platform). Merge these candidate pattern lists into a single taxonomy of 3-5 distinct patterns: combine candidates that describe the same dynamic, and add up their counts.
+
+{candidates}
+
+Respond with ONLY valid JSON (no markdown fences):
+{{
+  "patterns": [
+    {{"name": "Pattern Name", "description": "2-3 sentence description of this pattern", "count": 0}}
+  ]
+}}
+"""
+
+PATTERN_ASSIGN_PROMPT = """\
+Classify discussion threads from Moltbook (an AI agent discussion platform) into a fixed taxonomy of consensus formation patterns.
+
+Patterns:
+{patterns}
+
+Posts:
+{summaries}
+
+Assign each numbered post to the number of the pattern it fits best, or 0 if it fits none.
+
+Respond with ONLY valid JSON (no markdown fences):
+{{"assignments": [{{"post": 1, "pattern": 1}}]}}
+"""
+
+
+PATTERN_NAMING_PROMPT = """\
+Discussion threads from Moltbook (an AI agent discussion platform) were analyzed for consensus patterns and grouped into {count} clusters by the similarity of their analyses. Below are the most typical posts of each cluster.
+
+{clusters}
+
+Name and describe each numbered cluster as a consensus formation pattern: a short name, and a 2-3 sentence description of the dynamic its posts share. Give distinct clusters distinct names.
+
+Respond with ONLY valid JSON (no markdown fences):
+{{"patterns": [{{"cluster": 1, "name": "Pattern Name", "description": "2-3 sentence description of this pattern"}}]}}
+"""
 
 
 def _build_summaries_text(results: list[dict]) -> str:
@@ -76,27 +193,220 @@ def _build_summaries_text(results: list[dict]) -> str:
     return "\n".join(lines)
 
 
-async def classify_patterns(results: list[dict]) -> dict:
-    """Send all post analyses to Gemini for pattern clustering."""
-    # Only include posts that had comments analyzed
-    analyzed = [r for r in results if r.get("consensus") != "UNKNOWN"]
-
-    if not analyzed:
-        return {"patterns": [], "unclassified": []}
-
-    summaries_text = _build_summaries_text(analyzed)
+async def _classify_single(analyzed: list[dict]) -> dict:
     prompt = PATTERN_CLUSTERING_PROMPT.format(
         count=len(analyzed),
-        summaries=summaries_text,
+        summaries=_build_summaries_text(analyzed),
     )
-
-    response = await _get_client().aio.models.generate_content(
-        model=GEMINI_MODEL,
-        contents=prompt,
+    result = await generate_structured(
+        prompt, PATTERN_CLUSTERING_PROMPT_VERSION, PATTERN_CLUSTERING_SCHEMA
     )
-
-    result = _extract_json(response.text)
     if result is None:
         result = {"patterns": [], "unclassified": [], "error": "Failed to parse clustering response"}
+    return result
+
+
+async def _shard_patterns(shard: list[dict]) -> list[dict]:
+    """Candidate patterns of one shard of posts; empty if the response is unusable."""
+    prompt = PATTERN_SHARD_PROMPT.format(count=len(shard), summaries=_build_summaries_text(shard))
+    result = await generate_structured(prompt, PATTERN_SHARD_PROMPT_VERSION, CANDIDATE_PATTERNS_SCHEMA)
+    return result["patterns"] if result else []
+
+
+async def _merge_patterns(candidate_lists: list[list[dict]]) -> list[dict]:
+    candidates = "\n\n".join(
+        f"Sample {i}:\n{json.dumps(patterns, indent=2)}" for i, patterns in enumerate(candidate_lists, 1)
+    )
+    prompt = PATTERN_REDUCE_PROMPT.format(candidates=candidates)
+    result = await generate_structured(prompt, PATTERN_REDUCE_PROMPT_VERSION, CANDIDATE_PATTERNS_SCHEMA)
+    return result["patterns"] if result else []
+
+
+async def _reduce_patterns(candidate_lists: list[list[dict]], fan_in: int = PATTERN_REDUCE_FAN_IN) -> list[dict]:
+    """Merge shard pattern lists, up to fan_in per call and level by level, into one taxonomy."""
+    candidate_lists = [patterns for patterns in candidate_lists if patterns]
+    while len(candidate_lists) > 1:
+        groups = [candidate_lists[i:i + fan_in] for i in range(0, len(candidate_lists), fan_in)]
+        merged = iter(await asyncio.gather(*[_merge_patterns(group) for group in groups if len(group) > 1]))
+        candidate_lists = [next(merged) if len(group) > 1 else group[0] for group in groups]
+        candidate_lists = [patterns for patterns in candidate_lists if patterns]
+    return candidate_lists[0] if candidate_lists else []
+
+
+async def _assign_batch(taxonomy: list[dict], batch: list[dict]) -> dict[int, int]:
+    """Map each post's position in ``batch`` to a 1-based pattern number (0 = none)."""
+    patterns = "\n".join(
+        f"{i}. **{p['name']}**: {p['description']}" for i, p in enumerate(taxonomy, 1)
+    )
+    prompt = PATTERN_ASSIGN_PROMPT.format(patterns=patterns, summaries=_build_summaries_text(batch))
+    result = await generate_structured(prompt, PATTERN_ASSIGN_PROMPT_VERSION, PATTERN_ASSIGNMENT_SCHEMA)
+    assignments = {}
+    for entry in (result or {}).get("assignments", []):
+        if 1 <= entry["post"] <= len(batch) and 0 <= entry["pattern"] <= len(taxonomy):
+            assignments[entry["post"] - 1] = entry["pattern"]
+    return assignments
+
+
+async def _classify_sharded(analyzed: list[dict]) -> dict:
+    """Map-reduce clustering for result sets too large for one prompt.
+
+    Shards of PATTERN_SHARD_SIZE posts propose candidate patterns in
+    parallel, a tree of reduce calls merges them into one 3-5 pattern
+    taxonomy, and posts are then assigned to it by number in parallel
+    batches of PATTERN_ASSIGN_BATCH_SIZE. Every prompt and response stays
+    bounded by the shard and batch sizes, whatever the number of posts.
+    """
+    shards = [analyzed[i:i + PATTERN_SHARD_SIZE] for i in range(0, len(analyzed), PATTERN_SHARD_SIZE)]
+    taxonomy = await _reduce_patterns(await asyncio.gather(*[_shard_patterns(s) for s in shards]))
+    if not taxonomy:
+        return {"patterns": [], "unclassified": [], "error": "Failed to derive a pattern taxonomy"}
+
+    batches = [
+        analyzed[i:i + PATTERN_ASSIGN_BATCH_SIZE] for i in range(0, len(analyzed), PATTERN_ASSIGN_BATCH_SIZE)
+    ]
+    assigned = await asyncio.gather(*[_assign_batch(taxonomy, batch) for batch in batches])
+    members: list[list[str]] = [[] for _ in taxonomy]
+    unclassified = []
+    for batch, assignments in zip(batches, assigned):
+        for i, r in enumerate(batch):
+            pattern = assignments.get(i, 0)
+            if pattern:
+                members[pattern - 1].append(r["post_title"])
+            else:
+                unclassified.append(r["post_title"])
+
+    return {
+        "patterns": [
+            {
+                "name": p["name"],
+                "description": p["description"],
+                "post_titles": titles,
+                "count": len(titles),
+                "percentage": round(len(titles) / len(analyzed) * 100, 1),
+            }
+            for p, titles in zip(taxonomy, members)
+        ],
+        "unclassified": unclassified,
+    }
+
+
+def _local_clusters(analyzed: list[dict]) -> tuple[list[str], np.ndarray, list[int], list[np.ndarray]]:
+    """Cluster posts by their formation pattern and consensus position texts.
+
+    Returns the texts, each post's cluster label (-1 = unclassified), the
+    non-empty clusters and the indices of each cluster's most central posts.
+    """
+    texts = [f"{r.get('formation_pattern') or ''} {r.get('consensus_position') or ''}" for r in analyzed]
+    vectors = vectorize_texts(texts)
+    centroids, _ = kmeans(vectors, PATTERN_CLUSTERS)
+    labels, similarity = nearest_centroid(vectors, centroids)
+    clusters = [c for c in range(len(centroids)) if (labels == c).any()]
+    return texts, labels, clusters, exemplars(similarity, labels, len(centroids), PATTERN_EXEMPLARS)
+
 
+def _local_patterns(analyzed: list[dict], labels: np.ndarray, clusters: list[int], names: list[dict]) -> dict:
+    patterns = []
+    for cluster, entry in zip(clusters, names):
+        titles = [analyzed[i]["post_title"] for i in np.flatnonzero(labels == cluster)]
+        patterns.append({
+            "name": entry["name"],
+            "description": entry["description"],
+            "post_titles": titles,
+            "count": len(titles),
+            "percentage": round(len(titles) / len(analyzed) * 100, 1),
+        })
+    patterns.sort(key=lambda p: p["count"], reverse=True)
+    return {
+        "patterns": patterns,
+        "unclassified": [analyzed[i]["post_title"] for i in np.flatnonzero(labels < 0)],
+    }
+
+
+async def _classify_local(analyzed: list[dict]) -> dict:
+    """Cluster posts locally and let the LLM only name the clusters.
+
+    Each post's formation pattern and consensus position are embedded as
+    hashed TF-IDF vectors and grouped by k-means into PATTERN_CLUSTERS
+    clusters. One call names them from their PATTERN_EXEMPLARS most central
+    posts; every post is assigned to its nearest centroid locally, so the
+    assignment is deterministic and costs no tokens however many posts
+    there are.
+    """
+    _, labels, clusters, picked = _local_clusters(analyzed)
+
+    sections = []
+    for number, cluster in enumerate(clusters, 1):
+        members = [analyzed[i] for i in picked[cluster]]
+        sections.append(
+            f"### Cluster {number} ({int((labels == cluster).sum())} posts)\n\n{_build_summaries_text(members)}"
+        )
+    prompt = PATTERN_NAMING_PROMPT.format(count=len(clusters), clusters="\n".join(sections))
+    naming = await generate_structured(prompt, PATTERN_NAMING_PROMPT_VERSION, PATTERN_NAMING_SCHEMA)
+    named = {entry["cluster"]: entry for entry in (naming or {}).get("patterns", [])}
+    names = [
+        {
+            "name": named.get(number, {}).get("name", f"Pattern {number}"),
+            "description": named.get(number, {}).get("description", ""),
+        }
+        for number in range(1, len(clusters) + 1)
+    ]
+    result = _local_patterns(analyzed, labels, clusters, names)
+    if naming is None:
+        result["error"] = "Failed to parse pattern naming response"
+    return result
+
+
+def _clusterable(results: list[dict]) -> tuple[list[dict], int]:
+    """Results with an analyzed thread, and how many were resolved by triage instead.
+
+    Triaged results only carry a fixed triage note as their formation
+    pattern, so they would form a cluster of their own.
+    """
+    analyzed = [r for r in results if r.get("consensus") != "UNKNOWN"]
+    clusterable = [r for r in analyzed if "triage" not in r]
+    return clusterable, len(analyzed) - len(clusterable)
+
+
+def provisional_patterns(results: list[dict]) -> dict:
+    """Local clusters of the results so far, labelled by their typical terms.
+
+    Makes no LLM call, so it is cheap enough to refresh progressive
+    reports while Pass 1 is still running; the final report names the
+    clusters with classify_patterns.
+    """
+    analyzed, triaged = _clusterable(results)
+    if not analyzed:
+        return {"patterns": [], "unclassified": [], "triaged": triaged}
+    texts, labels, clusters, _ = _local_clusters(analyzed)
+    names = [
+        {"name": "", "description": f"Typical terms: {', '.join(terms)}." if terms else ""}
+        for terms in cluster_terms(texts, labels, clusters)
+    ]
+    result = _local_patterns(analyzed, labels, clusters, names)
+    for number, pattern in enumerate(result["patterns"], 1):
+        pattern["name"] = f"Provisional cluster {number}"
+    result["method"] = "provisional"
+    result["triaged"] = triaged
     return result
+
+
+async def classify_patterns(results: list[dict]) -> dict:
+    """Send all post analyses to Gemini for pattern clustering.
+
+    With PATTERN_CLUSTERING="local" posts are clustered locally and the
+    LLM only names the clusters. With "llm", up to PATTERN_SHARD_SIZE posts
+    are clustered in a single call and larger result sets go through the
+    sharded map-reduce mode. The result's "method" records which one ran:
+    "local", "llm" or "sharded", and "triaged" how many posts resolved by
+    triage were left out.
+    """
+    # Only include posts whose comments were analyzed by the LLM
+    analyzed, triaged = _clusterable(results)
+
+    if not analyzed:
+        return {"patterns": [], "unclassified": [], "triaged": triaged}
+    if PATTERN_CLUSTERING == "local":
+        return {**await _classify_local(analyzed), "method": "local", "triaged": triaged}
+    if len(analyzed) <= PATTERN_SHARD_SIZE:
+        return {**await _classify_single(analyzed), "method": "llm", "triaged": triaged}
+    return {**await _classify_sharded(analyzed), "method": "sharded", "triaged": triaged}
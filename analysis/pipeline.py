@@ -0,0 +1,46 @@
+import asyncio
+from typing import Awaitable, Callable, Iterable, Optional, TypeVar
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+_DONE = object()
+
+
+async def run_pipeline(
+    items: Iterable[T],
+    process: Callable[[T], Awaitable[R]],
+    sink: Callable[[T, R], None],
+    workers: int,
+    queue_size: Optional[int] = None,
+):
+    """Stream items through a fixed pool of workers.
+
+    A producer pulls from ``items`` lazily into a bounded queue, ``workers``
+    tasks take items off it and ``sink`` receives each result as soon as its
+    item completes. Only the queued and in-flight items are ever held in
+    memory, so a generator over the whole dataset runs in memory bounded by
+    the concurrency rather than the dataset size.
+
+    If the producer, a worker or the sink raises, the remaining tasks are
+    cancelled and the exception propagates.
+    """
+    queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size or 2 * workers)
+
+    async def produce():
+        for item in items:
+            await queue.put(item)
+        for _ in range(workers):
+            await queue.put(_DONE)
+
+    async def work():
+        while True:
+            item = await queue.get()
+            if item is _DONE:
+                return
+            sink(item, await process(item))
+
+    async with asyncio.TaskGroup() as group:
+        group.create_task(produce())
+        for _ in range(workers):
+            group.create_task(work())
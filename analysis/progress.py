@@ -0,0 +1,106 @@
+import time
+from collections import Counter
+from typing import Optional
+from tqdm import tqdm
+from config import REPORT_EVERY_POSTS, REPORT_EVERY_SECONDS, STABILITY_TOLERANCE, STABILITY_REPORTS
+from analysis.agent_influence import InfluenceAggregator
+from analysis.pattern_classifier import provisional_patterns
+from report.generator import generate_report
+
+CONSENSUS_LEVELS = ("YES", "PARTIAL", "NO", "UNKNOWN")
+TOP_DRIVERS = 5
+
+
+class ProgressiveReport:
+    """Keep the Pass 2/3 aggregates current as Pass 1 results arrive.
+
+    Each result updates the consensus counts and the Pass 3
+    InfluenceAggregator at once, replacing the post's earlier result if
+    any. Every ``every_posts`` results or ``every_seconds`` seconds,
+    whichever comes first, the Markdown report is rewritten from the
+    results so far, with provisional local pattern clusters, and the
+    headline metrics (consensus shares and the top-5 drivers' share of
+    events) are compared with the previous report. Once they have moved by
+    at most STABILITY_TOLERANCE for STABILITY_REPORTS reports in a row,
+    ``stable`` is set.
+    """
+
+    def __init__(
+        self,
+        results: dict[str, dict],
+        total_posts: int,
+        dataset_stats: dict,
+        every_posts: int = REPORT_EVERY_POSTS,
+        every_seconds: float = REPORT_EVERY_SECONDS,
+    ):
+        self.results: dict[str, dict] = {}
+        self.total_posts = total_posts
+        self.dataset_stats = dataset_stats
+        self.every_posts = every_posts
+        self.every_seconds = every_seconds
+        self.consensus: Counter = Counter()
+        self.influence = InfluenceAggregator()
+        self.reports = 0
+        self.stable_reports = 0
+        self._since_report = 0
+        self._last_report = time.monotonic()
+        self._last_metrics: Optional[dict[str, float]] = None
+        for post_id, result in results.items():
+            self._apply(post_id, result)
+
+    @property
+    def stable(self) -> bool:
+        return self.stable_reports >= STABILITY_REPORTS
+
+    def _apply(self, post_id: str, result: dict):
+        previous = self.results.get(post_id)
+        if previous is not None:
+            self.consensus[previous.get("consensus", "UNKNOWN")] -= 1
+        self.consensus[result.get("consensus", "UNKNOWN")] += 1
+        self.influence.add(result, post_id)
+        self.results[post_id] = result
+
+    def add(self, post_id: str, result: dict):
+        """Record one finished result, writing a report when one is due."""
+        self._apply(post_id, result)
+        self._since_report += 1
+        if self._since_report >= self.every_posts or time.monotonic() - self._last_report >= self.every_seconds:
+            self.write()
+
+    def metrics(self, influence_data: dict) -> dict[str, float]:
+        total = sum(self.consensus.values()) or 1
+        return {
+            **{level: self.consensus[level] / total for level in CONSENSUS_LEVELS},
+            "top_drivers": influence_data["concentration"][f"top_{TOP_DRIVERS}"]["share"],
+        }
+
+    def write(self):
+        """Rewrite the report from the results so far and update the stability count."""
+        influence_data = self.influence.summary(bootstrap_samples=0)
+        metrics = self.metrics(influence_data)
+        previous, self._last_metrics = self._last_metrics, metrics
+        if previous is not None:
+            drift = max(abs(metrics[k] - previous[k]) for k in metrics)
+            self.stable_reports = self.stable_reports + 1 if drift <= STABILITY_TOLERANCE else 0
+        self.reports += 1
+        self._since_report = 0
+        self._last_report = time.monotonic()
+
+        results = list(self.results.values())
+        progress = {
+            "analyzed": len(results),
+            "total": self.total_posts,
+            "stable_reports": self.stable_reports,
+        }
+        generate_report(
+            results,
+            provisional_patterns(results),
+            influence_data,
+            {**self.dataset_stats, "progress": progress},
+        )
+        tqdm.write(
+            f"Progress report {self.reports}: {len(results)}/{self.total_posts} posts, "
+            + ", ".join(f"{level} {metrics[level]:.0%}" for level in CONSENSUS_LEVELS[:3])
+            + f", top {TOP_DRIVERS} drivers {metrics['top_drivers']:.0%} of events"
+            + (f" (stable for {self.stable_reports} reports)" if self.stable_reports else "")
+        )
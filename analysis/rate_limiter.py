@@ -0,0 +1,204 @@
+import asyncio
+import random
+import re
+import time
+from collections import Counter, deque
+from typing import Awaitable, Callable, Optional, TypeVar
+from config import RATE_LIMIT_RPM, RATE_LIMIT_TPM, LLM_MAX_CONCURRENCY, LLM_MAX_RETRIES
+
+T = TypeVar("T")
+
+_limiter = None
+
+_RETRY_DELAY_PATTERNS = (
+    re.compile(r"retryDelay['\"]?\s*[:=]\s*['\"]?(\d+(?:\.\d+)?)s"),
+    re.compile(r"retry in (\d+(?:\.\d+)?)\s*s", re.IGNORECASE),
+)
+
+
+def is_rate_limit_error(error: Exception) -> bool:
+    return getattr(error, "code", None) == 429 or (
+        "429" in str(error) or "RESOURCE_EXHAUSTED" in str(error)
+    )
+
+
+def retry_after_seconds(error: Exception) -> Optional[float]:
+    """Extract the server's retry hint from a 429 error, if it sent one."""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if headers is not None:
+        try:
+            return float(headers.get("retry-after"))
+        except (TypeError, ValueError):
+            pass
+    message = str(error)
+    for pattern in _RETRY_DELAY_PATTERNS:
+        match = pattern.search(message)
+        if match:
+            return float(match.group(1))
+    return None
+
+
+class RateLimiter:
+    """Shared request/token budget for every LLM call in the run.
+
+    Two token buckets refill at ``rpm`` requests and ``tpm`` tokens per
+    minute, each holding at most ``burst_seconds`` worth of budget so calls
+    are spread out rather than fired in bursts. On top of the buckets, the
+    number of in-flight calls follows AIMD: each success widens the window
+    by ~1 per window's worth of calls, and each 429 halves it and pauses all
+    callers for the server's retry-after hint (or an exponential backoff).
+
+    Callers pass a ``priority``; while a higher-priority call is waiting,
+    lower-priority calls don't start, so work that is already underway
+    finishes before new work takes its budget. Set ``priority_lanes=False``
+    to ignore priorities.
+    """
+
+    def __init__(
+        self,
+        rpm: float,
+        tpm: float,
+        max_concurrency: int,
+        max_retries: int = LLM_MAX_RETRIES,
+        burst_seconds: float = 10.0,
+        priority_lanes: bool = True,
+    ):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.concurrency = float(max_concurrency)
+        self.priority_lanes = priority_lanes
+
+        self._request_capacity = max(1.0, rpm * burst_seconds / 60)
+        self._token_capacity = max(1.0, tpm * burst_seconds / 60)
+        self._requests = self._request_capacity
+        self._tokens = self._token_capacity
+        self._refilled_at = time.monotonic()
+        self._paused_until = 0.0
+        self._in_flight = 0
+        self._wakeup = asyncio.Event()
+        self._waiting: Counter = Counter()  # priority -> callers waiting in acquire
+        self._history: deque[tuple[float, int]] = deque()
+        self.stats = {"calls": 0, "rate_limited": 0, "tokens": 0}
+
+    def _refill(self, now: float):
+        elapsed = now - self._refilled_at
+        self._refilled_at = now
+        self._requests = min(self._request_capacity, self._requests + elapsed * self.rpm / 60)
+        self._tokens = min(self._token_capacity, self._tokens + elapsed * self.tpm / 60)
+
+    def _wait_time(self, tokens: int, now: float) -> Optional[float]:
+        """Seconds until a call of this size may start; None means wait for a release."""
+        if now < self._paused_until:
+            return self._paused_until - now
+        if self._in_flight >= max(1, int(self.concurrency)):
+            return None
+        # A prompt larger than the bucket may start once the bucket is full
+        needed_tokens = min(tokens, self._token_capacity) - self._tokens
+        return max(
+            0.0,
+            (1 - self._requests) * 60 / self.rpm,
+            needed_tokens * 60 / self.tpm,
+        )
+
+    def _outranked(self, priority: int) -> bool:
+        return self.priority_lanes and any(
+            p > priority and n > 0 for p, n in self._waiting.items()
+        )
+
+    def _notify(self):
+        """Wake every waiter; each re-checks the budget."""
+        self._wakeup.set()
+        self._wakeup = asyncio.Event()
+
+    async def acquire(self, tokens: int, priority: int = 0):
+        self._waiting[priority] += 1
+        try:
+            while True:
+                now = time.monotonic()
+                self._refill(now)
+                wait = self._wait_time(tokens, now)
+                if wait == 0 and self._outranked(priority):
+                    wait = None
+                if wait == 0:
+                    break
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=wait)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            self._waiting[priority] -= 1
+
+        # Lower lanes held back by this call may now fit
+        if self.priority_lanes and any(n > 0 for n in self._waiting.values()):
+            self._notify()
+
+        self._requests -= 1
+        self._tokens -= tokens
+        self._in_flight += 1
+        self._history.append((now, tokens))
+        self.stats["calls"] += 1
+        self.stats["tokens"] += tokens
+
+    def release(self, succeeded: bool = True, retry_after: Optional[float] = None):
+        """Return a slot; pass retry_after when the call was rate limited."""
+        self._in_flight -= 1
+        if succeeded:
+            self.concurrency = min(self.max_concurrency, self.concurrency + 1 / self.concurrency)
+        elif retry_after is not None:
+            self.stats["rate_limited"] += 1
+            self.concurrency = max(1.0, self.concurrency / 2)
+            self._paused_until = max(self._paused_until, time.monotonic() + retry_after)
+        self._notify()
+
+    async def call(
+        self, make_request: Callable[[], Awaitable[T]], tokens: int, priority: int = 0
+    ) -> T:
+        """Run make_request within the budget, retrying on 429/RESOURCE_EXHAUSTED."""
+        for attempt in range(self.max_retries):
+            await self.acquire(tokens, priority)
+            succeeded = False
+            retry_after = None
+            try:
+                result = await make_request()
+                succeeded = True
+                return result
+            except Exception as e:
+                if not is_rate_limit_error(e):
+                    raise
+                retry_after = retry_after_seconds(e)
+                if retry_after is None:
+                    retry_after = min(60.0, 2.0 * 2 ** attempt) * random.uniform(0.8, 1.2)
+                if attempt == self.max_retries - 1:
+                    raise
+            finally:
+                self.release(succeeded, retry_after)
+        raise RuntimeError("unreachable")
+
+    def live_rates(self) -> dict:
+        """Requests and tokens started over the last minute, plus the AIMD window."""
+        cutoff = time.monotonic() - 60
+        while self._history and self._history[0][0] < cutoff:
+            self._history.popleft()
+        return {
+            "rpm": len(self._history),
+            "tpm": sum(t for _, t in self._history),
+            "concurrency": self.concurrency,
+            "in_flight": self._in_flight,
+        }
+
+    def status(self) -> str:
+        rates = self.live_rates()
+        return (
+            f"{rates['rpm']} req/min, {rates['tpm']} tok/min, "
+            f"window {rates['concurrency']:.1f}, 429s {self.stats['rate_limited']}"
+        )
+
+
+def get_rate_limiter() -> RateLimiter:
+    global _limiter
+    if _limiter is None:
+        _limiter = RateLimiter(RATE_LIMIT_RPM, RATE_LIMIT_TPM, LLM_MAX_CONCURRENCY)
+    return _limiter
@@ -0,0 +1,228 @@
+import json
+import re
+from collections import Counter
+from typing import Optional
+from config import GEMINI_MODEL, REPAIR_CONTEXT_TOKENS
+from analysis.llm import generate
+from data.compaction import truncate_text
+from data.tokens import estimate_tokens
+
+REPAIR_PROMPT_VERSION = "repair/3"
+
+REPAIR_PROMPT = """\
+Your previous answer was cut off or did not match the required JSON format. This is what it contained:
+
+{response}
+
+Excerpt of the request it answered:
+
+{context}
+
+Return ONLY a JSON object (no markdown fences) with these fields, keeping the meaning of your previous answer: {fields}
+Only name agents from the excerpt and quote text that appears in it or in your previous answer.
+Schema: {schema}
+"""
+
+# A formatted comment line: "[author]: text" or "[author (replying to parent)]: text"
+_THREAD_LINE = re.compile(r"^\s*(?:- )?\[([^\]\n]+?)(?: \(replying to [^)\n]*\))?\]: ?.*$", re.MULTILINE)
+
+# Python type of a whole response for each top-level schema type
+_SCHEMA_TYPES = {"OBJECT": dict, "ARRAY": list}
+
+# Counts across the run: responses, parse_failures, repaired, unrecoverable, repair_tokens,
+# failed_call_tokens (prompt and response tokens of the calls that needed a repair)
+stats: Counter = Counter()
+
+
+def extract_json(text: str):
+    """Extract JSON from LLM response, handling markdown fences."""
+    # Try direct parse first
+    try:
+        return json.loads(text)
+    except json.JSONDecodeError:
+        pass
+
+    # Try extracting from markdown code fence
+    match = re.search(r"```(?:json)?\s*\n?(.*?)\n?```", text, re.DOTALL)
+    if match:
+        try:
+            return json.loads(match.group(1))
+        except json.JSONDecodeError:
+            pass
+
+    # Try finding JSON object, then JSON array, in text
+    for pattern in (r"\{.*\}", r"\[.*\]"):
+        match = re.search(pattern, text, re.DOTALL)
+        if match:
+            try:
+                return json.loads(match.group(0))
+            except json.JSONDecodeError:
+                pass
+
+    return None
+
+
+def salvage_json(text: str):
+    """Parse the complete leading members of a truncated JSON object or array.
+
+    Cuts the text after the last top-level member that was fully written
+    and closes the outer bracket, so a response that ran out of tokens
+    still yields the fields it finished.
+    """
+    starts = [i for i in (text.find("{"), text.find("[")) if i >= 0]
+    if not starts:
+        return None
+    start = min(starts)
+    closer = "}" if text[start] == "{" else "]"
+    cut = start + 1  # end of the last complete top-level member
+    depth = 0
+    in_string = escaped = False
+    for i in range(start, len(text)):
+        ch = text[i]
+        if in_string:
+            if escaped:
+                escaped = False
+            elif ch == "\\":
+                escaped = True
+            elif ch == '"':
+                in_string = False
+        elif ch == '"':
+            in_string = True
+        elif ch in "{[":
+            depth += 1
+        elif ch in "}]":
+            depth -= 1
+            if depth == 0:
+                cut = i  # the outer value was complete after all
+                break
+            if depth == 1:
+                cut = i + 1
+        elif ch == "," and depth == 1:
+            cut = i
+    try:
+        return json.loads(text[start:cut] + closer)
+    except json.JSONDecodeError:
+        return None
+
+
+def repair_context(prompt: str, budget: int = REPAIR_CONTEXT_TOKENS) -> str:
+    """A bounded excerpt of a request to ground its repair prompt in.
+
+    For a prompt with a comment thread (or chunk summaries quoting one):
+    the agents who appear in it, most active first, then its comment
+    lines, head and tail, in about ``budget`` tokens. Other prompts are
+    cut to their head and tail.
+    """
+    matches = list(_THREAD_LINE.finditer(prompt))
+    if not matches:
+        return truncate_text(prompt, budget)
+    authors = Counter(m.group(1) for m in matches if not m.group(1).startswith("Chunk "))
+    agents = truncate_text(", ".join(a for a, _ in authors.most_common()), budget // 4)
+    lines = "\n".join(m.group(0).strip() for m in matches)
+    return f"Agents: {agents}\n\n{truncate_text(lines, budget - estimate_tokens(agents))}"
+
+
+def _matches(value, schema: dict) -> bool:
+    if value is None:
+        return schema.get("nullable", False)
+    kind = schema.get("type")
+    if kind == "OBJECT":
+        return isinstance(value, dict) and not invalid_fields(value, schema)
+    if kind == "ARRAY":
+        return isinstance(value, list) and all(_matches(v, schema.get("items", {})) for v in value)
+    if kind == "STRING":
+        return isinstance(value, str) and value in schema.get("enum", (value,))
+    if kind == "INTEGER":
+        return isinstance(value, int) and not isinstance(value, bool)
+    if kind == "NUMBER":
+        return isinstance(value, (int, float)) and not isinstance(value, bool)
+    return True
+
+
+def invalid_fields(data, schema: dict) -> list[str]:
+    """Top-level fields of an OBJECT schema that are missing or don't match it."""
+    properties = schema.get("properties", {})
+    if not isinstance(data, dict):
+        return list(schema.get("required", properties))
+    return [
+        name for name, field_schema in properties.items()
+        if (name in data and not _matches(data[name], field_schema))
+        or (name not in data and name in schema.get("required", ()))
+    ]
+
+
+def validate(data, schema: dict) -> bool:
+    return _matches(data, schema)
+
+
+async def generate_structured(
+    prompt: str,
+    template_version: str,
+    schema: dict,
+    model: str = GEMINI_MODEL,
+    priority: int = 0,
+) -> Optional[dict | list]:
+    """Request schema-constrained JSON and return it parsed and validated.
+
+    The schema is passed to the model as its response schema. A response
+    that still fails to parse is salvaged up to its last complete field.
+    For an OBJECT schema, only the fields that are missing or invalid are
+    then re-asked with a short repair prompt: the partial answer, a
+    REPAIR_CONTEXT_TOKENS excerpt of the request (its agents and comment
+    lines) to ground the answer in, and a schema covering just those
+    fields, instead of re-sending the whole thread. ARRAY responses are
+    returned as salvaged; callers validate and retry their entries
+    individually.
+
+    Returns None when the response can't be recovered.
+    """
+    text = await generate(prompt, template_version, model, priority, response_schema=schema)
+    stats["responses"] += 1
+    data = extract_json(text)
+    if not isinstance(data, _SCHEMA_TYPES.get(schema.get("type"), object)):
+        # Also when extract_json only found a complete inner array or object
+        data = salvage_json(text)
+    if validate(data, schema):
+        return data
+
+    stats["parse_failures"] += 1
+    if schema.get("type") != "OBJECT":
+        return data if isinstance(data, list) else None
+
+    fields = invalid_fields(data, schema)
+    partial = {k: v for k, v in data.items() if k not in fields} if isinstance(data, dict) else {}
+    repair_schema = {
+        "type": "OBJECT",
+        "properties": {name: schema["properties"][name] for name in fields},
+        "required": fields,
+    }
+    repair_prompt = REPAIR_PROMPT.format(
+        response=text[:4000],
+        context=repair_context(prompt),
+        fields=", ".join(fields),
+        schema=json.dumps(repair_schema),
+    )
+    repair_text = await generate(
+        repair_prompt, REPAIR_PROMPT_VERSION, model, priority, response_schema=repair_schema
+    )
+    stats["repair_tokens"] += estimate_tokens(repair_prompt) + estimate_tokens(repair_text)
+    stats["failed_call_tokens"] += estimate_tokens(prompt) + estimate_tokens(text)
+    repair = extract_json(repair_text)
+    if isinstance(repair, dict):
+        partial.update({name: repair[name] for name in fields if name in repair})
+    if validate(partial, schema):
+        stats["repaired"] += 1
+        return partial
+    stats["unrecoverable"] += 1
+    return None
+
+
+def summary() -> str:
+    responses = stats["responses"]
+    rate = stats["parse_failures"] / responses if responses else 0.0
+    share = stats["repair_tokens"] / stats["failed_call_tokens"] if stats["failed_call_tokens"] else 0.0
+    return (
+        f"Structured output: {responses} responses, {stats['parse_failures']} failed validation "
+        f"({rate:.1%}), {stats['repaired']} repaired with ~{stats['repair_tokens']} repair tokens "
+        f"({share:.0%} of the failed calls' tokens), {stats['unrecoverable']} unrecoverable"
+    )
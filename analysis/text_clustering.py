@@ -0,0 +1,137 @@
+import re
+import zlib
+from collections import Counter
+import numpy as np
+import pandas as pd
+
+# Hashed TF-IDF: terms are hashed into HASH_BUCKETS buckets for document
+# frequencies, then signed-projected into VECTOR_DIMS dense dimensions.
+HASH_BUCKETS = 1 << 20
+VECTOR_DIMS = 256
+
+_WORD = re.compile(r"[a-z0-9']+")
+_STOPWORDS = frozenset(
+    "a an and are as at be but by for from had has have in into is it its of on or so that the "
+    "their them then there these they this to was were which while who with".split()
+)
+
+
+def _terms(text: str) -> list[str]:
+    words = [w for w in _WORD.findall(text.lower()) if w not in _STOPWORDS]
+    return words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+
+def vectorize_texts(texts: list[str], dims: int = VECTOR_DIMS) -> np.ndarray:
+    """Embed texts as L2-normalized hashed TF-IDF vectors of words and word bigrams.
+
+    Each distinct term is hashed once; term frequencies, document
+    frequencies and the signed projection into ``dims`` dimensions are then
+    computed with array operations over every (text, term) pair at once.
+    Texts without any terms get a zero vector.
+    """
+    terms_per_text = [_terms(t or "") for t in texts]
+    lengths = np.fromiter((len(t) for t in terms_per_text), dtype=np.int64, count=len(texts))
+    docs = np.repeat(np.arange(len(texts)), lengths)
+    codes, vocabulary = pd.factorize(pd.Series([t for terms in terms_per_text for t in terms], dtype=object))
+    hashes = np.fromiter((zlib.crc32(t.encode("utf-8")) for t in vocabulary), dtype=np.int64, count=len(vocabulary))
+    term_hash = hashes[codes] if len(codes) else np.zeros(0, dtype=np.int64)
+
+    # Term frequency per (text, bucket) pair, and in how many texts each bucket occurs
+    buckets = term_hash % HASH_BUCKETS
+    pairs, tf = np.unique(docs * HASH_BUCKETS + buckets, return_counts=True)
+    pair_docs, pair_buckets = pairs // HASH_BUCKETS, pairs % HASH_BUCKETS
+    df = np.bincount(pair_buckets, minlength=HASH_BUCKETS)
+    idf = np.log((1 + len(texts)) / (1 + df[pair_buckets])) + 1
+    weights = (1 + np.log(tf)) * idf
+
+    # Signed projection: the bucket picks a dimension, a higher hash bit the sign
+    pair_hash = (pair_buckets * 2654435761) & 0xFFFFFFFF
+    signs = np.where(pair_hash >> 31, -1.0, 1.0)
+    cells = pair_docs * dims + pair_buckets % dims
+    vectors = np.bincount(cells, weights=weights * signs, minlength=len(texts) * dims)
+    vectors = vectors.reshape(len(texts), dims).astype(np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return np.divide(vectors, norms, out=np.zeros_like(vectors), where=norms > 0)
+
+
+def kmeans(
+    vectors: np.ndarray, k: int, iterations: int = 50, seed: int = 0
+) -> tuple[np.ndarray, np.ndarray]:
+    """Spherical k-means (cosine similarity) with k-means++ seeding.
+
+    Returns ``(centroids, labels)``; zero vectors are labelled -1. Seeded,
+    so the same vectors always give the same clusters.
+    """
+    rng = np.random.default_rng(seed)
+    valid = np.flatnonzero(np.abs(vectors).sum(axis=1) > 0)
+    points = vectors[valid]
+    k = min(k, len(points))
+    labels = np.full(len(vectors), -1, dtype=np.int64)
+    if k == 0:
+        return np.zeros((0, vectors.shape[1]), dtype=vectors.dtype), labels
+
+    centroids = [points[rng.integers(len(points))]]
+    distance = 1 - points @ centroids[0]
+    for _ in range(1, k):
+        weights = np.clip(distance, 0, None).astype(np.float64) ** 2
+        total = weights.sum()
+        choice = rng.choice(len(points), p=weights / total) if total > 0 else rng.integers(len(points))
+        centroids.append(points[choice])
+        distance = np.minimum(distance, 1 - points @ points[choice])
+    centroids = np.stack(centroids)
+
+    assigned = np.full(len(points), -1, dtype=np.int64)
+    for _ in range(iterations):
+        new = (points @ centroids.T).argmax(axis=1)
+        if np.array_equal(new, assigned):
+            break
+        assigned = new
+        members = np.zeros((len(points), k), dtype=points.dtype)
+        members[np.arange(len(points)), assigned] = 1
+        sums = members.T @ points
+        norms = np.linalg.norm(sums, axis=1, keepdims=True)
+        # An emptied cluster keeps its previous centroid
+        centroids = np.where(norms > 0, sums / np.where(norms > 0, norms, 1), centroids)
+    labels[valid] = assigned
+    return centroids, labels
+
+
+def nearest_centroid(
+    vectors: np.ndarray, centroids: np.ndarray, min_similarity: float = 0.0
+) -> tuple[np.ndarray, np.ndarray]:
+    """Label each vector with its most similar centroid, or -1 below min_similarity.
+
+    Returns ``(labels, similarities)``.
+    """
+    if len(centroids) == 0:
+        return np.full(len(vectors), -1, dtype=np.int64), np.zeros(len(vectors), dtype=vectors.dtype)
+    similarity = vectors @ centroids.T
+    labels = similarity.argmax(axis=1)
+    best = similarity[np.arange(len(vectors)), labels]
+    return np.where(best > min_similarity, labels, -1), best
+
+
+def exemplars(similarities: np.ndarray, labels: np.ndarray, k: int, per_cluster: int) -> list[np.ndarray]:
+    """Indices of the ``per_cluster`` members closest to each of the k centroids."""
+    result = []
+    for cluster in range(k):
+        members = np.flatnonzero(labels == cluster)
+        result.append(members[np.argsort(-similarities[members], kind="stable")[:per_cluster]])
+    return result
+
+
+def cluster_terms(texts: list[str], labels: np.ndarray, clusters: list[int], n: int = 5) -> list[list[str]]:
+    """The ``n`` terms most over-represented in each cluster's texts relative to all texts."""
+    term_sets = [set(_terms(t or "")) for t in texts]
+    overall = Counter(t for terms in term_sets for t in terms)
+    result = []
+    for cluster in clusters:
+        members = np.flatnonzero(labels == cluster)
+        inside = Counter(t for i in members for t in term_sets[i])
+        lift = {
+            t: count / len(members) - overall[t] / len(texts)
+            for t, count in inside.items() if count > 1 or len(members) == 1
+        }
+        ranked = sorted(lift.items(), key=lambda x: (-x[1], x[0]))
+        result.append([t for t, score in ranked[:n] if score > 0])
+    return result
@@ -0,0 +1,147 @@
+import re
+from collections import Counter
+from operator import attrgetter, itemgetter
+from typing import Optional
+import numpy as np
+import pandas as pd
+from config import (
+    GEMINI_MODEL,
+    TRIAGE_MEDIUM_MODEL,
+    TRIAGE_MEDIUM_MAX_COMMENTS,
+    TRIAGE_MEDIUM_MAX_DEPTH,
+)
+from data.comment_parser import get_post_comments, thread_fingerprint
+
+TRIVIAL = "trivial"
+MEDIUM = "medium"
+COMPLEX = "complex"
+
+# Threads this small, or this repetitive, are resolved without the LLM
+TRIVIAL_MAX_COMMENTS = 2
+TRIVIAL_DUPLICATE_RATIO = 0.8
+
+AGREE_PATTERN = re.compile(
+    r"\b(?:i agree|agreed|exactly|well said|good point|great point|you're right|you are right"
+    r"|absolutely|this is right|same here|seconded|i concur|spot on)\b|\+1"
+)
+DISAGREE_PATTERN = re.compile(
+    r"\b(?:i disagree|disagree|not true|that's wrong|you're wrong|incorrect|not convinced"
+    r"|i don't think|on the contrary|doesn't follow|misses the point|nope)\b"
+)
+
+_record_fields = attrgetter("author", "depth", "text")
+_dict_fields = itemgetter("author", "depth", "text")
+
+
+def _flat_comments(df: pd.DataFrame) -> tuple[pd.DataFrame, np.ndarray]:
+    """One row per comment across every post, tagged with the post's position."""
+    threads = [get_post_comments(row) for _, row in df.iterrows()]
+    lengths = np.fromiter((len(t) for t in threads), dtype=np.int64, count=len(threads))
+    rows = [
+        _dict_fields(c) if isinstance(c, dict) else _record_fields(c)
+        for thread in threads for c in thread
+    ]
+    flat = pd.DataFrame(rows, columns=["author", "depth", "text"])
+    flat["post"] = np.repeat(np.arange(len(threads)), lengths)
+    return flat, lengths
+
+
+def thread_features(df: pd.DataFrame) -> pd.DataFrame:
+    """Cheap per-post thread features, computed in one pass over all comments.
+
+    Returns one row per post (in ``df`` order) with the comment count,
+    distinct authors, reply depth, agreement/disagreement lexicon hits and
+    duplicate-text ratio.
+    """
+    flat, lengths = _flat_comments(df)
+    text = flat["text"].fillna("").str.lower()
+    normalized = text.str.replace(r"\W+", " ", regex=True).str.strip()
+    flat["agree"] = text.str.count(AGREE_PATTERN.pattern)
+    flat["disagree"] = text.str.count(DISAGREE_PATTERN.pattern)
+    flat["duplicate"] = pd.DataFrame({"post": flat["post"], "text": normalized}).duplicated()
+
+    grouped = flat.groupby("post")
+    features = pd.DataFrame({
+        "comments": lengths,
+        "authors": grouped["author"].nunique(),
+        "reply_depth": grouped["depth"].max() + 1,
+        "agree_hits": grouped["agree"].sum(),
+        "disagree_hits": grouped["disagree"].sum(),
+        "duplicate_ratio": grouped["duplicate"].mean(),
+    }, index=pd.RangeIndex(len(df)))
+    return features.fillna(0).astype({
+        "authors": np.int64, "reply_depth": np.int64, "agree_hits": np.int64, "disagree_hits": np.int64,
+    })
+
+
+def triage(features: pd.DataFrame) -> pd.DataFrame:
+    """Assign each post a tier, the model it goes to and a lexicon verdict.
+
+    Trivial threads (a single author, at most TRIVIAL_MAX_COMMENTS comments,
+    or mostly duplicated text) get a deterministic result and no LLM call.
+    Short, shallow threads are medium and go to TRIAGE_MEDIUM_MODEL;
+    everything else goes to GEMINI_MODEL. Posts without comments are left
+    to the caller.
+    """
+    single_author = features["authors"] <= 1
+    few_comments = features["comments"] <= TRIVIAL_MAX_COMMENTS
+    duplicated = features["duplicate_ratio"] >= TRIVIAL_DUPLICATE_RATIO
+    trivial = (features["comments"] > 0) & (single_author | few_comments | duplicated)
+    medium = ~trivial & (
+        (features["comments"] <= TRIAGE_MEDIUM_MAX_COMMENTS)
+        & (features["reply_depth"] <= TRIAGE_MEDIUM_MAX_DEPTH)
+    )
+
+    hits = features["agree_hits"] + features["disagree_hits"]
+    agree_share = features["agree_hits"] / hits.where(hits > 0, 1)
+    verdict = np.select(
+        [single_author | (hits == 0), agree_share >= 0.75, agree_share <= 0.25],
+        ["NO", "YES", "NO"],
+        default="PARTIAL",
+    )
+    reason = np.select(
+        [single_author, few_comments, duplicated],
+        ["only one agent took part", "too few comments for a discussion", "mostly duplicated comments"],
+        default="",
+    )
+    return pd.DataFrame({
+        "tier": np.select([trivial, medium], [TRIVIAL, MEDIUM], default=COMPLEX),
+        "model": np.where(medium, TRIAGE_MEDIUM_MODEL, GEMINI_MODEL),
+        "verdict": verdict,
+        "reason": np.where(trivial, reason, ""),
+    }, index=features.index)
+
+
+def triage_result(post: dict, comments: list, decision) -> dict:
+    """The deterministic Pass 1 result for a trivial thread."""
+    return {
+        "post_id": str(post.get("id")),
+        "post_title": post.get("title", "Untitled"),
+        "post_upvotes": post.get("upvotes", 0),
+        "comment_count": len(comments),
+        "consensus": decision.verdict,
+        "consensus_position": None,
+        "formation_pattern": f"Resolved by local triage: {decision.reason}.",
+        "key_moments": [],
+        "consensus_drivers": [],
+        "evidence_quotes": [],
+        "thread_fingerprint": thread_fingerprint(comments),
+        "triage": decision.reason,
+    }
+
+
+def triage_agreement(decisions: pd.DataFrame, results: list[Optional[dict]]) -> dict:
+    """How often the triage verdict matches the LLM's, per tier.
+
+    ``results`` holds each post's stored Pass 1 result (or None), in
+    ``decisions`` order; results produced by triage itself are skipped, so
+    only real LLM verdicts are compared.
+    """
+    agreement = {tier: Counter() for tier in (TRIVIAL, MEDIUM, COMPLEX)}
+    for decision, result in zip(decisions.itertuples(), results):
+        if result is None or "triage" in result or result.get("consensus") not in ("YES", "NO", "PARTIAL"):
+            continue
+        counts = agreement[decision.tier]
+        counts["compared"] += 1
+        counts["agreed"] += decision.verdict == result["consensus"]
+    return agreement
@@ -0,0 +1,122 @@
+"""Benchmark Gemini call throughput against a local fake server.
+
+Compares the old sync-client-in-a-thread path with the pooled native-async
+client from analysis.llm at 5, 50 and 500 concurrent calls.
+
+Usage:
+    python -m benchmarks.bench_async_client [--latency 0.2] [--calls 1000]
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import time
+
+from google import genai
+from google.genai import types
+
+from analysis.llm_backend import make_client
+
+CONCURRENCY_LEVELS = (5, 50, 500)
+MODEL = "gemini-2.5-flash"
+
+_RESPONSE_BODY = json.dumps({
+    "candidates": [{
+        "content": {"role": "model", "parts": [{"text": '{"consensus": "YES"}'}]},
+        "finishReason": "STOP",
+    }],
+    "usageMetadata": {"promptTokenCount": 100, "candidatesTokenCount": 10},
+}).encode()
+
+
+async def _handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter, latency: float):
+    """Minimal keep-alive HTTP/1.1 handler answering every request with one canned response."""
+    try:
+        while True:
+            request_line = await reader.readline()
+            if not request_line:
+                break
+            content_length = 0
+            while True:
+                header = await reader.readline()
+                if header in (b"\r\n", b"\n", b""):
+                    break
+                name, _, value = header.decode("latin-1").partition(":")
+                if name.strip().lower() == "content-length":
+                    content_length = int(value.strip())
+            await reader.readexactly(content_length)
+            await asyncio.sleep(latency)
+            writer.write(
+                b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n"
+                b"Content-Length: " + str(len(_RESPONSE_BODY)).encode() + b"\r\n\r\n"
+                + _RESPONSE_BODY
+            )
+            await writer.drain()
+    except (asyncio.IncompleteReadError, ConnectionResetError):
+        pass
+    finally:
+        writer.close()
+
+
+def _serve(latency: float, ports: multiprocessing.Queue):
+    """Run the fake server in its own process so it doesn't compete with the client loop."""
+    async def serve():
+        server = await asyncio.start_server(
+            lambda r, w: _handle(r, w, latency), "127.0.0.1", 0, backlog=1024
+        )
+        ports.put(server.sockets[0].getsockname()[1])
+        async with server:
+            await server.serve_forever()
+
+    asyncio.run(serve())
+
+
+async def _timed_calls(call, n_calls: int, concurrency: int) -> float:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with semaphore:
+            await call()
+
+    start = time.perf_counter()
+    await asyncio.gather(*[one() for _ in range(n_calls)])
+    return time.perf_counter() - start
+
+
+async def _bench(base_url: str, latency: float, n_calls: int):
+    sync_client = genai.Client(api_key="fake", http_options=types.HttpOptions(base_url=base_url))
+    async_client = make_client(base_url=base_url, api_key="fake")
+
+    async def threaded_call():
+        await asyncio.to_thread(sync_client.models.generate_content, model=MODEL, contents="hi")
+
+    async def native_call():
+        await async_client.aio.models.generate_content(model=MODEL, contents="hi")
+
+    print(f"Fake server latency {latency * 1000:.0f} ms, {n_calls} calls per run\n")
+    print(f"{'concurrency':>11} {'to_thread (calls/s)':>20} {'native async (calls/s)':>23}")
+    for concurrency in CONCURRENCY_LEVELS:
+        threaded = await _timed_calls(threaded_call, n_calls, concurrency)
+        native = await _timed_calls(native_call, n_calls, concurrency)
+        print(f"{concurrency:>11} {n_calls / threaded:>20.1f} {n_calls / native:>23.1f}")
+    await async_client.aio.aclose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--latency", type=float, default=0.2, help="Fake server latency in seconds")
+    parser.add_argument("--calls", type=int, default=1000)
+    args = parser.parse_args()
+
+    ports: multiprocessing.Queue = multiprocessing.Queue()
+    server = multiprocessing.Process(target=_serve, args=(args.latency, ports), daemon=True)
+    server.start()
+    try:
+        base_url = f"http://127.0.0.1:{ports.get(timeout=10)}"
+        asyncio.run(_bench(base_url, args.latency, args.calls))
+    finally:
+        server.terminate()
+
+
+if __name__ == "__main__":
+    main()
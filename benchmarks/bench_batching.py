@@ -0,0 +1,90 @@
+"""Compare posts per minute with and without multi-post requests at a fixed RPM.
+
+Runs Pass 1 over the small threads of the top-N post set twice against a
+fresh fake backend, response cache and rate limiter: once with one request
+per post and once with small threads packed into multi-post requests.
+Posts missing from a multi-post response are retried alone, and those
+retries count against the same quota.
+
+Usage:
+    python -m benchmarks.bench_batching [--posts 500] [--synthetic] [--rpm 600]
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+from analysis import llm, llm_cache, rate_limiter
+from analysis.consensus_detector import (
+    analyze_posts_batch,
+    estimate_post_cost,
+    is_small_thread,
+    pack_small_threads,
+)
+from analysis.llm_backend import FakeBackend
+from analysis.llm_cache import ResponseCache
+from analysis.pipeline import run_pipeline
+from analysis.rate_limiter import RateLimiter
+from config import CONCURRENCY_LIMIT, LLM_MAX_CONCURRENCY
+from data.comment_parser import get_post_comments
+
+
+async def _simulate(posts, units: list[list[int]], args, cache_dir: str) -> tuple[float, FakeBackend]:
+    backend = FakeBackend(latency=args.latency, malformed_rate=args.malformed_rate, seed=0)
+    llm.set_backend(backend)
+    llm_cache._cache = ResponseCache(
+        os.path.join(cache_dir, f"{time.monotonic_ns()}.sqlite"), max_bytes=2**30, max_age_seconds=86400,
+    )
+    # A one-request burst, so the quota applies from the first call
+    rate_limiter._limiter = RateLimiter(args.rpm, 1e12, LLM_MAX_CONCURRENCY, burst_seconds=60 / args.rpm)
+
+    async def analyze(unit):
+        return await analyze_posts_batch([posts[i] for i in unit])
+
+    start = time.perf_counter()
+    await run_pipeline(units, analyze, lambda unit, results: None, workers=args.workers)
+    return time.perf_counter() - start, backend
+
+
+async def _bench(posts, args):
+    costs = [estimate_post_cost(comments) for _, comments in posts]
+    strategies = (
+        ("one post per request", [[i] for i in range(len(posts))]),
+        ("multi-post requests", pack_small_threads(costs)),
+    )
+    print(f"{'strategy':<22} {'requests':>9} {'input tokens':>13} {'elapsed (s)':>12} {'posts/min':>10}")
+    with tempfile.TemporaryDirectory() as cache_dir:
+        for name, units in strategies:
+            elapsed, backend = await _simulate(posts, units, args, cache_dir)
+            print(
+                f"{name:<22} {backend.stats['calls']:>9} {backend.stats['input_tokens']:>13} "
+                f"{elapsed:>12.2f} {len(posts) / elapsed * 60:>10.0f}"
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--posts", type=int, default=500)
+    parser.add_argument("--synthetic", action="store_true", help="Use generated posts instead of the dataset")
+    parser.add_argument("--rpm", type=float, default=600, help="Simulated request quota")
+    parser.add_argument("--workers", type=int, default=CONCURRENCY_LIMIT)
+    parser.add_argument("--latency", default="fixed:0.05", help="Fake backend latency distribution")
+    parser.add_argument("--malformed-rate", type=float, default=0.03)
+    args = parser.parse_args()
+
+    if args.synthetic:
+        from benchmarks.synthetic import make_posts
+        df = make_posts(args.posts)
+    else:
+        from data.loader import load_top_posts
+        df = load_top_posts(args.posts)
+    posts = [(row.to_dict(), get_post_comments(row)) for _, row in df.iterrows()]
+    posts = [(post, comments) for post, comments in posts
+             if comments and is_small_thread(estimate_post_cost(comments))]
+    print(f"{len(posts)} small threads, {args.rpm:.0f} RPM simulated quota\n")
+    asyncio.run(_bench(posts, args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""Compare fixed-size comment chunking with token-budget subtree chunking.
+
+Runs both splitters over the top-N post set and reports how many posts get
+chunked, how many chunk-summary calls that costs and how many prompt tokens
+those calls send. No LLM calls are made.
+
+Usage:
+    python -m benchmarks.bench_chunking [--posts 500] [--synthetic]
+"""
+import argparse
+
+from analysis.consensus_detector import (
+    CHUNK_SUMMARY_PROMPT,
+    _chunk_comments,
+    _comment_tokens,
+)
+from config import CHUNK_TOKEN_BUDGET, MAX_TOKENS_FULL_THREAD
+from data.comment_parser import get_post_comments, format_thread_for_llm
+from data.tokens import estimate_tokens
+
+# The splitter this replaced: 50 comments per chunk above 100 comments
+LEGACY_CHUNK_SIZE = 50
+LEGACY_MAX_COMMENTS = 100
+
+
+def _legacy_chunks(comments: list) -> list[list]:
+    if len(comments) <= LEGACY_MAX_COMMENTS:
+        return []
+    return [comments[i:i + LEGACY_CHUNK_SIZE] for i in range(0, len(comments), LEGACY_CHUNK_SIZE)]
+
+
+def _budget_chunks(comments: list) -> list[list]:
+    token_counts = _comment_tokens(comments)
+    if sum(token_counts) <= MAX_TOKENS_FULL_THREAD:
+        return []
+    return _chunk_comments(comments, token_counts=token_counts)
+
+
+def _measure(threads: list[list], splitter) -> dict:
+    template_tokens = estimate_tokens(CHUNK_SUMMARY_PROMPT.format(chunk=""))
+    totals = {"posts": 0, "calls": 0, "tokens": 0, "largest": 0}
+    for comments in threads:
+        chunks = splitter(comments)
+        if not chunks:
+            continue
+        totals["posts"] += 1
+        totals["calls"] += len(chunks)
+        for chunk in chunks:
+            tokens = template_tokens + estimate_tokens(format_thread_for_llm(chunk))
+            totals["tokens"] += tokens
+            totals["largest"] = max(totals["largest"], tokens)
+    return totals
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--posts", type=int, default=500)
+    parser.add_argument("--synthetic", action="store_true", help="Use generated posts instead of the dataset")
+    args = parser.parse_args()
+
+    if args.synthetic:
+        from benchmarks.synthetic import make_posts
+        df = make_posts(args.posts)
+    else:
+        from data.loader import load_top_posts
+        df = load_top_posts(args.posts)
+    threads = [get_post_comments(post) for _, post in df.iterrows()]
+    print(f"{len(threads)} posts, {sum(map(len, threads))} comments")
+    print(f"Budget: {CHUNK_TOKEN_BUDGET} tokens/chunk above {MAX_TOKENS_FULL_THREAD} tokens/thread\n")
+
+    legacy = _measure(threads, _legacy_chunks)
+    budget = _measure(threads, _budget_chunks)
+    print(f"{'':<22} {'fixed-size':>12} {'token-budget':>13}")
+    for key, label in (
+        ("posts", "posts chunked"),
+        ("calls", "chunk-summary calls"),
+        ("tokens", "chunk prompt tokens"),
+        ("largest", "largest chunk prompt"),
+    ):
+        print(f"{label:<22} {legacy[key]:>12} {budget[key]:>13}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""Micro-benchmark thread flattening and formatting on large, deep threads.
+
+Usage:
+    python -m benchmarks.bench_comment_parser [--comments 20000] [--depth 60]
+"""
+import argparse
+import json
+import random
+import time
+import tracemalloc
+
+from data.comment_parser import (
+    format_thread_for_llm,
+    parse_comment_records,
+    parse_comments,
+    reset_schema_cache,
+)
+
+
+def make_thread(n_comments: int, max_depth: int, n_authors: int = 300, seed: int = 0) -> str:
+    """Nested comments JSON with long reply chains down to max_depth."""
+    rng = random.Random(seed)
+    roots: list[dict] = []
+    # Open chain of the most recent node at each depth
+    chain: list[dict] = []
+    for i in range(n_comments):
+        node = {
+            "author": f"agent_{rng.randrange(n_authors)}",
+            "text": f"Comment {i}: " + "lorem ipsum " * rng.randint(1, 30),
+            "upvotes": rng.randint(0, 40),
+            "replies": [],
+        }
+        # Mostly extend the current chain so reply depth regularly reaches max_depth
+        depth = min(len(chain), max_depth) if rng.random() < 0.9 else rng.randint(0, len(chain))
+        if depth == 0:
+            roots.append(node)
+        else:
+            chain[depth - 1]["replies"].append(node)
+        del chain[depth:]
+        chain.append(node)
+    return json.dumps(roots)
+
+
+def _timed(fn, repeat: int = 5) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def _retained_bytes(fn) -> int:
+    """Memory still held by fn's result once parsing scratch space is freed."""
+    tracemalloc.start()
+    result = fn()
+    retained, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return retained
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--comments", type=int, default=20_000)
+    parser.add_argument("--depth", type=int, default=60)
+    args = parser.parse_args()
+
+    thread_json = make_thread(args.comments, args.depth)
+    reset_schema_cache()
+    records = parse_comment_records(thread_json)
+    dicts = parse_comments(thread_json)
+    print(f"Thread: {len(records)} comments, max depth {max(c.depth for c in records)}\n")
+
+    rows = [
+        ("flatten -> records", lambda: parse_comment_records(thread_json)),
+        ("flatten -> dicts (adapter)", lambda: parse_comments(thread_json)),
+        ("format (records)", lambda: format_thread_for_llm(records)),
+        ("format (dicts)", lambda: format_thread_for_llm(dicts)),
+    ]
+    print(f"{'step':<28} {'best (ms)':>10}")
+    for name, fn in rows:
+        print(f"{name:<28} {_timed(fn) * 1000:>10.1f}")
+
+    print(f"\n{'retained memory':<28} {'MiB':>10}")
+    for name, fn in rows[:2]:
+        print(f"{name:<28} {_retained_bytes(fn) / 2**20:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
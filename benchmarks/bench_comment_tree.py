@@ -0,0 +1,32 @@
+"""Benchmark single-pass comment thread construction as the post count grows.
+
+Usage:
+    python -m benchmarks.bench_comment_tree [--comments-per-post 130]
+"""
+import argparse
+import time
+
+from benchmarks.synthetic import make_comments
+from data.loader import _build_comment_threads
+
+POST_COUNTS = (100, 500, 1_000, 5_000, 10_000)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--comments-per-post", type=int, default=130)
+    args = parser.parse_args()
+
+    print(f"{'posts':>8} {'comments':>10} {'build (s)':>10} {'us/comment':>11}")
+    for n_posts in POST_COUNTS:
+        comments_df = make_comments(n_posts, args.comments_per_post)
+        post_ids = [f"p{i}" for i in range(n_posts)]
+        start = time.perf_counter()
+        _build_comment_threads(comments_df, post_ids)
+        elapsed = time.perf_counter() - start
+        per_comment = elapsed / len(comments_df) * 1e6
+        print(f"{n_posts:>8} {len(comments_df):>10} {elapsed:>10.3f} {per_comment:>11.2f}")
+
+
+if __name__ == "__main__":
+    main()
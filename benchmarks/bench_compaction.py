@@ -0,0 +1,73 @@
+"""Measure how many prompt tokens thread compaction saves per post.
+
+Runs ``compact_thread`` over the top-N post set and reports the thread
+tokens before and after, what was folded, truncated and dropped, the
+resulting chunk-summary calls and the time compaction takes. No LLM calls
+are made.
+
+Usage:
+    python -m benchmarks.bench_compaction [--posts 500] [--synthetic] [--spam-rate 0.15]
+"""
+import argparse
+import time
+
+from analysis.consensus_detector import _comment_tokens
+from config import CHUNK_TOKEN_BUDGET, MAX_TOKENS_FULL_THREAD
+from data.comment_parser import get_post_comments
+from data.compaction import compact_thread
+
+
+def _calls(comments: list) -> int:
+    """LLM calls analyze_post would make on a thread sent as is."""
+    tokens = sum(_comment_tokens(comments))
+    return 1 + (-(-tokens // CHUNK_TOKEN_BUDGET) if tokens > MAX_TOKENS_FULL_THREAD else 0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--posts", type=int, default=500)
+    parser.add_argument("--synthetic", action="store_true", help="Use generated posts instead of the dataset")
+    parser.add_argument("--spam-rate", type=float, default=0.15, help="Share of synthetic leaf comments that are spam")
+    args = parser.parse_args()
+
+    if args.synthetic:
+        from benchmarks.synthetic import make_spammy_posts
+        df = make_spammy_posts(args.posts, args.spam_rate)
+    else:
+        from data.loader import load_top_posts
+        df = load_top_posts(args.posts)
+    threads = [get_post_comments(post) for _, post in df.iterrows()]
+    threads = [(title, comments) for title, comments in zip(df["title"], threads) if comments]
+    print(f"{len(threads)} posts with comments, {sum(len(c) for _, c in threads)} comments\n")
+
+    totals = {"tokens_before": 0, "tokens_after": 0, "duplicates": 0, "truncated": 0, "dropped": 0}
+    calls_before = calls_after = 0
+    per_post = []
+    elapsed = 0.0
+    for title, comments in threads:
+        start = time.perf_counter()
+        compacted, stats = compact_thread(comments)
+        elapsed += time.perf_counter() - start
+        for key in totals:
+            totals[key] += stats[key]
+        calls_before += _calls(comments)
+        calls_after += _calls(compacted)
+        per_post.append((stats["tokens_before"] - stats["tokens_after"], stats["tokens_before"], title))
+
+    saved = totals["tokens_before"] - totals["tokens_after"]
+    print(f"{'thread tokens':<26} {totals['tokens_before']:>10} -> {totals['tokens_after']:<10} "
+          f"({saved / max(totals['tokens_before'], 1):.1%} saved)")
+    print(f"{'estimated LLM calls':<26} {calls_before:>10} -> {calls_after}")
+    print(f"{'duplicates folded':<26} {totals['duplicates']:>10}")
+    print(f"{'comments truncated':<26} {totals['truncated']:>10}")
+    print(f"{'low-upvote leaves dropped':<26} {totals['dropped']:>10}")
+    print(f"{'posts compacted':<26} {sum(p[0] > 0 for p in per_post):>10}")
+    print(f"{'compaction time (s)':<26} {elapsed:>10.2f}\n")
+
+    print("Most tokens saved:")
+    for tokens, before, title in sorted(per_post, reverse=True)[:10]:
+        print(f"  {tokens:>8} of {before:>8}  {str(title)[:60]}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""Time Pass 3 influence statistics and their bootstrap intervals as the post count grows.
+
+Compares the vectorized bootstrap (batched resamples over the post x agent
+incidence matrix) with the same statistics (top-5 share, Gini and HHI over
+the sample's agents) resampled in a plain Python loop over per-post driver
+lists, extrapolated from ``--loop-samples`` resamples.
+
+Usage:
+    python -m benchmarks.bench_influence [--posts 1000 5000 20000] [--samples 10000]
+"""
+import argparse
+import random
+import time
+from collections import Counter
+
+from analysis.agent_influence import analyze_agent_influence
+from benchmarks.synthetic import make_influence_results
+
+
+def _loop_bootstrap(results: list[dict], samples: int) -> float:
+    """Seconds per resample for a dict-based top-5 share, Gini and HHI bootstrap."""
+    posts = [
+        [d["agent"] for d in r["consensus_drivers"]]
+        for r in results if r["consensus"] in ("YES", "PARTIAL")
+    ]
+    universe = {a for drivers in posts for a in drivers}
+    rng = random.Random(0)
+    start = time.perf_counter()
+    for _ in range(samples):
+        counts = Counter()
+        for _ in range(len(posts)):
+            counts.update(posts[rng.randrange(len(posts))])
+        events = max(sum(counts.values()), 1)
+        sum(c for _, c in counts.most_common(5)) / events
+        ordered = sorted(counts.get(a, 0) for a in universe)
+        n = len(ordered)
+        2 * sum(i * c for i, c in enumerate(ordered, 1)) / (n * events) - (n + 1) / n
+        sum((c / events) ** 2 for c in counts.values())
+    return (time.perf_counter() - start) / samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--posts", type=int, nargs="+", default=[1_000, 5_000, 20_000])
+    parser.add_argument("--samples", type=int, default=10_000, help="Bootstrap resamples")
+    parser.add_argument("--loop-samples", type=int, default=50, help="Resamples timed for the loop baseline")
+    args = parser.parse_args()
+
+    print(
+        f"{'posts':>7} {'agents':>7} {'no CI (s)':>10} {'bootstrap (s)':>14} {'loop est. (s)':>14} "
+        f"{'top 5 share (95% CI)':>26} {'gini (95% CI)':>26} {'hhi (95% CI)':>26}"
+    )
+    for n in args.posts:
+        results = make_influence_results(n)
+        start = time.perf_counter()
+        analyze_agent_influence(results, bootstrap_samples=0)
+        plain = time.perf_counter() - start
+        start = time.perf_counter()
+        data = analyze_agent_influence(results, bootstrap_samples=args.samples)
+        elapsed = time.perf_counter() - start
+        loop = _loop_bootstrap(results, args.loop_samples) * args.samples
+        top5 = data["concentration"]["top_5"]
+        low, high = top5["ci"]
+        share = f"{top5['share']:.1%} ({low:.1%} – {high:.1%})"
+        inequality = data["inequality"]
+        gini = f"{inequality['gini']:.3f} ({inequality['gini_ci'][0]:.3f} – {inequality['gini_ci'][1]:.3f})"
+        hhi = f"{inequality['hhi']:.4f} ({inequality['hhi_ci'][0]:.4f} – {inequality['hhi_ci'][1]:.4f})"
+        print(
+            f"{n:>7} {data['unique_drivers']:>7} {plain:>10.2f} {elapsed:>14.2f} {loop:>14.1f} "
+            f"{share:>26} {gini:>26} {hhi:>26}"
+        )
+
+
+if __name__ == "__main__":
+    main()
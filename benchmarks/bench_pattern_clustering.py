@@ -0,0 +1,96 @@
+"""Compare single-call, sharded and local Pass 2 pattern clustering as the post count grows.
+
+Clusters synthetic per-post results on the fake backend in a single prompt,
+in the sharded map-reduce mode and with local k-means plus LLM naming, and
+reports the calls made,
+the largest prompt and response, and the wall-clock time. The fake backend
+does not model decoding time, so each response is delayed by its output
+tokens at ``--decode-tps`` tokens per second on top of its latency.
+
+Usage:
+    python -m benchmarks.bench_pattern_clustering [--posts 500 2000 5000] [--modes single sharded local]
+"""
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+
+from analysis import llm, llm_cache, pattern_classifier, rate_limiter
+from analysis.llm_backend import FakeBackend
+from analysis.llm_cache import ResponseCache
+from analysis.rate_limiter import RateLimiter
+from config import LLM_MAX_CONCURRENCY, PATTERN_SHARD_SIZE
+
+
+class _MeasuredBackend(FakeBackend):
+    def __init__(self, decode_tps: float, **kwargs):
+        super().__init__(**kwargs)
+        self.decode_tps = decode_tps
+        self.largest_prompt = self.largest_response = 0
+
+    async def generate(self, prompt, model, response_schema=None):
+        response = await super().generate(prompt, model, response_schema)
+        await asyncio.sleep(response.output_tokens / self.decode_tps)
+        self.largest_prompt = max(self.largest_prompt, response.input_tokens)
+        self.largest_response = max(self.largest_response, response.output_tokens)
+        return response
+
+
+def _results(n: int, seed: int = 0) -> list[dict]:
+    rng = random.Random(seed)
+    return [
+        {
+            "post_title": f"Synthetic post {i}: what agents think about topic {rng.randint(1, 10_000)}",
+            "post_upvotes": rng.randint(10, 100_000),
+            "comment_count": rng.randint(1, 500),
+            "consensus": rng.choice(("YES", "PARTIAL", "NO")),
+            "formation_pattern": " ".join(rng.choice(("agents", "agreed", "after", "debate", "evidence", "the"))
+                                          for _ in range(rng.randint(20, 50))),
+        }
+        for i in range(n)
+    ]
+
+
+async def _run(results: list[dict], mode: str, args, cache_dir: str) -> tuple[float, _MeasuredBackend]:
+    backend = _MeasuredBackend(args.decode_tps, latency=args.latency, seed=0)
+    llm.set_backend(backend)
+    llm_cache._cache = ResponseCache(
+        os.path.join(cache_dir, f"{time.monotonic_ns()}.sqlite"), max_bytes=2**30, max_age_seconds=86400,
+    )
+    rate_limiter._limiter = RateLimiter(args.rpm, 1e12, LLM_MAX_CONCURRENCY)
+    pattern_classifier.PATTERN_CLUSTERING = "local" if mode == "local" else "llm"
+    pattern_classifier.PATTERN_SHARD_SIZE = len(results) if mode == "single" else PATTERN_SHARD_SIZE
+    start = time.perf_counter()
+    await pattern_classifier.classify_patterns(results)
+    return time.perf_counter() - start, backend
+
+
+async def _bench(args):
+    print(f"{'posts':>6} {'mode':<8} {'calls':>6} {'largest prompt':>15} {'largest response':>17} {'elapsed (s)':>12}")
+    with tempfile.TemporaryDirectory() as cache_dir:
+        for n in args.posts:
+            results = _results(n)
+            for mode in args.modes:
+                elapsed, backend = await _run(results, mode, args, cache_dir)
+                print(
+                    f"{n:>6} {mode:<8} {backend.stats['calls']:>6} {backend.largest_prompt:>15} "
+                    f"{backend.largest_response:>17} {elapsed:>12.2f}"
+                )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--posts", type=int, nargs="+", default=[500, 2000, 5000])
+    parser.add_argument("--modes", nargs="+", default=["single", "sharded", "local"],
+                        choices=["single", "sharded", "local"])
+    parser.add_argument("--rpm", type=float, default=600, help="Simulated request quota")
+    parser.add_argument("--latency", default="fixed:0.2", help="Fake backend latency distribution")
+    parser.add_argument("--decode-tps", type=float, default=1000, help="Simulated output tokens per second")
+    args = parser.parse_args()
+    asyncio.run(_bench(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""Simulate Pass 1 makespan for different post orderings on the fake backend.
+
+Runs Pass 1 over the top-N post set three times against a fresh fake
+backend, response cache and rate limiter: in score order (the old
+behaviour), longest-estimated-first, and longest-first with chunk/post
+priority lanes in the rate limiter. Reports wall-clock makespan and when
+the first 50% / 90% of posts had finished.
+
+Usage:
+    python -m benchmarks.bench_scheduling [--posts 500] [--synthetic] [--rpm 600]
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+from analysis import llm, llm_cache, rate_limiter
+from analysis.consensus_detector import analyze_post, estimate_post_cost
+from analysis.llm_backend import FakeBackend
+from analysis.llm_cache import ResponseCache
+from analysis.pipeline import run_pipeline
+from analysis.rate_limiter import RateLimiter
+from config import CONCURRENCY_LIMIT, LLM_MAX_CONCURRENCY
+from data.comment_parser import get_post_comments
+
+
+async def _simulate(posts: list[tuple[dict, list]], args, priority_lanes: bool, cache_dir: str) -> list[float]:
+    """Run Pass 1 over posts in the given order; return each post's finish time."""
+    llm.set_backend(FakeBackend(
+        latency=args.latency, latency_per_1k_tokens=args.latency_per_1k_tokens, seed=0,
+    ))
+    llm_cache._cache = ResponseCache(
+        os.path.join(cache_dir, f"{time.monotonic_ns()}.sqlite"), max_bytes=2**30, max_age_seconds=86400,
+    )
+    rate_limiter._limiter = RateLimiter(
+        args.rpm, args.tpm, LLM_MAX_CONCURRENCY, priority_lanes=priority_lanes,
+    )
+
+    start = time.perf_counter()
+    finished: list[float] = []
+
+    async def analyze(item):
+        post, comments = item
+        return await analyze_post(post, comments)
+
+    def record(item, result):
+        finished.append(time.perf_counter() - start)
+
+    await run_pipeline(posts, analyze, record, workers=args.workers)
+    return finished
+
+
+async def _bench(posts: list[tuple[dict, list]], args):
+    by_cost = sorted(posts, key=lambda p: estimate_post_cost(p[1]), reverse=True)
+    strategies = (
+        ("score order", posts, False),
+        ("longest first", by_cost, False),
+        ("longest first + lanes", by_cost, True),
+    )
+    print(f"{'strategy':<24} {'makespan (s)':>13} {'50% done (s)':>13} {'90% done (s)':>13}")
+    with tempfile.TemporaryDirectory() as cache_dir:
+        for name, ordered, lanes in strategies:
+            finished = await _simulate(ordered, args, lanes, cache_dir)
+            print(
+                f"{name:<24} {finished[-1]:>13.2f} "
+                f"{finished[len(finished) // 2]:>13.2f} {finished[int(len(finished) * 0.9)]:>13.2f}"
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--posts", type=int, default=500)
+    parser.add_argument("--synthetic", action="store_true", help="Use generated posts instead of the dataset")
+    parser.add_argument("--rpm", type=float, default=600, help="Simulated request quota")
+    parser.add_argument("--tpm", type=float, default=3_000_000, help="Simulated token quota")
+    parser.add_argument("--workers", type=int, default=CONCURRENCY_LIMIT)
+    parser.add_argument("--latency", default="lognormal:0.1:0.4", help="Fake backend latency distribution")
+    parser.add_argument("--latency-per-1k-tokens", type=float, default=0.02)
+    args = parser.parse_args()
+
+    if args.synthetic:
+        from benchmarks.synthetic import make_posts
+        df = make_posts(args.posts)
+    else:
+        from data.loader import load_top_posts
+        df = load_top_posts(args.posts)
+    posts = [(row.to_dict(), get_post_comments(row)) for _, row in df.iterrows()]
+    posts = [(post, comments) for post, comments in posts if comments]
+    print(
+        f"{len(posts)} posts with comments, {args.workers} workers, "
+        f"{args.rpm:.0f} RPM / {args.tpm:.0f} TPM simulated quota\n"
+    )
+    asyncio.run(_bench(posts, args))
+
+
+if __name__ == "__main__":
+    main()
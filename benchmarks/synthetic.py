@@ -0,0 +1,120 @@
+"""Synthetic Moltbook-shaped data for offline benchmarks."""
+import numpy as np
+import pandas as pd
+
+from data.comment_parser import Comment
+from data.loader import _build_comment_threads
+
+
+def make_comments(n_posts: int, comments_per_post: int, seed: int = 0) -> pd.DataFrame:
+    """Synthetic comments table shaped like the Moltbook comments subset."""
+    rng = np.random.default_rng(seed)
+    total = n_posts * comments_per_post
+    post_ids = np.repeat(np.arange(n_posts), comments_per_post)
+    ids = np.arange(total)
+
+    # Each comment replies to an earlier comment in the same post ~60% of the time
+    offset_in_post = ids % comments_per_post
+    back = (rng.random(total) * np.maximum(offset_in_post, 1)).astype(np.int64) + 1
+    is_reply = (rng.random(total) < 0.6) & (offset_in_post > 0)
+    parent_ids = np.where(is_reply, ids - np.minimum(back, offset_in_post), -1)
+
+    df = pd.DataFrame({
+        "id": [f"c{i}" for i in ids],
+        "post_id": [f"p{p}" for p in post_ids],
+        "parent_id": [f"c{p}" if p >= 0 else None for p in parent_ids],
+        "author_name": [f"agent_{a}" for a in rng.integers(0, 2_000, total)],
+        "content": ["Synthetic comment body"] * total,
+        "upvotes": rng.integers(0, 50, total),
+    })
+    # Real data is not grouped by post, so shuffle the rows
+    return df.sample(frac=1.0, random_state=seed).reset_index(drop=True)
+
+
+def make_posts(n_posts: int, seed: int = 0) -> pd.DataFrame:
+    """A prepared top-N frame shaped like ``load_top_posts`` output.
+
+    Thread sizes follow a heavy-tailed distribution (most posts have a
+    handful of comments, a few have hundreds) and comment lengths vary from
+    one-liners to multi-paragraph essays.
+    """
+    rng = np.random.default_rng(seed)
+    sizes = np.minimum(rng.pareto(1.2, n_posts) * 20, 1_000).astype(np.int64)
+    sizes[rng.random(n_posts) < 0.05] = 0
+
+    frames = []
+    for i, size in enumerate(sizes):
+        if size == 0:
+            continue
+        comments = make_comments(1, int(size), seed=seed + i)
+        comments["post_id"] = f"p{i}"
+        comments["id"] = f"p{i}_" + comments["id"]
+        comments["parent_id"] = [f"p{i}_{p}" if p else None for p in comments["parent_id"]]
+        words = rng.lognormal(3.0, 1.2, int(size)).astype(np.int64) + 1
+        comments["content"] = [" ".join(["word"] * int(w)) for w in words]
+        frames.append(comments)
+
+    posts = pd.DataFrame({
+        "id": [f"p{i}" for i in range(n_posts)],
+        "score": np.sort(rng.integers(10, 100_000, n_posts))[::-1],
+        "comment_count": sizes,
+        "title": [f"Synthetic post {i}" for i in range(n_posts)],
+        "content": ["Synthetic post body"] * n_posts,
+    })
+    threads = _build_comment_threads(pd.concat(frames), posts["id"].tolist()) if frames else {}
+    posts["comments"] = [threads.get(post_id, []) for post_id in posts["id"]]
+    posts["comments_count_actual"] = posts["comment_count"]
+    posts["upvotes"] = posts["score"]
+    return posts
+
+
+_SPAM = (
+    "Check out my new token launch, it is going to the moon, link in profile, do not miss out",
+    "Great post! Follow me for more insights on agent governance and daily alpha updates",
+    "This is a test comment from an automated agent please ignore this message",
+)
+
+
+def make_spammy_posts(n_posts: int, spam_rate: float = 0.15, seed: int = 0) -> pd.DataFrame:
+    """``make_posts`` with varied comment text and copy-pasted spam.
+
+    Comment bodies are drawn from a vocabulary instead of repeating one
+    word, and about ``spam_rate`` of leaf comments are replaced with one of
+    a few spam messages, sometimes with a small edit, as bots post them.
+    """
+    rng = np.random.default_rng(seed)
+    vocabulary = np.array([f"w{i}" for i in range(5_000)])
+    posts = make_posts(n_posts, seed)
+    threads = []
+    for thread in posts["comments"]:
+        records = []
+        for i, c in enumerate(thread):
+            is_leaf = i + 1 == len(thread) or thread[i + 1].depth <= c.depth
+            if is_leaf and rng.random() < spam_rate:
+                text = _SPAM[rng.integers(len(_SPAM))]
+                if rng.random() < 0.3:
+                    text += f" #{rng.integers(100)}"
+            else:
+                text = " ".join(rng.choice(vocabulary, len(c.text.split())))
+            records.append(Comment(c.author, text, c.depth, c.parent_author, c.upvotes, c.id))
+        threads.append(records)
+    posts["comments"] = threads
+    return posts
+
+
+def make_influence_results(n_posts: int, n_agents: int = 2_000, alpha: float = 1.2, seed: int = 0) -> list[dict]:
+    """Pass 1 results whose consensus drivers follow a heavy-tailed (Zipf-like) agent distribution."""
+    rng = np.random.default_rng(seed)
+    consensus = rng.choice(["YES", "PARTIAL", "NO"], n_posts, p=[0.4, 0.3, 0.3])
+    weights = 1 / np.arange(1, n_agents + 1) ** alpha
+    roles = ["proposed_position", "provided_evidence", "synthesized_views", "built_momentum"]
+    results = []
+    for i in range(n_posts):
+        drivers = rng.choice(n_agents, rng.integers(0, 5), p=weights / weights.sum())
+        results.append({
+            "post_id": f"p{i}",
+            "post_title": f"Synthetic post {i}",
+            "consensus": consensus[i],
+            "consensus_drivers": [{"agent": f"agent_{a}", "role": roles[a % len(roles)]} for a in drivers],
+        })
+    return results
@@ -4,16 +4,69 @@ from dotenv import load_dotenv
 load_dotenv()
 
 GOOGLE_API_KEY = os.environ.get("GOOGLE_API_KEY", "")
+GCP_PROJECT = os.environ.get("GOOGLE_CLOUD_PROJECT", "")
+GCP_LOCATION = os.environ.get("GOOGLE_CLOUD_LOCATION", "us-central1")
 GEMINI_MODEL = "gemini-2.5-flash"
-CONCURRENCY_LIMIT = 2  # Free tier limit is 5 RPM, use 2 to account for chunking
+CONCURRENCY_LIMIT = 2  # Posts analyzed at once; API pacing is handled by the rate limiter
 TOP_POSTS_COUNT = 500  # Reduced to safely fit in free tier
 DRY_RUN_COUNT = 5
-CHUNK_SIZE = 50
-MAX_COMMENTS_FULL_THREAD = 100
+CHUNK_TOKEN_BUDGET = 12_000  # Estimated tokens per chunk-summary call
+MAX_TOKENS_FULL_THREAD = 16_000  # Threads above this are summarized in chunks first
+SUMMARY_FAN_IN = 4  # Max chunk summaries merged per call when they don't fit together
+SMALL_THREAD_TOKENS = 2_000  # Threads up to this size may share a multi-post request
+MULTI_POST_TOKEN_BUDGET = 8_000  # Estimated thread tokens per multi-post request
+MULTI_POST_MAX_POSTS = 8  # Posts per multi-post request; 1 disables batching
+POST_TOKEN_BUDGET = 48_000  # Per-post thread tokens after compaction; low-upvote leaves are dropped beyond it
+COMPACT_MAX_COMMENT_TOKENS = 800  # Longer comments keep only their head and tail
+REPAIR_CONTEXT_TOKENS = 1_500  # Thread excerpt (agents, comments) sent with a structured-output repair prompt
+DELTA_MAX_NEW_FRACTION = 0.5  # Grown threads with more new comments than this are re-analyzed in full
+PATTERN_CLUSTERING = os.environ.get("PATTERN_CLUSTERING", "local")  # local (k-means + LLM naming) | llm
+PATTERN_CLUSTERS = 5  # k for local clustering of formation patterns
+PATTERN_EXEMPLARS = 8  # Posts per cluster shown to the LLM for naming
+PATTERN_SHARD_SIZE = 100  # Pass 2 posts per clustering call; larger result sets are clustered in shards
+PATTERN_REDUCE_FAN_IN = 8  # Shard pattern lists merged per reduce call
+PATTERN_ASSIGN_BATCH_SIZE = 50  # Posts assigned to the final taxonomy per call
+TRIAGE_MEDIUM_MODEL = os.environ.get("TRIAGE_MEDIUM_MODEL", "gemini-2.5-flash-lite")  # Model for short, shallow threads
+TRIAGE_MEDIUM_MAX_COMMENTS = 15  # Threads up to this size (and depth) go to TRIAGE_MEDIUM_MODEL
+TRIAGE_MEDIUM_MAX_DEPTH = 3  # Reply levels
+REPORT_EVERY_POSTS = 250  # Pass 1 results between progressive report rewrites
+REPORT_EVERY_SECONDS = 300  # ...or seconds, whichever comes first
+STABILITY_TOLERANCE = 0.01  # Max change in consensus / top-driver shares between reports to count as stable
+STABILITY_REPORTS = 3  # Consecutive stable reports before --stop-when-stable ends Pass 1
+INFLUENCE_BOOTSTRAP_SAMPLES = 10_000  # Post resamples for Pass 3 concentration confidence intervals; 0 disables them
+
+# "gemini" (Vertex AI) or "fake" (offline stand-in; writes to output/fake)
+LLM_BACKEND = os.environ.get("LLM_BACKEND", "gemini")
+
+# Shared budget for every Gemini call (Pass 1 posts, chunk summaries, Pass 2)
+RATE_LIMIT_RPM = float(os.environ.get("RATE_LIMIT_RPM", 5))  # Free tier limit
+RATE_LIMIT_TPM = float(os.environ.get("RATE_LIMIT_TPM", 250_000))
+LLM_MAX_CONCURRENCY = 8  # Upper bound for the adaptive (AIMD) in-flight window
+LLM_MAX_RETRIES = 6
+LLM_REQUEST_TIMEOUT = 120  # Seconds before a single Gemini request is abandoned
+LLM_MAX_CONNECTIONS = 100  # Pooled HTTP connections shared by all async calls
+
+# Fake backend behaviour (LLM_BACKEND=fake)
+FAKE_LATENCY = os.environ.get("FAKE_LATENCY", "lognormal:1.5:0.6")  # fixed:S | uniform:LO:HI | lognormal:MEDIAN:SIGMA | exponential:MEAN
+FAKE_LATENCY_PER_1K_TOKENS = float(os.environ.get("FAKE_LATENCY_PER_1K_TOKENS", 0.0))  # Added per 1k prompt tokens
+FAKE_RATE_LIMIT_RATE = float(os.environ.get("FAKE_RATE_LIMIT_RATE", 0.02))
+FAKE_SERVER_RPM = int(os.environ.get("FAKE_SERVER_RPM", 0))  # Simulated server quota, 0 = unlimited
+FAKE_MALFORMED_RATE = float(os.environ.get("FAKE_MALFORMED_RATE", 0.03))
+FAKE_FENCED_RATE = float(os.environ.get("FAKE_FENCED_RATE", 0.1))
+FAKE_SEED = int(os.environ.get("FAKE_SEED", 0))
 
 DATASET_NAME = "lysandrehooh/moltbook"
 POSTS_SUBSET = "posts"
 COMMENTS_SUBSET = "comments"
-OUTPUT_DIR = os.path.join(os.path.dirname(__file__), "output")
+DATASET_REVISION = None  # Pin a dataset commit sha; None tracks the latest revision
+DATASET_REVISION_TTL_SECONDS = 6 * 3600  # Reuse the resolved revision this long before asking the Hub again
+OUTPUT_DIR = os.path.join(os.path.dirname(__file__), "output", *(["fake"] if LLM_BACKEND == "fake" else []))
 RAW_RESULTS_PATH = os.path.join(OUTPUT_DIR, "raw_results.json")
 REPORT_PATH = os.path.join(OUTPUT_DIR, "consensus_report.md")
+CHECKPOINT_PATH = os.path.join(OUTPUT_DIR, "checkpoint.jsonl")
+INFLUENCE_STATE_PATH = os.path.join(OUTPUT_DIR, "influence_state.npz")  # Saved Pass 3 aggregator
+SNAPSHOT_DIR = os.path.join(os.path.dirname(__file__), "output", "snapshots")  # Shared by all backends
+LLM_CACHE_PATH = os.path.join(OUTPUT_DIR, "llm_cache.sqlite")
+BATCH_DIR = os.path.join(OUTPUT_DIR, "batch")  # Batch-job request/prediction JSONL files
+LLM_CACHE_MAX_BYTES = 512 * 1024 * 1024
+LLM_CACHE_MAX_AGE_DAYS = 30
@@ -1,11 +1,69 @@
+import hashlib
 import json
-from typing import Any, Optional
+import sys
+from operator import attrgetter, itemgetter
+from typing import Any, Iterator, Optional
 
 
 # Cached field mappings discovered from schema discovery
 _field_map: Optional[dict[str, str]] = None
 
 
+class Comment:
+    """Compact flat comment record.
+
+    Uses ``__slots__`` instead of a per-comment dict and interns author names,
+    since the same agents appear thousands of times across threads. Supports
+    ``c["author"]`` style access so code written against the dict records
+    keeps working; ``to_dict()`` is the adapter back to the dict form.
+    """
+
+    __slots__ = ("author", "text", "depth", "parent_author", "upvotes", "id")
+    FIELDS = __slots__
+
+    def __init__(
+        self,
+        author: str,
+        text: str,
+        depth: int = 0,
+        parent_author: Optional[str] = None,
+        upvotes: int = 0,
+        id: Optional[str] = None,
+    ):
+        self.author = sys.intern(author)
+        self.text = text
+        self.depth = depth
+        self.parent_author = parent_author
+        self.upvotes = upvotes
+        self.id = id
+
+    def __getitem__(self, key: str):
+        if key not in self.FIELDS:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def get(self, key: str, default=None):
+        return getattr(self, key) if key in self.FIELDS else default
+
+    def to_dict(self) -> dict:
+        return {
+            "author": self.author,
+            "text": self.text,
+            "depth": self.depth,
+            "parent_author": self.parent_author,
+            "upvotes": self.upvotes,
+            "id": self.id,
+        }
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, Comment):
+            other = other.to_dict()
+        return self.to_dict() == other
+
+    def __repr__(self) -> str:
+        return f"Comment({self.author!r}, depth={self.depth}, upvotes={self.upvotes})"
+
+
 def discover_schema(comments_raw: list[dict]) -> dict[str, str]:
     """Discover the field names used in comment objects.
 
@@ -14,6 +72,7 @@ def discover_schema(comments_raw: list[dict]) -> dict[str, str]:
       - text: the comment body/content field
       - replies: the nested replies/children field
       - upvotes: the upvote/score field
+      - id: the comment id field, if any
     """
     if not comments_raw:
         return {}
@@ -47,44 +106,57 @@ def discover_schema(comments_raw: list[dict]) -> dict[str, str]:
             mapping["upvotes"] = candidate
             break
 
+    # Comment id field
+    for candidate in ("id", "comment_id", "uuid"):
+        if candidate in keys:
+            mapping["id"] = candidate
+            break
+
     return mapping
 
 
-def _flatten_thread(
-    comments: list[dict],
-    field_map: dict[str, str],
-    depth: int = 0,
-    parent_author: Optional[str] = None,
-) -> list[dict]:
-    """Recursively flatten a nested comment tree into a linear list."""
-    result = []
-    for comment in comments:
-        author = comment.get(field_map.get("author", "author"), "unknown")
-        text = comment.get(field_map.get("text", "text"), "")
-        upvotes = comment.get(field_map.get("upvotes", "upvotes"), 0)
-
-        if text is None:
-            text = ""
-
-        result.append({
-            "author": str(author),
-            "text": str(text),
-            "depth": depth,
-            "parent_author": parent_author,
-            "upvotes": upvotes if upvotes is not None else 0,
-        })
-
-        # Recurse into replies
-        replies_key = field_map.get("replies", "replies")
+def iter_thread(comments: list[dict], field_map: dict[str, str]) -> Iterator[Comment]:
+    """Lazily flatten a nested comment tree into DFS-ordered records.
+
+    Uses an explicit stack rather than recursion, so arbitrarily deep reply
+    chains neither copy records level by level nor hit the recursion limit.
+    """
+    author_key = field_map.get("author", "author")
+    text_key = field_map.get("text", "text")
+    upvotes_key = field_map.get("upvotes", "upvotes")
+    replies_key = field_map.get("replies", "replies")
+    id_key = field_map.get("id", "id")
+
+    stack = [(comment, 0, None) for comment in reversed(comments)]
+    while stack:
+        comment, depth, parent_author = stack.pop()
+        author = str(comment.get(author_key, "unknown"))
+        text = comment.get(text_key, "")
+        upvotes = comment.get(upvotes_key, 0)
+        comment_id = comment.get(id_key)
+
+        record = Comment(
+            author,
+            str(text) if text is not None else "",
+            depth,
+            parent_author,
+            upvotes if upvotes is not None else 0,
+            str(comment_id) if comment_id is not None else None,
+        )
+        yield record
+
         children = comment.get(replies_key, [])
         if children:
-            result.extend(_flatten_thread(children, field_map, depth + 1, str(author)))
+            stack.extend((child, depth + 1, record.author) for child in reversed(children))
 
-    return result
 
+def _flatten_thread(comments: list[dict], field_map: dict[str, str]) -> list[dict]:
+    """Flatten a nested comment tree into a linear list of dicts."""
+    return [c.to_dict() for c in iter_thread(comments, field_map)]
 
-def parse_comments(comments_json_str: str) -> list[dict]:
-    """Parse a comments_json string into a flat list of comment dicts."""
+
+def parse_comment_records(comments_json_str: str) -> list[Comment]:
+    """Parse a comments_json string into a flat list of compact comment records."""
     global _field_map
 
     if not comments_json_str:
@@ -102,7 +174,64 @@ def parse_comments(comments_json_str: str) -> list[dict]:
     if _field_map is None:
         _field_map = discover_schema(raw)
 
-    return _flatten_thread(raw, _field_map)
+    return list(iter_thread(raw, _field_map))
+
+
+def parse_comments(comments_json_str: str) -> list[dict]:
+    """Parse a comments_json string into a flat list of comment dicts."""
+    return [c.to_dict() for c in parse_comment_records(comments_json_str)]
+
+
+def get_post_comments(post: dict) -> list[dict]:
+    """Return a post's flat comment records as ``Comment`` objects.
+
+    Uses the depth-annotated records the loader emits in the ``comments``
+    column directly, and only falls back to parsing ``comments_json`` for
+    cached or external inputs that carry the nested JSON form.
+    """
+    comments = post.get("comments")
+    if comments is not None:
+        return comments
+    return parse_comment_records(post.get("comments_json", ""))
+
+
+def comment_key(comment) -> str:
+    """Stable identity of a comment: its id, or a content hash when it has none."""
+    comment_id = comment.get("id")
+    if comment_id is not None:
+        return str(comment_id)
+    content = f"{comment['author']}\0{comment['text']}".encode("utf-8")
+    return "h:" + hashlib.sha1(content).hexdigest()[:16]
+
+
+def _content_hash(comments: list) -> str:
+    digest = hashlib.sha256()
+    for c in comments:
+        digest.update(f"{comment_key(c)}\0{c['author']}\0{c['text']}\0".encode("utf-8"))
+    return digest.hexdigest()
+
+
+def thread_fingerprint(comments: list) -> dict:
+    """Record which comments an analysis saw: their keys and a hash of their content."""
+    return {
+        "comment_ids": [comment_key(c) for c in comments],
+        "content_hash": _content_hash(comments),
+    }
+
+
+def comments_since(fingerprint: dict, comments: list) -> Optional[list]:
+    """Comments added to a thread since ``fingerprint`` was taken.
+
+    Returns None when previously seen comments were edited or deleted, since
+    the old analysis can then no longer be extended with a delta.
+    """
+    seen = set(fingerprint["comment_ids"])
+    old = [c for c in comments if comment_key(c) in seen]
+    if len(old) != len(fingerprint["comment_ids"]):
+        return None
+    if _content_hash(old) != fingerprint["content_hash"]:
+        return None
+    return [c for c in comments if comment_key(c) not in seen]
 
 
 def reset_schema_cache():
@@ -111,11 +240,20 @@ def reset_schema_cache():
     _field_map = None
 
 
-def format_thread_for_llm(comments: list[dict]) -> str:
-    """Format a flat comment list into a readable string for LLM analysis."""
+_record_fields = attrgetter("depth", "author", "parent_author", "text")
+_dict_fields = itemgetter("depth", "author", "parent_author", "text")
+
+
+def format_thread_for_llm(comments: list) -> str:
+    """Format a flat comment list into a readable string for LLM analysis.
+
+    Accepts ``Comment`` records or the equivalent dicts.
+    """
     lines = []
     for c in comments:
-        indent = "  " * c["depth"]
-        reply_to = f" (replying to {c['parent_author']})" if c["parent_author"] else ""
-        lines.append(f"{indent}[{c['author']}{reply_to}]: {c['text']}")
+        depth, author, parent_author, text = (
+            _record_fields(c) if isinstance(c, Comment) else _dict_fields(c)
+        )
+        reply_to = f" (replying to {parent_author})" if parent_author else ""
+        lines.append(f"{'  ' * depth}[{author}{reply_to}]: {text}")
     return "\n".join(lines)
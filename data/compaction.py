@@ -0,0 +1,169 @@
+import re
+import zlib
+from typing import Optional
+import numpy as np
+from config import COMPACT_MAX_COMMENT_TOKENS, POST_TOKEN_BUDGET
+from data.comment_parser import Comment, format_thread_for_llm
+from data.tokens import estimate_tokens
+
+# Near-duplicates: estimated Jaccard similarity of word 3-gram sets
+NEAR_DUPLICATE_THRESHOLD = 0.8
+MIN_NEAR_DUPLICATE_WORDS = 8  # Shorter comments are only collapsed on exact matches
+MINHASH_BANDS = 8
+MINHASH_ROWS = 4
+MAX_LISTED_AUTHORS = 5
+
+_MERSENNE_PRIME = (1 << 61) - 1
+# Coefficients below 2**32 keep (a*x + b) for 32-bit shingle hashes within uint64
+_rng = np.random.default_rng(0)
+_PERM_A = _rng.integers(1, 1 << 32, MINHASH_BANDS * MINHASH_ROWS, dtype=np.uint64)
+_PERM_B = _rng.integers(0, 1 << 32, MINHASH_BANDS * MINHASH_ROWS, dtype=np.uint64)
+
+_WORD = re.compile(r"\w+")
+
+
+def _words(text: str) -> list[str]:
+    return _WORD.findall(text.lower())
+
+
+def _minhash(words: list[str]) -> np.ndarray:
+    """MinHash signature of the text's word 3-gram set."""
+    h = np.fromiter((zlib.crc32(w.encode("utf-8")) for w in words), dtype=np.uint64, count=len(words))
+    if len(h) >= 3:
+        h = (h[:-2] * np.uint64(0x9E3779B1) ^ h[1:-1] * np.uint64(0x85EBCA77) ^ h[2:]) & np.uint64(0xFFFFFFFF)
+    shingles = np.unique(h)
+    return ((np.outer(shingles, _PERM_A) + _PERM_B) % _MERSENNE_PRIME).min(axis=0)
+
+
+def _duplicate_groups(comments: list, leaves: list[bool]) -> dict[int, list[int]]:
+    """Map each kept comment to the later leaf comments that duplicate it.
+
+    Exact matches compare whitespace/case-normalized text; longer comments
+    are also matched by MinHash with banded LSH. Only leaf comments are
+    folded into an earlier one, so no reply loses its parent.
+    """
+    owner: dict[int, int] = {}  # duplicate index -> kept index
+    exact: dict[str, int] = {}
+    buckets: dict[tuple, int] = {}
+    signatures: dict[int, np.ndarray] = {}
+    for i, c in enumerate(comments):
+        words = _words(c["text"])
+        key = " ".join(words)
+        match: Optional[int] = exact.get(key)
+        signature = None
+        if match is None and len(words) >= MIN_NEAR_DUPLICATE_WORDS:
+            signature = _minhash(words)
+            bands = [
+                (b, signature[b * MINHASH_ROWS:(b + 1) * MINHASH_ROWS].tobytes())
+                for b in range(MINHASH_BANDS)
+            ]
+            for band in bands:
+                j = buckets.get(band)
+                if j is not None and np.mean(signatures[j] == signature) >= NEAR_DUPLICATE_THRESHOLD:
+                    match = j
+                    break
+        if match is not None and leaves[i]:
+            owner[i] = match
+            continue
+        exact.setdefault(key, i)
+        if signature is not None:
+            signatures[i] = signature
+            for band in bands:
+                buckets.setdefault(band, i)
+
+    groups: dict[int, list[int]] = {}
+    for i, j in owner.items():
+        groups.setdefault(j, []).append(i)
+    return groups
+
+
+def truncate_text(text: str, max_tokens: int) -> str:
+    """Keep the head and tail of an over-long text, about max_tokens in all."""
+    tokens = estimate_tokens(text)
+    if tokens <= max_tokens:
+        return text
+    keep = int(len(text) * max_tokens / tokens)
+    head = keep * 2 // 3
+    return f"{text[:head].rstrip()} […] {text[len(text) - (keep - head):].lstrip()}"
+
+
+def _is_leaf(comments: list) -> list[bool]:
+    return [
+        i + 1 == len(comments) or comments[i + 1]["depth"] <= c["depth"]
+        for i, c in enumerate(comments)
+    ]
+
+
+def compact_thread(
+    comments: list,
+    budget: int = POST_TOKEN_BUDGET,
+    max_comment_tokens: int = COMPACT_MAX_COMMENT_TOKENS,
+) -> tuple[list, dict]:
+    """Shrink a flat comment thread before it is formatted into a prompt.
+
+    1. Leaf comments that repeat an earlier comment exactly or nearly are
+       folded into it, which is marked "×N authors" with their names (or
+       "×N posts" when one agent repeated itself).
+    2. Comments over ``max_comment_tokens`` keep only their head and tail.
+    3. While the thread is still over ``budget`` tokens, leaf comments are
+       dropped, lowest upvotes first, taking comments of agents who have
+       others in the thread before an agent's only comment.
+
+    Returns the compacted thread (new ``Comment`` records where anything
+    changed; the input is never modified) and the per-post stats:
+    ``tokens_before``, ``tokens_after``, ``duplicates``, ``truncated``
+    and ``dropped``.
+    """
+    stats = {"tokens_before": 0, "tokens_after": 0, "duplicates": 0, "truncated": 0, "dropped": 0}
+    if not comments:
+        return comments, stats
+    line_tokens = [estimate_tokens(format_thread_for_llm([c])) + 1 for c in comments]
+    stats["tokens_before"] = sum(line_tokens)
+
+    leaves = _is_leaf(comments)
+    groups = _duplicate_groups(comments, leaves)
+    folded = {i for members in groups.values() for i in members}
+    stats["duplicates"] = len(folded)
+
+    kept: list[tuple[int, object]] = []  # (original index, record)
+    for i, c in enumerate(comments):
+        if i in folded:
+            continue
+        text = truncate_text(c["text"], max_comment_tokens)
+        if text != c["text"]:
+            stats["truncated"] += 1
+        if i in groups:
+            authors = list(dict.fromkeys(comments[j]["author"] for j in [i, *groups[i]]))
+            if len(authors) > 1:
+                listed = ", ".join(authors[:MAX_LISTED_AUTHORS])
+                more = f" +{len(authors) - MAX_LISTED_AUTHORS} more" if len(authors) > MAX_LISTED_AUTHORS else ""
+                text = f"{text} [×{len(authors)} authors: {listed}{more}]"
+            else:
+                text = f"{text} [×{len(groups[i]) + 1} posts]"
+        if text != c["text"]:
+            c = Comment(c["author"], text, c["depth"], c["parent_author"], c["upvotes"], c.get("id"))
+            line_tokens[i] = estimate_tokens(format_thread_for_llm([c])) + 1
+        kept.append((i, c))
+
+    total = sum(line_tokens[i] for i, _ in kept)
+    if total > budget:
+        per_author: dict[str, int] = {}
+        for _, c in kept:
+            per_author[c["author"]] = per_author.get(c["author"], 0) + 1
+        candidates = sorted(
+            (i for i, _ in kept if leaves[i] and i not in groups),
+            key=lambda i: (per_author[comments[i]["author"]] == 1, comments[i]["upvotes"] or 0, -line_tokens[i]),
+        )
+        dropped = set()
+        for i in candidates:
+            if total <= budget:
+                break
+            dropped.add(i)
+            total -= line_tokens[i]
+        kept = [(i, c) for i, c in kept if i not in dropped]
+        stats["dropped"] = len(dropped)
+
+    stats["tokens_after"] = total
+    if not (stats["duplicates"] or stats["truncated"] or stats["dropped"]):
+        return comments, stats
+    return [c for _, c in kept], stats
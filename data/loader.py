@@ -1,80 +1,261 @@
+import glob
+import hashlib
 import json
+import os
+import sys
+import time
+from typing import Optional
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
 from datasets import load_dataset
-from config import DATASET_NAME, POSTS_SUBSET, COMMENTS_SUBSET, TOP_POSTS_COUNT
-
-
-def _build_comment_tree(comments_for_post: pd.DataFrame) -> list[dict]:
-    """Reconstruct nested comment tree from flat DataFrame using parent_id."""
-    if comments_for_post.empty:
-        return []
-
-    # Convert rows to dict nodes with 'replies' field
-    comment_nodes = {}
-    for _, row in comments_for_post.iterrows():
-        comment_id = row["id"]
-        comment_nodes[comment_id] = {
-            "author": str(row.get("author_name", "unknown")),
-            "text": str(row.get("content", "")),
-            "upvotes": int(row.get("upvotes", row.get("score", 0))),
-            "replies": []
-        }
-
-    # Build parent-child relationships
-    roots = []
-    for _, row in comments_for_post.iterrows():
-        comment_id = row["id"]
-        parent_id = row.get("parent_id")
-
-        if pd.isna(parent_id) or parent_id is None:
-            # Top-level comment
-            roots.append(comment_nodes[comment_id])
-        elif parent_id in comment_nodes:
-            # Child comment - attach to parent
-            comment_nodes[parent_id]["replies"].append(comment_nodes[comment_id])
+from huggingface_hub import HfApi
+from config import (
+    DATASET_NAME,
+    DATASET_REVISION,
+    DATASET_REVISION_TTL_SECONDS,
+    POSTS_SUBSET,
+    COMMENTS_SUBSET,
+    TOP_POSTS_COUNT,
+    SNAPSHOT_DIR,
+)
+from data.comment_parser import Comment
+
+# Bump whenever the prepared frame's columns or contents change so stale
+# snapshots are never served.
+LOADER_VERSION = 4
+
+# Only these columns are read from the memory-mapped HF tables
+POST_COLUMNS = ("id", "score", "comment_count", "title", "content")
+COMMENT_COLUMNS = ("id", "post_id", "parent_id", "author_name", "content", "upvotes", "score")
+
+
+def _build_comment_threads(comments_df: pd.DataFrame, post_ids) -> dict:
+    """Flatten every post's comment tree into depth-annotated records in one pass.
+
+    Comments are sorted once by post_id and the parent_id linkage is resolved
+    with a vectorized (post_id, id) index lookup, so the only Python loops
+    left are one walk over the selected comment rows and an iterative DFS.
+
+    Returns a mapping of post_id -> list of ``Comment`` records in DFS order,
+    the same records ``parse_comment_records`` produces from a nested
+    comments JSON.
+    """
+    threads: dict = {post_id: [] for post_id in post_ids}
+    if comments_df.empty or not threads:
+        return threads
+
+    comments_df = comments_df[comments_df["post_id"].isin(list(threads))]
+    comments_df = comments_df.drop_duplicates(subset=["post_id", "id"], keep="last")
+    comments_df = comments_df.sort_values("post_id", kind="stable")
+    if comments_df.empty:
+        return threads
+
+    post_col = comments_df["post_id"].to_numpy()
+    id_col = comments_df["id"].to_numpy()
+    if "parent_id" in comments_df.columns:
+        parent_col = comments_df["parent_id"].to_numpy()
+    else:
+        parent_col = np.full(len(comments_df), None, dtype=object)
+
+    # Position of each comment's parent within the same post (-1 => root/orphan)
+    key_index = pd.MultiIndex.from_arrays([post_col, id_col])
+    parent_pos = key_index.get_indexer(pd.MultiIndex.from_arrays([post_col, parent_col]))
+
+    if "author_name" in comments_df.columns:
+        authors = comments_df["author_name"].tolist()
+    else:
+        authors = ["unknown"] * len(comments_df)
+    if "content" in comments_df.columns:
+        texts = comments_df["content"].tolist()
+    else:
+        texts = [""] * len(comments_df)
+    if "upvotes" in comments_df.columns:
+        upvotes = comments_df["upvotes"].to_numpy(dtype=np.int64).tolist()
+    elif "score" in comments_df.columns:
+        upvotes = comments_df["score"].to_numpy(dtype=np.int64).tolist()
+    else:
+        upvotes = [0] * len(comments_df)
+
+    ids = [str(i) for i in id_col.tolist()]
+    authors = [sys.intern(str(a)) for a in authors]
+    texts = [str(t) for t in texts]
+
+    # Children keep original row order, matching the nested-tree layout
+    roots: dict = {post_id: [] for post_id in threads}
+    children: list[list[int]] = [[] for _ in range(len(comments_df))]
+    for i, (post_id, p) in enumerate(zip(post_col.tolist(), parent_pos.tolist())):
+        if p < 0:
+            roots[post_id].append(i)
         else:
-            # Orphaned comment (parent missing) - treat as root
-            roots.append(comment_nodes[comment_id])
+            children[p].append(i)
+
+    for post_id, root_rows in roots.items():
+        records = threads[post_id]
+        stack = [(i, 0, None) for i in reversed(root_rows)]
+        while stack:
+            i, depth, parent_author = stack.pop()
+            records.append(Comment(authors[i], texts[i], depth, parent_author, upvotes[i], ids[i]))
+            stack.extend((c, depth + 1, authors[i]) for c in reversed(children[i]))
+
+    return threads
+
+
+def _dataset_revision() -> Optional[str]:
+    """Resolve the dataset commit sha, or None when the Hub can't be reached.
+
+    A resolved sha is kept in SNAPSHOT_DIR for DATASET_REVISION_TTL_SECONDS,
+    so warm starts within that window make no network call.
+    """
+    cache_path = os.path.join(SNAPSHOT_DIR, "dataset_revision.json")
+    key = f"{DATASET_NAME}@{DATASET_REVISION}"
+    try:
+        with open(cache_path, encoding="utf-8") as f:
+            cached = json.load(f)
+        if cached["key"] == key and time.time() - cached["resolved_at"] < DATASET_REVISION_TTL_SECONDS:
+            return cached["revision"]
+    except (OSError, ValueError, KeyError, TypeError):
+        pass
 
-    return roots
+    try:
+        revision = HfApi().dataset_info(DATASET_NAME, revision=DATASET_REVISION, timeout=10).sha
+    except Exception:
+        return None
+    os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+    tmp_path = f"{cache_path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"key": key, "revision": revision, "resolved_at": time.time()}, f)
+    os.replace(tmp_path, cache_path)
+    return revision
 
 
-def load_top_posts(n: int = TOP_POSTS_COUNT) -> pd.DataFrame:
-    """Load the Moltbook dataset and return the top N most-upvoted posts with comments."""
-    # 1. Load both subsets
-    posts_ds = load_dataset(DATASET_NAME, POSTS_SUBSET, split="train")
-    comments_ds = load_dataset(DATASET_NAME, COMMENTS_SUBSET, split="train")
-    posts_df = posts_ds.to_pandas()
-    comments_df = comments_ds.to_pandas()
+def _snapshot_path(revision: str, n: int) -> str:
+    key = f"{DATASET_NAME}@{revision}|n={n}|loader=v{LOADER_VERSION}"
+    digest = hashlib.sha256(key.encode()).hexdigest()[:16]
+    return os.path.join(SNAPSHOT_DIR, f"top_posts_n{n}_v{LOADER_VERSION}_{digest}.arrow")
 
-    # 2. Sort posts by score descending
-    posts_df = posts_df.sort_values("score", ascending=False).reset_index(drop=True)
 
-    # 3. Filter posts with comment_count > 0
-    has_comments = posts_df[posts_df["comment_count"] > 0]
-    no_comments = posts_df[posts_df["comment_count"] == 0]
+def _latest_snapshot(n: int) -> Optional[str]:
+    """The most recently written snapshot for N and LOADER_VERSION, at any revision."""
+    paths = glob.glob(os.path.join(SNAPSHOT_DIR, f"top_posts_n{n}_v{LOADER_VERSION}_*.arrow"))
+    return max(paths, key=os.path.getmtime, default=None)
 
-    # 4. Select top N posts (prefer posts with comments)
+
+def _read_snapshot(path: str) -> pd.DataFrame:
+    """Read a prepared frame from an Arrow IPC snapshot via mmap.
+
+    The dataset revision it was built from is restored to ``df.attrs``.
+    """
+    with pa.memory_map(path, "r") as source:
+        table = pa.ipc.open_file(source).read_all()
+        df = table.drop_columns(["comments"]).to_pandas()
+        df["comments"] = [
+            [Comment(**c) for c in thread] for thread in table["comments"].to_pylist()
+        ]
+    revision = (table.schema.metadata or {}).get(b"dataset_revision")
+    if revision is not None:
+        df.attrs["dataset_revision"] = revision.decode()
+    return df
+
+
+def _write_snapshot(df: pd.DataFrame, path: str, revision: str):
+    """Atomically write a prepared frame as an uncompressed Arrow IPC file."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    df = df.assign(comments=[[c.to_dict() for c in thread] for thread in df["comments"]])
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    table = table.replace_schema_metadata({**table.schema.metadata, b"dataset_revision": revision.encode()})
+    tmp_path = f"{path}.tmp"
+    with pa.OSFile(tmp_path, "wb") as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    os.replace(tmp_path, path)
+
+
+def _project(ds, columns: tuple[str, ...]) -> pa.Table:
+    """Return the dataset's memory-mapped Arrow table restricted to the given columns."""
+    present = [c for c in columns if c in ds.column_names]
+    return ds.select_columns(present).with_format("arrow")[:]
+
+
+def _top_post_indices(posts: pa.Table, n: int) -> pa.Array:
+    """Row indices of the top N posts by score, preferring posts with comments."""
+    order = pc.sort_indices(posts, sort_keys=[("score", "descending")])
+    counts = pc.take(posts["comment_count"], order).combine_chunks()
+
+    has_comments = pc.filter(order, pc.greater(counts, 0))
     if len(has_comments) >= n:
-        result = has_comments.head(n)
-    else:
-        result = pd.concat([has_comments, no_comments.head(n - len(has_comments))])
+        return has_comments[:n]
+    no_comments = pc.filter(order, pc.equal(counts, 0))
+    return pa.concat_arrays([has_comments, no_comments[:n - len(has_comments)]])
 
-    # 5. For each post, build nested comment tree and serialize to JSON
-    result = result.copy()
-    result["comments_json"] = ""
 
-    for idx, row in result.iterrows():
-        post_id = row["id"]
-        post_comments = comments_df[comments_df["post_id"] == post_id]
-        comment_tree = _build_comment_tree(post_comments)
-        result.at[idx, "comments_json"] = json.dumps(comment_tree)
+def _prepare_top_posts(n: int, revision: str) -> pd.DataFrame:
+    """Build the top-N frame (with flattened comment threads) from the HF dataset.
 
-    # 6. Add compatibility field: comments_count_actual = comment_count
+    Stays on the memory-mapped Arrow tables from the HF cache: only the
+    projected columns are read, the top-N post ids are chosen before the
+    comments are touched, and only those posts' comment rows are converted
+    to pandas.
+    """
+    # 1. Load both subsets (memory-mapped) and project the columns we use
+    revision = revision if revision != "unknown" else None
+    posts_ds = load_dataset(DATASET_NAME, POSTS_SUBSET, split="train", revision=revision)
+    comments_ds = load_dataset(DATASET_NAME, COMMENTS_SUBSET, split="train", revision=revision)
+    posts = _project(posts_ds, POST_COLUMNS)
+    comments = _project(comments_ds, COMMENT_COLUMNS)
+
+    # 2. Select top N posts by score (prefer posts with comments)
+    top_posts = posts.take(_top_post_indices(posts, n))
+    top_ids = top_posts["id"].combine_chunks()
+
+    # 3. Pull only the comment rows belonging to the selected posts
+    comments = comments.filter(pc.is_in(comments["post_id"], value_set=top_ids))
+    comments_df = comments.to_pandas()
+
+    # 4. Flatten each post's comment tree into depth-annotated DFS records
+    result = top_posts.to_pandas()
+    threads = _build_comment_threads(comments_df, result["id"].tolist())
+    result["comments"] = [threads[post_id] for post_id in result["id"]]
+
+    # 5. Add compatibility field: comments_count_actual = comment_count
     result["comments_count_actual"] = result["comment_count"]
 
-    # 7. Rename score to upvotes for compatibility
+    # 6. Rename score to upvotes for compatibility
     if "score" in result.columns and "upvotes" not in result.columns:
         result["upvotes"] = result["score"]
 
-    return result.reset_index(drop=True)
+    return result
+
+
+def load_top_posts(n: int = TOP_POSTS_COUNT, refresh_snapshot: bool = False) -> pd.DataFrame:
+    """Load the Moltbook dataset and return the top N most-upvoted posts with comments.
+
+    The prepared frame is snapshotted under SNAPSHOT_DIR, keyed on the dataset
+    revision, N and LOADER_VERSION; warm starts read it back without touching
+    the HF dataset. When the revision can't be resolved (offline), the newest
+    snapshot for N and LOADER_VERSION is used. ``df.attrs`` records the
+    dataset revision, snapshot state and load time.
+    """
+    start = time.perf_counter()
+    revision = _dataset_revision()
+    path = _snapshot_path(revision, n) if revision is not None else _latest_snapshot(n)
+
+    result = None
+    if not refresh_snapshot and path is not None and os.path.exists(path):
+        try:
+            result = _read_snapshot(path)
+        except (OSError, pa.ArrowInvalid):
+            result = None
+
+    snapshot = "warm"
+    if result is None:
+        snapshot = "cold"
+        revision = revision or DATASET_REVISION or "unknown"
+        result = _prepare_top_posts(n, revision)
+        _write_snapshot(result, _snapshot_path(revision, n), revision)
+
+    result.attrs["dataset_revision"] = result.attrs.get("dataset_revision", revision or "unknown")
+    result.attrs["snapshot"] = snapshot
+    result.attrs["load_seconds"] = time.perf_counter() - start
+    return result
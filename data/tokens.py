@@ -0,0 +1,12 @@
+def estimate_tokens(text: str) -> int:
+    """Cheap local token estimate for budgeting, without a tokenizer.
+
+    Assumes ~4 characters per token for ASCII text and ~1 token per
+    non-ASCII character (CJK, emoji), which Moltbook threads mix freely.
+    """
+    if not text:
+        return 0
+    n_chars = len(text)
+    # Multi-byte UTF-8 characters add 1-3 extra bytes each; ~2 on average
+    non_ascii = (len(text.encode("utf-8")) - n_chars + 1) // 2
+    return max(1, (n_chars - non_ascii) // 4 + non_ascii)
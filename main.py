@@ -4,52 +4,94 @@ import json
 import os
 import sys
 from typing import Optional
-
 from tqdm import tqdm
 
 from config import (
     GCP_PROJECT,
+    GEMINI_MODEL,
+    TRIAGE_MEDIUM_MODEL,
+    LLM_BACKEND,
+    CONCURRENCY_LIMIT,
     TOP_POSTS_COUNT,
     DRY_RUN_COUNT,
     OUTPUT_DIR,
     RAW_RESULTS_PATH,
     REPORT_PATH,
+    CHECKPOINT_PATH,
+    INFLUENCE_STATE_PATH,
+    BATCH_DIR,
+    FAKE_RATE_LIMIT_RATE,
+    FAKE_SEED,
 )
 from data.loader import load_top_posts
-from data.comment_parser import parse_comments, format_thread_for_llm
-from analysis.consensus_detector import analyze_post
+from data.comment_parser import get_post_comments, thread_fingerprint
+from analysis.consensus_detector import (
+    analyze_post,
+    analyze_post_delta,
+    analyze_posts_batch,
+    delta_comments,
+    estimate_post_cost,
+    is_small_thread,
+    pack_small_threads,
+)
+from analysis.triage import TRIVIAL, MEDIUM, COMPLEX, thread_features, triage, triage_result, triage_agreement
 from analysis.pattern_classifier import classify_patterns
-from analysis.agent_influence import analyze_agent_influence
+from analysis.agent_influence import InfluenceAggregator
+from analysis.llm_cache import get_cache
+from analysis.rate_limiter import get_rate_limiter
+from analysis import llm, structured
+from analysis.checkpoint import CheckpointStore
+from analysis.progress import ProgressiveReport
+from analysis.pipeline import run_pipeline
+from analysis.batch_job import BatchRequests, ingest_predictions, simulate_predictions
 from report.generator import generate_report
 
 
-def load_cached_results() -> Optional[dict[str, dict]]:
-    """Load previously saved raw results keyed by post title."""
-    if not os.path.exists(RAW_RESULTS_PATH):
-        return None
-    try:
-        with open(RAW_RESULTS_PATH) as f:
-            results_list = json.load(f)
-        return {r["post_title"]: r for r in results_list}
-    except (json.JSONDecodeError, KeyError):
-        return None
-
-
 def save_raw_results(results: list[dict]):
     os.makedirs(OUTPUT_DIR, exist_ok=True)
     with open(RAW_RESULTS_PATH, "w") as f:
         json.dump(results, f, indent=2, default=str)
 
 
-async def run(dry_run: bool = False):
-    if not GCP_PROJECT:
+def export_raw_results() -> int:
+    """Write raw_results.json from the checkpoint log without running any analysis."""
+    results = CheckpointStore(CHECKPOINT_PATH).results()
+    save_raw_results(results)
+    return len(results)
+
+
+async def run(
+    dry_run: bool = False,
+    refresh_snapshot: bool = False,
+    seed_paths: tuple[str, ...] = (),
+    batch: bool = False,
+    ingest_paths: Optional[list[str]] = None,
+    use_triage: bool = True,
+    stop_when_stable: bool = False,
+):
+    """Run the analysis.
+
+    With ``batch``, Pass 1 makes no live LLM calls: posts whose responses
+    are all cached are completed, every missing request is written to the
+    next stage's batch files, and the run stops after saving raw results.
+    ``ingest_paths`` (an empty list meaning every predictions file in
+    BATCH_DIR) are loaded into the response cache first. With
+    ``use_triage``, trivial threads are resolved locally and medium ones
+    go to TRIAGE_MEDIUM_MODEL. Outside batch mode the report is rewritten
+    from the results so far while Pass 1 runs; with ``stop_when_stable``,
+    no further posts are started once its headline metrics have settled.
+    """
+    if not batch and LLM_BACKEND == "gemini" and not GCP_PROJECT:
         print("ERROR: GOOGLE_CLOUD_PROJECT not set. Set it in .env or run: export GOOGLE_CLOUD_PROJECT=your-project-id")
         sys.exit(1)
 
     n = DRY_RUN_COUNT if dry_run else TOP_POSTS_COUNT
     print(f"{'[DRY RUN] ' if dry_run else ''}Loading top {n} posts...")
-    df = load_top_posts(n)
-    print(f"Loaded {len(df)} posts.")
+    df = load_top_posts(n, refresh_snapshot=refresh_snapshot)
+    print(
+        f"Loaded {len(df)} posts in {df.attrs['load_seconds']:.2f}s "
+        f"({df.attrs['snapshot']} start, dataset revision {df.attrs['dataset_revision'][:12]})."
+    )
 
     # Dataset stats
     dataset_stats = {
@@ -61,27 +103,82 @@ async def run(dry_run: bool = False):
         "max_upvotes": int(df["upvotes"].max()),
     }
 
-    # Load cached results
-    cached = load_cached_results()
-    if cached:
-        print(f"Found {len(cached)} cached results.")
+    # Load checkpointed results, seeding from any legacy raw_results.json files
+    store = CheckpointStore(CHECKPOINT_PATH)
+    post_ids = [str(pid) for pid in df["id"]]
+    title_to_ids: dict[str, list[str]] = {}
+    for pid, title in zip(post_ids, df["title"]):
+        title_to_ids.setdefault(title, []).append(pid)
+    for path in (RAW_RESULTS_PATH, *seed_paths):
+        seeded = store.seed_from_raw_results(path, title_to_ids)
+        if seeded:
+            print(f"Seeded {seeded} results from {path}.")
+    done = sum(pid in store for pid in post_ids)
+    if done:
+        print(f"Found {done} checkpointed results.")
 
-    # Pass 1: Per-post analysis
+    if ingest_paths is not None:
+        ingested = ingest_predictions(BATCH_DIR, ingest_paths)
+        print(
+            f"Ingested {ingested['ingested']} batch responses "
+            f"({ingested['failed']} failed, {ingested['unknown'] + ingested['unreadable']} unmatched)."
+        )
+    batch_requests = BatchRequests()
+    if batch:
+        llm.record_misses(batch_requests)
+
+    # Triage: cheap local features decide which threads need the LLM, and which model
+    decisions = None
+    if use_triage:
+        decisions = triage(thread_features(df))
+        tiers = decisions["tier"][df["comments_count_actual"].to_numpy() > 0].value_counts()
+        print(
+            f"Triage: {tiers.get(TRIVIAL, 0)} trivial threads, {tiers.get(MEDIUM, 0)} medium "
+            f"({TRIAGE_MEDIUM_MODEL}), {tiers.get(COMPLEX, 0)} complex ({GEMINI_MODEL})."
+        )
+
+    # Pass 1: Per-post analysis, streamed through a fixed pool of workers
     print("\n--- Pass 1: Per-post consensus analysis ---")
-    results = []
-    tasks = []
+    if batch:
+        print("Completing posts from cached batch responses and collecting missing requests...")
+    else:
+        print(f"Analyzing posts via the {LLM_BACKEND} backend...")
+    pbar = tqdm(total=len(post_ids), desc="Analyzing posts")
+    counts = {
+        "analyzed": 0, "pending": 0, "deltas": 0, "full_refreshes": 0, "batched": 0, "batches": 0,
+        "triaged": 0, "calls_avoided": 0, "tokens_avoided": 0, "skipped": 0,
+    }
+    failures = []
+    compactions = []  # (tokens saved, tokens before, post title) of compacted threads
 
-    for _, row in df.iterrows():
+    # Plan the posts that need the LLM, then start the most expensive first
+    plan = []  # (estimated cost, position in df, delta, model)
+    for position, (post_id, (_, row)) in enumerate(zip(post_ids, df.iterrows())):
         title = row.get("title", "Untitled")
+        comments = get_post_comments(row)
+        decision = decisions.iloc[position] if decisions is not None else None
+        model = decision.model if decision is not None else GEMINI_MODEL
 
-        # Use cached result if available
-        if cached and title in cached:
-            results.append(cached[title])
-            continue
-
-        comments = parse_comments(row.get("comments_json", ""))
-        if not comments:
-            results.append({
+        # Use checkpointed result if available, updating it if the thread has grown
+        delta = None
+        previous = store.get(post_id)
+        if previous is not None:
+            new_comments = delta_comments(previous, comments)
+            if new_comments == []:
+                pbar.update(1)
+                continue
+            if decision is not None and decision.tier == TRIVIAL:
+                new_comments = None
+            elif "triage" in previous:
+                new_comments = None  # Outgrew triage: needs a full LLM analysis
+            if new_comments is not None:
+                delta = (previous, new_comments)
+                counts["deltas"] += 1
+            else:
+                counts["full_refreshes"] += 1
+        elif not comments:
+            store.append(post_id, {
+                "post_id": post_id,
                 "post_title": title,
                 "post_upvotes": row.get("upvotes", 0),
                 "comment_count": 0,
@@ -91,29 +188,147 @@ async def run(dry_run: bool = False):
                 "key_moments": [],
                 "consensus_drivers": [],
                 "evidence_quotes": [],
+                "thread_fingerprint": thread_fingerprint([]),
             })
+            pbar.update(1)
             continue
 
-        tasks.append((row.to_dict(), comments))
+        cost = estimate_post_cost(delta[1] if delta is not None else comments)
+        if decision is not None and decision.tier == TRIVIAL:
+            store.append(post_id, triage_result(row.to_dict(), comments, decision))
+            counts["triaged"] += 1
+            counts["calls_avoided"] += cost.calls
+            counts["tokens_avoided"] += cost.tokens
+            pbar.update(1)
+            continue
+        plan.append((cost, position, delta, model))
+    plan.sort(key=lambda p: p[0], reverse=True)
+
+    # Coalesce small fresh threads into multi-post requests per model, after the larger posts
+    units = [[p] for p in plan if p[2] is not None or not is_small_thread(p[0])]
+    for batch_model in dict.fromkeys(p[3] for p in plan):
+        small = [p for p in plan if p[3] == batch_model and p[2] is None and is_small_thread(p[0])]
+        units += [[small[i] for i in group] for group in pack_small_threads([p[0] for p in small])]
+    counts["batched"] = sum(len(unit) for unit in units if len(unit) > 1)
+    counts["batches"] = sum(len(unit) > 1 for unit in units)
+
+    progress = None
+    if not batch:
+        progress = ProgressiveReport(
+            {pid: store.get(pid) for pid in post_ids if pid in store}, len(post_ids), dataset_stats
+        )
+
+    def pending_units():
+        """Yield lists of (post_id, post, comments, delta, model) lazily, most expensive first."""
+        for started, unit in enumerate(units):
+            if stop_when_stable and progress is not None and progress.stable:
+                counts["skipped"] = sum(len(u) for u in units[started:])
+                return
+            tasks = []
+            for _, position, delta, model in unit:
+                row = df.iloc[position]
+                tasks.append((post_ids[position], row.to_dict(), get_post_comments(row), delta, model))
+            yield tasks
 
-    if tasks:
-        print(f"Analyzing {len(tasks)} posts via Gemini...")
-        pbar = tqdm(total=len(tasks), desc="Analyzing posts")
+    async def analyze(tasks) -> list:
+        try:
+            if len(tasks) > 1:
+                return await analyze_posts_batch(
+                    [(post, comments) for _, post, comments, _, _ in tasks], tasks[0][4]
+                )
+            _, post, comments, delta, model = tasks[0]
+            if delta is not None:
+                return [await analyze_post_delta(post, comments, *delta, model)]
+            return [await analyze_post(post, comments, model)]
+        except Exception as e:
+            return [e] * len(tasks)
 
-        async def analyze_with_progress(post, comments):
-            result = await analyze_post(post, comments)
+    def record(tasks, results: list):
+        for (post_id, *_), result in zip(tasks, results):
+            if isinstance(result, llm.ResponsePending):
+                counts["pending"] += 1
+            elif isinstance(result, Exception):
+                failures.append(post_id)
+                tqdm.write(f"Failed to analyze post {post_id}: {result}")
+            else:
+                store.append(post_id, result)
+                counts["analyzed"] += 1
+                if progress is not None:
+                    progress.add(post_id, result)
+                if "compaction" in result:
+                    before, after = result["compaction"]["tokens_before"], result["compaction"]["tokens_after"]
+                    compactions.append((before - after, before, result["post_title"]))
             pbar.update(1)
-            return result
+        pbar.set_postfix_str(get_rate_limiter().status(), refresh=False)
 
-        api_results = await asyncio.gather(
-            *[analyze_with_progress(post, comments) for post, comments in tasks]
+    await run_pipeline(pending_units(), analyze, record, workers=CONCURRENCY_LIMIT)
+    pbar.close()
+
+    print(f"Analyzed {counts['analyzed']} posts.")
+    if counts["triaged"]:
+        print(
+            f"{counts['triaged']} trivial threads were resolved by triage, avoiding "
+            f"{counts['calls_avoided']} LLM calls (~{counts['tokens_avoided']} prompt tokens)."
+        )
+    if compactions:
+        saved = sum(c[0] for c in compactions)
+        print(
+            f"Compaction trimmed {len(compactions)} threads by ~{saved} prompt tokens "
+            f"({saved / sum(c[1] for c in compactions):.0%} of their thread tokens); most saved:"
+        )
+        for tokens, before, title in sorted(compactions, reverse=True)[:3]:
+            print(f"  {tokens} of {before} tokens: {title[:60]}")
+    if counts["batches"]:
+        print(f"{counts['batched']} small threads were sent in {counts['batches']} multi-post requests.")
+    if counts["deltas"] or counts["full_refreshes"]:
+        print(
+            f"{counts['deltas'] + counts['full_refreshes']} checkpointed threads had changed: "
+            f"{counts['deltas']} updated from their new comments, "
+            f"{counts['full_refreshes']} re-analyzed in full."
+        )
+    if failures:
+        print(f"{len(failures)} posts failed and will be retried on the next run.")
+    if counts["skipped"]:
+        print(
+            f"Stopped early: the metrics were stable for {progress.stable_reports} progress reports; "
+            f"{counts['skipped']} posts were left for a later run."
         )
-        pbar.close()
-        results.extend(api_results)
 
     # Save intermediate results
+    results = store.results(post_ids)
     save_raw_results(results)
     print(f"Saved {len(results)} results to {RAW_RESULTS_PATH}")
+    if decisions is not None:
+        agreement = triage_agreement(decisions, [store.get(pid) for pid in post_ids])
+        dataset_stats["triage"] = {
+            "tiers": {tier: int(n) for tier, n in tiers.items()},
+            "calls_avoided": counts["calls_avoided"],
+            "agreement": {tier: dict(c) for tier, c in agreement.items()},
+        }
+        compared = {tier: c for tier, c in agreement.items() if c["compared"]}
+        if compared:
+            print("Triage verdicts vs. LLM results: " + ", ".join(
+                f"{tier} {c['agreed']}/{c['compared']} ({c['agreed'] / c['compared']:.0%})"
+                for tier, c in compared.items()
+            ) + " agree.")
+    parse_failures = sum(r.get("formation_pattern") == "Failed to parse LLM response" for r in results)
+    if parse_failures:
+        print(f"{parse_failures} posts have unparseable LLM responses.")
+
+    if batch:
+        llm.record_misses(None)
+        paths = batch_requests.write(BATCH_DIR)
+        if paths:
+            print(f"\n{counts['pending']} posts are waiting on {len(batch_requests)} batch requests:")
+            for path in paths:
+                print(f"  {path}")
+            print(
+                f"Submit them as Vertex AI batch prediction jobs, save the output as "
+                f"{BATCH_DIR}/predictions-*.jsonl and run --batch-ingest."
+            )
+        else:
+            print("\nPass 1 is complete; run without batch flags for Pass 2, Pass 3 and the report.")
+        return
 
     # Pass 2: Pattern clustering
     print("\n--- Pass 2: Pattern clustering ---")
@@ -122,24 +337,106 @@ async def run(dry_run: bool = False):
 
     # Pass 3: Agent influence analysis
     print("\n--- Pass 3: Agent influence analysis ---")
-    influence_data = analyze_agent_influence(results)
+    # Rebuilt in dataset order (rather than reusing the progress aggregator) so ties rank the same every run
+    influence = InfluenceAggregator()
+    for r in results:
+        influence.add(r)
+    influence.save(INFLUENCE_STATE_PATH)
+    influence_data = influence.summary()
     print(f"Found {influence_data['unique_drivers']} unique consensus-driving agents.")
     top3 = influence_data.get("concentration", {}).get("top_3", {})
     if top3:
         print(f"Top 3 agents account for {top3['share']:.1%} of consensus events.")
+    gini_ci = influence_data["inequality"].get("gini_ci")
+    if gini_ci:
+        print(
+            f"Gini coefficient of driver events: {influence_data['inequality']['gini']:.3f} "
+            f"(95% CI {gini_ci[0]:.3f} – {gini_ci[1]:.3f})."
+        )
 
     # Generate report
     print("\n--- Generating report ---")
     report = generate_report(results, pattern_data, influence_data, dataset_stats)
     print(f"Report written to {REPORT_PATH}")
+    print(get_cache().summary())
+    print(llm.get_backend().summary())
+    print(structured.summary())
+    limiter = get_rate_limiter()
+    print(
+        f"Rate limiter: {limiter.stats['calls']} calls, ~{limiter.stats['tokens']} prompt tokens, "
+        f"{limiter.stats['rate_limited']} rate-limited responses."
+    )
     print(f"\nDone! Analyzed {len(results)} posts.")
 
 
 def main():
     parser = argparse.ArgumentParser(description="Moltbook Consensus Analysis")
     parser.add_argument("--dry-run", action="store_true", help=f"Test on {DRY_RUN_COUNT} posts only")
+    parser.add_argument(
+        "--refresh-snapshot", action="store_true", help="Rebuild the cached top-N dataset snapshot"
+    )
+    parser.add_argument(
+        "--seed-results", action="append", default=[], metavar="PATH",
+        help="Import a previous raw_results.json into the checkpoint log (repeatable)",
+    )
+    parser.add_argument(
+        "--export-raw", action="store_true",
+        help=f"Write {RAW_RESULTS_PATH} from the checkpoint log and exit",
+    )
+    parser.add_argument(
+        "--batch-export", action="store_true",
+        help=f"Write Pass 1 requests without cached responses to {BATCH_DIR} as batch prediction JSONL",
+    )
+    parser.add_argument(
+        "--batch-ingest", nargs="*", metavar="PATH",
+        help="Load batch prediction responses (default: every predictions*.jsonl in the batch "
+             "directory), complete the posts they answer and export the next stage's requests",
+    )
+    parser.add_argument(
+        "--batch-simulate", action="store_true",
+        help="Answer pending batch request files locally with the fake backend (LLM_BACKEND=fake only)",
+    )
+    parser.add_argument(
+        "--stop-when-stable", action="store_true",
+        help="End Pass 1 early once consensus and top-driver shares stop changing between progress reports",
+    )
+    parser.add_argument(
+        "--no-triage", action="store_true",
+        help="Send every thread with comments to GEMINI_MODEL instead of triaging them first",
+    )
     args = parser.parse_args()
-    asyncio.run(run(dry_run=args.dry_run))
+    if args.stop_when_stable and (args.batch_export or args.batch_ingest is not None):
+        print("ERROR: --stop-when-stable needs progress reports, which batch mode does not write")
+        sys.exit(1)
+    if args.export_raw:
+        count = export_raw_results()
+        print(f"Exported {count} results to {RAW_RESULTS_PATH}")
+        return
+    if args.batch_simulate:
+        if LLM_BACKEND != "fake":
+            print("ERROR: --batch-simulate only runs with LLM_BACKEND=fake")
+            sys.exit(1)
+        paths = asyncio.run(simulate_predictions(
+            BATCH_DIR, llm.get_backend(), failure_rate=FAKE_RATE_LIMIT_RATE, seed=FAKE_SEED,
+        ))
+        print(f"Wrote {len(paths)} simulated prediction files to {BATCH_DIR}.")
+        return
+
+    async def run_and_close():
+        try:
+            await run(
+                dry_run=args.dry_run,
+                refresh_snapshot=args.refresh_snapshot,
+                seed_paths=tuple(args.seed_results),
+                batch=args.batch_export or args.batch_ingest is not None,
+                ingest_paths=args.batch_ingest,
+                use_triage=not args.no_triage,
+                stop_when_stable=args.stop_when_stable,
+            )
+        finally:
+            await llm.aclose()
+
+    asyncio.run(run_and_close())
 
 
 if __name__ == "__main__":
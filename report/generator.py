@@ -1,5 +1,27 @@
 import os
-from config import REPORT_PATH
+from config import REPORT_PATH, GEMINI_MODEL, PATTERN_CLUSTERS, PATTERN_SHARD_SIZE, TRIAGE_MEDIUM_MODEL
+
+# How Pass 2 clustered the posts, by pattern_data["method"]
+PASS_2_METHODS = {
+    "local": (
+        f"Embedded each post's formation pattern and consensus position as hashed TF-IDF vectors, "
+        f"grouped them locally with k-means into {PATTERN_CLUSTERS} clusters and asked Gemini only "
+        f"to name each cluster from its most central posts."
+    ),
+    "llm": (
+        "Sent all per-post summaries to Gemini in one call for pattern clustering, "
+        "identifying 3-5 recurring consensus formation patterns."
+    ),
+    "sharded": (
+        f"Had Gemini propose candidate patterns for shards of {PATTERN_SHARD_SIZE} per-post summaries, "
+        "merged them into one taxonomy of 3-5 recurring consensus formation patterns, "
+        "and assigned every post to it in batches."
+    ),
+    "provisional": (
+        "Grouped the posts analyzed so far locally with k-means over their formation patterns; "
+        "the clusters are provisional and unnamed until Pass 1 finishes."
+    ),
+}
 
 
 def generate_report(
@@ -13,6 +35,12 @@ def generate_report(
 
     # Header
     lines.append("# Moltbook Consensus Pattern Analysis\n")
+    progress = dataset_stats.get("progress")
+    if progress:
+        lines.append(
+            f"> **Partial report:** {progress['analyzed']} of {progress['total']} posts analyzed so far. "
+            f"Patterns are provisional local clusters, named in the final report.\n"
+        )
 
     # Dataset section
     lines.append("## Dataset\n")
@@ -21,6 +49,19 @@ def generate_report(
     lines.append(f"- **Total comments across posts:** {dataset_stats.get('total_comments', '?')}")
     lines.append(f"- **Average comments per post:** {dataset_stats.get('avg_comments', '?'):.1f}")
     lines.append(f"- **Upvote range:** {dataset_stats.get('min_upvotes', '?')} – {dataset_stats.get('max_upvotes', '?')}")
+    triage = dataset_stats.get("triage")
+    if triage:
+        tiers = triage["tiers"]
+        lines.append(
+            f"- **Triage:** {tiers.get('trivial', 0)} trivial threads resolved without the LLM, "
+            f"{tiers.get('medium', 0)} medium and {tiers.get('complex', 0)} complex threads analyzed"
+        )
+        compared = {t: c for t, c in triage["agreement"].items() if c.get("compared")}
+        if compared:
+            agreement = ", ".join(
+                f"{t} {c['agreed'] / c['compared']:.0%} of {c['compared']}" for t, c in compared.items()
+            )
+            lines.append(f"- **Triage agreement with LLM verdicts:** {agreement}")
     lines.append("")
 
     # Consensus overview
@@ -66,6 +107,12 @@ def generate_report(
                             break
                 lines.append("")
         lines.append("")
+    triaged_posts = pattern_data.get("triaged", 0)
+    if triaged_posts:
+        lines.append(
+            f"{triaged_posts} posts resolved by local triage are not clustered: they have no "
+            f"LLM analysis, only a lexicon verdict.\n"
+        )
 
     # Agent influence analysis
     lines.append("## Agent Influence Analysis\n")
@@ -81,6 +128,9 @@ def generate_report(
     baseline = influence_data.get("uniform_baseline", 0)
 
     lines.append(f"- **Posts with consensus (YES or PARTIAL):** {consensus_posts}")
+    triaged = influence_data.get("triaged_consensus_posts", 0)
+    if triaged:
+        lines.append(f"- **Consensus posts resolved by triage (no driver data, not counted above):** {triaged}")
     lines.append(f"- **Total consensus-driving events:** {total_events}")
     lines.append(f"- **Unique consensus-driving agents:** {unique_drivers}")
     lines.append(f"- **Uniform baseline (expected events per agent):** {baseline:.2f}")
@@ -103,18 +153,43 @@ def generate_report(
     concentration = influence_data.get("concentration", {})
     if concentration:
         lines.append("### Concentration Analysis\n")
-        lines.append("| Group | Agents | Consensus Events | Share |")
-        lines.append("|-------|--------|-----------------|-------|")
+        lines.append("| Group | Agents | Consensus Events | Share | 95% CI |")
+        lines.append("|-------|--------|-----------------|-------|--------|")
         for key in ("top_1", "top_3", "top_5", "top_10"):
             if key in concentration:
                 c = concentration[key]
                 n = key.replace("top_", "Top ")
+                ci = f"{c['ci'][0]:.1%} – {c['ci'][1]:.1%}" if "ci" in c else "–"
                 lines.append(
                     f"| {n} | {', '.join(c['agents'][:3])}{'...' if len(c['agents']) > 3 else ''} "
-                    f"| {c['consensus_events']} | {c['share']:.1%} |"
+                    f"| {c['consensus_events']} | {c['share']:.1%} | {ci} |"
                 )
         lines.append("")
 
+        inequality = influence_data.get("inequality", {})
+        if inequality.get("lorenz"):
+            def with_ci(key: str, value: float) -> str:
+                ci = inequality.get(f"{key}_ci")
+                return f"{value:.3f} (95% CI {ci[0]:.3f} – {ci[1]:.3f})" if ci else f"{value:.3f}"
+
+            hhi = inequality["hhi"]
+            lines.append(f"- **Gini coefficient of driver events:** {with_ci('gini', inequality['gini'])}")
+            lines.append(
+                f"- **Herfindahl-Hirschman index:** {with_ci('hhi', hhi)}, "
+                f"equivalent to {1 / hhi:.1f} equally active agents" if hhi else "- **Herfindahl-Hirschman index:** 0"
+            )
+            if inequality.get("bootstrap_samples"):
+                lines.append(
+                    f"- Confidence intervals are bias-corrected percentile bootstraps over "
+                    f"{inequality['bootstrap_samples']} resamples of the consensus posts."
+                )
+            lines.append("")
+            lines.append("| Least active agents | Share of consensus events |")
+            lines.append("|---------------------|---------------------------|")
+            for agent_share, event_share in inequality["lorenz"][1:-1]:
+                lines.append(f"| {agent_share:.0%} | {event_share:.1%} |")
+            lines.append("")
+
         # Interpretation
         top5 = concentration.get("top_5", {})
         if top5.get("share", 0) > 0.3:
@@ -162,18 +237,31 @@ def generate_report(
 
     # Methodology
     lines.append("## Methodology\n")
+    pass_1 = (
+        f"Used {GEMINI_MODEL} to analyze each post's comment thread for consensus (YES/NO/PARTIAL), "
+        "formation patterns, key moments, and consensus-driving agents."
+    )
+    if triage:
+        pass_1 = (
+            "Triaged every thread from local features. Trivial threads got a lexicon verdict without "
+            f"an LLM call, short and shallow ones were analyzed by {TRIAGE_MEDIUM_MODEL} and the rest by "
+            f"{GEMINI_MODEL}, for consensus (YES/NO/PARTIAL), formation patterns, key moments, "
+            "and consensus-driving agents."
+        )
+    pass_2 = PASS_2_METHODS.get(pattern_data.get("method"), "No posts had LLM-analyzed comments to cluster.")
+    if triaged_posts:
+        pass_2 += f" The {triaged_posts} posts resolved by triage were left out."
     lines.append(
         "1. Loaded the top 100 most-upvoted posts from the Moltbook dataset "
         "(lysandrehooh/moltbook on HuggingFace).\n"
         "2. Reconstructed nested comment threads from the relational dataset structure "
         "(posts and comments linked via post_id, with parent_id relationships).\n"
-        "3. **Pass 1:** Used Gemini 2.5 Flash to analyze each post's comment thread for "
-        "consensus (YES/NO/PARTIAL), formation patterns, key moments, and consensus-driving agents.\n"
-        "4. **Pass 2:** Sent all per-post summaries to Gemini for pattern clustering, "
-        "identifying 3-5 recurring consensus formation patterns.\n"
+        f"3. **Pass 1:** {pass_1}\n"
+        f"4. **Pass 2:** {pass_2}\n"
         "5. **Pass 3:** Aggregated consensus-driver data across all posts to identify "
-        "disproportionately influential agents, compute concentration metrics, and "
-        "compare against a uniform distribution baseline.\n"
+        "disproportionately influential agents, compute concentration metrics (top-N share, "
+        "Gini, HHI and the Lorenz curve, with bootstrap confidence intervals from resampling posts), "
+        "and compare against a uniform distribution baseline.\n"
     )
 
     report = "\n".join(lines)
@@ -0,0 +1,71 @@
+from analysis.agent_influence import InfluenceAggregator, analyze_agent_influence
+
+
+def _result(title: str, agents: list[str], consensus: str = "YES", **extra) -> dict:
+    return {
+        "post_title": title,
+        "consensus": consensus,
+        "consensus_drivers": [{"agent": a, "role": "built_momentum"} for a in agents],
+        **extra,
+    }
+
+
+def test_results_without_post_ids_are_not_merged_by_title():
+    results = [_result("🦞🦞", ["a", "b"]), _result("🦞🦞", ["a"]), _result("🦞🦞", ["c"], "PARTIAL")]
+    data = analyze_agent_influence(results, bootstrap_samples=0)
+    assert data["total_consensus_posts"] == 3
+    assert data["total_driver_events"] == 4
+    assert data["agent_frequency"] == {"a": 2, "b": 1, "c": 1}
+    assert data["agent_profiles"]["a"]["posts"] == ["🦞🦞", "🦞🦞"]
+
+
+def test_add_without_post_id_never_replaces():
+    aggregator = InfluenceAggregator()
+    aggregator.add(_result("same", ["a"]))
+    aggregator.add(_result("same", ["a"]))
+    assert len(aggregator) == 2
+
+
+def test_same_post_id_replaces_and_remove_drops():
+    aggregator = InfluenceAggregator()
+    aggregator.add(_result("t", ["a"], post_id="1"))
+    aggregator.add(_result("t", ["b", "c"], post_id="1"))
+    assert aggregator.summary(0)["agent_frequency"] == {"b": 1, "c": 1}
+    aggregator.add(_result("t", ["b"], "NO", post_id="1"))
+    assert len(aggregator) == 0
+
+
+def test_merge_and_save_load_match_a_single_pass(tmp_path):
+    results = [_result(f"t{i % 3}", [f"agent_{i % 5}", f"agent_{i % 7}"], post_id=str(i)) for i in range(40)]
+    first, second = InfluenceAggregator(), InfluenceAggregator()
+    for r in results[:20]:
+        first.add(r)
+    for r in results[20:]:
+        second.add(r)
+    path = str(tmp_path / "state.npz")
+    first.merge(second).save(path)
+    expected = analyze_agent_influence(results, bootstrap_samples=0)
+    assert InfluenceAggregator.load(path).summary(0) == expected
+
+
+def test_triaged_posts_are_counted_apart_from_analyzed_ones(tmp_path):
+    aggregator = InfluenceAggregator()
+    aggregator.add(_result("A", ["alice", "bob"], post_id="1"))
+    aggregator.add(_result("B", [], post_id="2", triage="too few comments for a discussion"))
+    aggregator.add(_result("C", [], consensus="NO", post_id="3", triage="only one agent took part"))
+    summary = aggregator.summary(bootstrap_samples=0)
+    assert summary["total_consensus_posts"] == 1
+    assert summary["triaged_consensus_posts"] == 1
+    assert "2" in aggregator
+
+    # A later LLM analysis of the same post replaces its triage verdict
+    aggregator.add(_result("B", ["carol"], post_id="2"))
+    summary = aggregator.summary(bootstrap_samples=0)
+    assert (summary["total_consensus_posts"], summary["triaged_consensus_posts"]) == (2, 0)
+
+    other = InfluenceAggregator()
+    other.add(_result("A", [], post_id="1", triage="mostly duplicated comments"))
+    other.save(str(tmp_path / "state.npz"))
+    summary = aggregator.merge(InfluenceAggregator.load(str(tmp_path / "state.npz"))).summary(bootstrap_samples=0)
+    assert (summary["total_consensus_posts"], summary["triaged_consensus_posts"]) == (1, 1)
+    assert summary["agent_frequency"] == {"carol": 1}
@@ -0,0 +1,15 @@
+import os
+from analysis.batch_job import BatchRequests
+
+
+def _write_stage(batch_dir, models):
+    requests = BatchRequests()
+    for model in models:
+        requests(f"prompt for {model}", "per_post/1", model, model)
+    return [os.path.basename(p) for p in requests.write(str(batch_dir))]
+
+
+def test_stages_count_up_by_one_with_several_models(tmp_path):
+    assert _write_stage(tmp_path, ["flash", "pro"]) == ["requests-001-flash.jsonl", "requests-001-pro.jsonl"]
+    assert _write_stage(tmp_path, ["flash", "pro"]) == ["requests-002-flash.jsonl", "requests-002-pro.jsonl"]
+    assert _write_stage(tmp_path, ["pro"]) == ["requests-003-pro.jsonl"]
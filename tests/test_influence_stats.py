@@ -0,0 +1,39 @@
+import numpy as np
+import pytest
+
+from analysis.agent_influence import analyze_agent_influence
+from analysis.influence_stats import bootstrap_concentration, gini, hhi
+from benchmarks.synthetic import make_influence_results
+
+
+def _estimates(data: dict) -> list[tuple[str, float, tuple]]:
+    inequality = data["inequality"]
+    return [(key, c["share"], c["ci"]) for key, c in data["concentration"].items()] + [
+        ("gini", inequality["gini"], inequality["gini_ci"]),
+        ("hhi", inequality["hhi"], inequality["hhi_ci"]),
+    ]
+
+
+@pytest.mark.parametrize("alpha", [1.2, 0.0])  # Skewed, and flat (mostly single-post drivers)
+def test_intervals_contain_point_estimates(alpha):
+    data = analyze_agent_influence(make_influence_results(1_000, alpha=alpha), bootstrap_samples=500)
+    for name, value, (low, high) in _estimates(data):
+        assert low <= value <= high, name
+        assert low < high, name
+
+
+def test_one_resample_of_every_post_reproduces_the_estimates():
+    post_index = np.array([0, 0, 1, 2, 2, 2])
+    agents = np.array([0, 1, 0, 0, 2, 3])
+    counts = np.bincount(agents)
+    intervals = bootstrap_concentration(post_index, agents, 3, 4, (1,), samples=1)
+    # With a single resample the interval collapses onto the point estimate
+    assert intervals["gini"] == pytest.approx((gini(counts),) * 2)
+    assert intervals["hhi"] == pytest.approx((hhi(counts),) * 2)
+    assert intervals["top_1"] == pytest.approx((3 / 6,) * 2)
+
+
+def test_no_intervals_without_resamples():
+    data = analyze_agent_influence(make_influence_results(100), bootstrap_samples=0)
+    assert "ci" not in data["concentration"]["top_1"]
+    assert "gini_ci" not in data["inequality"]
@@ -0,0 +1,55 @@
+import pandas as pd
+import pytest
+from data import loader
+from data.comment_parser import Comment
+
+
+class _Info:
+    sha = "abc123"
+
+
+class _OnlineApi:
+    calls = 0
+
+    def dataset_info(self, *args, **kwargs):
+        _OnlineApi.calls += 1
+        return _Info()
+
+
+class _OfflineApi:
+    def dataset_info(self, *args, **kwargs):
+        raise OSError("offline")
+
+
+@pytest.fixture
+def snapshots(tmp_path, monkeypatch):
+    monkeypatch.setattr(loader, "SNAPSHOT_DIR", str(tmp_path))
+    built = []
+
+    def prepare(n, revision):
+        built.append(revision)
+        return pd.DataFrame({"id": ["p1"], "comments": [[Comment("alice", "hi", 0, None, 1, "c1")]]})
+
+    monkeypatch.setattr(loader, "_prepare_top_posts", prepare)
+    return built
+
+
+def test_offline_warm_start_reuses_snapshot_built_online(snapshots, monkeypatch):
+    monkeypatch.setattr(loader, "HfApi", _OnlineApi)
+    assert loader.load_top_posts(1).attrs["snapshot"] == "cold"
+
+    monkeypatch.setattr(loader, "HfApi", _OfflineApi)
+    monkeypatch.setattr(loader, "DATASET_REVISION_TTL_SECONDS", 0)
+    df = loader.load_top_posts(1)
+    assert df.attrs["snapshot"] == "warm"
+    assert df.attrs["dataset_revision"] == "abc123"
+    assert df["comments"][0][0].author == "alice"
+    assert snapshots == ["abc123"]
+
+
+def test_resolved_revision_is_reused_within_ttl(snapshots, monkeypatch):
+    monkeypatch.setattr(loader, "HfApi", _OnlineApi)
+    _OnlineApi.calls = 0
+    loader.load_top_posts(1)
+    assert loader.load_top_posts(1).attrs["snapshot"] == "warm"
+    assert _OnlineApi.calls == 1
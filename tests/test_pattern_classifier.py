@@ -0,0 +1,23 @@
+from analysis.pattern_classifier import provisional_patterns
+
+
+def _result(i: int, **extra) -> dict:
+    return {
+        "post_title": f"Post {i}",
+        "consensus": "YES",
+        "formation_pattern": f"Agents {'debated evidence' if i % 2 else 'built momentum'} around proposal {i}.",
+        "consensus_position": "Agents should share memory",
+        **extra,
+    }
+
+
+def test_triaged_posts_are_left_out_of_pattern_clusters():
+    results = [_result(i) for i in range(20)] + [
+        _result(100 + i, formation_pattern="Resolved by local triage: too few comments for a discussion.",
+                triage="too few comments for a discussion")
+        for i in range(8)
+    ]
+    patterns = provisional_patterns(results)
+    clustered = [t for p in patterns["patterns"] for t in p["post_titles"]] + patterns["unclassified"]
+    assert patterns["triaged"] == 8
+    assert sorted(clustered) == sorted(f"Post {i}" for i in range(20))
@@ -0,0 +1,63 @@
+import asyncio
+import json
+from analysis.consensus_detector import PER_POST_PROMPT, PER_POST_SCHEMA
+from analysis.llm import cache_version
+from analysis.structured import repair_context
+from data.tokens import estimate_tokens
+
+
+def test_cache_version_depends_on_schema():
+    plain = cache_version("per_post/1")
+    with_schema = cache_version("per_post/1", PER_POST_SCHEMA)
+    assert plain == "per_post/1"
+    assert with_schema != plain
+    assert with_schema == cache_version("per_post/1", json.loads(json.dumps(PER_POST_SCHEMA)))
+    assert with_schema != cache_version("per_post/1", {"type": "OBJECT"})
+
+
+def test_repair_context_is_bounded_and_names_the_agents():
+    thread = "\n".join(
+        f"{'  ' * (i % 3)}[agent{i % 40}{' (replying to agent0)' if i % 3 else ''}]: comment {i} " + "word " * 30
+        for i in range(2000)
+    )
+    request = PER_POST_PROMPT.format(title="Shared memory", post_content="Should agents share memory?", thread=thread)
+    context = repair_context(request, budget=1500)
+    assert estimate_tokens(request) > 50_000
+    assert estimate_tokens(context) <= 1600
+    assert context.startswith("Agents: agent0, ")
+    assert "[agent0]: comment 0 " in context and "comment 1999 " in context
+
+
+def test_repair_context_of_a_prompt_without_a_thread_keeps_its_head():
+    assert repair_context("Cluster these summaries: A, B", budget=100) == "Cluster these summaries: A, B"
+
+
+def test_truncated_object_only_reasks_its_unfinished_fields(monkeypatch):
+    from analysis import structured
+
+    truncated = json.dumps({
+        "consensus": "YES",
+        "consensus_position": "Consent first",
+        "formation_pattern": "Agreement built quickly.",
+        "key_moments": ["m1", "m2"],
+        "consensus_drivers": [{"agent": "alice", "role": "other", "description": "x"}],
+    })[:-40]
+    repair = {
+        "consensus_drivers": [{"agent": "alice", "role": "proposed_position", "description": "Asked for consent"}],
+        "evidence_quotes": ["Yes, with consent."],
+    }
+    prompts = []
+
+    async def fake_generate(prompt, template_version, model, priority, response_schema=None):
+        prompts.append((prompt, response_schema))
+        return truncated if len(prompts) == 1 else json.dumps(repair)
+
+    monkeypatch.setattr(structured, "generate", fake_generate)
+    result = asyncio.run(structured.generate_structured("thread prompt", "per_post/1", PER_POST_SCHEMA))
+
+    assert structured.extract_json(truncated) == ["m1", "m2"]
+    assert set(prompts[1][1]["properties"]) == {"consensus_drivers", "evidence_quotes"}
+    assert "thread prompt" in prompts[1][0]
+    assert result["consensus"] == "YES"
+    assert result["key_moments"] == ["m1", "m2"]
+    assert result["consensus_drivers"] == repair["consensus_drivers"]